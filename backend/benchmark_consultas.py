@@ -0,0 +1,126 @@
+"""
+Contagem de comandos SQL por endpoint de leitura.
+
+Cria duas bases SQLite temporárias, uma pequena e uma grande (mais mapas, quadros,
+passageiros e paradas), faz as mesmas requisições nas duas e compara quantos comandos
+SQL cada endpoint executou. Com os perfis de carregamento de crud.py o número não
+depende da quantidade de dados; se algum endpoint voltar a ter N+1 (ou um JOIN que
+cresce com os dados), a contagem diverge e o script termina com código 1.
+
+Uso: python benchmark_consultas.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+from datetime import time
+
+# A base (sqlite:///./logistica.db) é relativa ao diretório atual: usamos um temporário
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix="benchmark_consultas_"))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+import models
+from database import engine
+from database import engine_async
+from database import SessionLocal
+
+TAMANHOS = {"pequena": (1, 2, 3), "grande": (3, 6, 12)} # (mapas, quadros por mapa, passageiros por quadro)
+
+ENDPOINTS = [
+    "/api/motoristas/",
+    "/api/veiculos/",
+    "/api/passageiros/",
+    "/api/mapas_transporte/",
+    "/api/mapas_transporte/resumo/",
+    "/api/mapas_transporte/{mapa_id}",
+    "/api/quadros/",
+    "/api/quadros/resumo/",
+    "/api/quadros/{quadro_id}",
+    "/api/rotas/{rota_id}",
+    "/api/mapas_transporte/{mapa_id}/pdf",
+]
+
+_comandos = []
+
+
+def _contar(conn, cursor, statement, parameters, context, executemany):
+    _comandos.append(statement)
+
+
+# Os endpoints de leitura usam o engine assíncrono; os demais, o síncrono
+for _engine in (engine, engine_async.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _contar)
+
+
+def _endereco(db, i):
+    endereco = models.EnderecoDB(rua=f"Rua {i}", numero=str(i), bairro="Centro", cidade="Natal", estado="RN",
+                                 cep="59000-000", lat=-5.8 - i / 1000, lon=-35.2 - i / 1000)
+    db.add(endereco)
+    return endereco
+
+
+def _popular(num_mapas, quadros_por_mapa, passageiros_por_quadro):
+    """Recria a base com os dados do tamanho pedido e retorna os ids usados nas URLs."""
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    contador = 0
+    for m in range(num_mapas):
+        db_mapa = models.MapaTransporteDB(nome=f"Mapa {m}", data_inicio=datetime(2026, 1, 1, 6), regras="Regras")
+        db.add(db_mapa)
+        for q in range(quadros_por_mapa):
+            contador += 1
+            motorista = models.MotoristaDB(nome=f"Motorista {contador}", contato="84999999999")
+            veiculo = models.VeiculoDB(placa=f"ABC{contador:04d}", modelo="Van", cor="Branca", motorista=motorista)
+            db_quadro = models.QuadroDB(nome=f"Quadro {contador}", horario_saida=time(6), mapa_transporte=db_mapa,
+                                        origem=_endereco(db, 0), destino=_endereco(db, 1), veiculo=veiculo)
+            rota = models.RotaDB(id_rota_str=f"rota_{contador}", duracao_total_estimada=3600, distancia_total_estimada_km=30.0,
+                                 horario_chegada_estimado=datetime(2026, 1, 1, 7), google_maps_link="https://maps.google.com",
+                                 quadro=db_quadro, veiculo=veiculo)
+            for p in range(passageiros_por_quadro):
+                endereco = _endereco(db, contador * 100 + p)
+                passageiro = models.PassageiroDB(nome=f"Passageiro {contador}-{p}", contato="84999999999",
+                                                 funcao=models.Funcao.SOM, endereco=endereco)
+                db_quadro.passageiros.append(passageiro)
+                rota.paradas.append(models.ParadaDB(ordem=p + 1, horario_saida=time(6, p), passageiro=passageiro, endereco=endereco))
+            db.add(db_quadro)
+    db.commit()
+    ids = {
+        "mapa_id": db.query(models.MapaTransporteDB.id).order_by(models.MapaTransporteDB.id.desc()).first()[0],
+        "quadro_id": db.query(models.QuadroDB.id).order_by(models.QuadroDB.id.desc()).first()[0],
+        "rota_id": db.query(models.RotaDB.id).order_by(models.RotaDB.id.desc()).first()[0],
+    }
+    db.close()
+    return ids
+
+
+def _contar_comandos(client, url):
+    del _comandos[:]
+    resposta = client.get(url)
+    if resposta.status_code != 200:
+        raise RuntimeError(f"GET {url} respondeu {resposta.status_code}: {resposta.text[:200]}")
+    return len(_comandos)
+
+
+if __name__ == "__main__":
+    contagens = {}
+    with TestClient(main.app) as client:
+        for nome, tamanho in TAMANHOS.items():
+            ids = _popular(*tamanho)
+            contagens[nome] = {endpoint: _contar_comandos(client, endpoint.format(**ids)) for endpoint in ENDPOINTS}
+
+    divergentes = []
+    print(f"{'endpoint':<38} | {'base pequena':>12} | {'base grande':>11}")
+    for endpoint in ENDPOINTS:
+        pequena, grande = contagens["pequena"][endpoint], contagens["grande"][endpoint]
+        print(f"{endpoint:<38} | {pequena:>12} | {grande:>11}{'  <- cresce com os dados' if pequena != grande else ''}")
+        if pequena != grande:
+            divergentes.append(endpoint)
+    if divergentes:
+        print(f"\n{len(divergentes)} endpoint(s) com número de comandos dependente dos dados.")
+        sys.exit(1)
+    print("\nNúmero de comandos SQL constante em todos os endpoints.")
@@ -0,0 +1,124 @@
+"""
+Benchmark da construção das matrizes de custo contra um GraphHopper "de mentira" local.
+
+O servidor simulado responde ao /route e ao /matrix com tempos e distâncias sintéticos
+(linha reta a 30 km/h) e uma latência artificial por requisição, imitando a ida e volta
+de rede. Compara o caminho par a par (/route) com o caminho em lote (/matrix) e, para N
+grande, a matriz completa com a esparsa (MATRIZ_ESPARSA_MIN_LOCAIS): pares roteados, tempo
+de construção e o custo real (na matriz completa) da rota otimizada sobre cada uma.
+
+Uso: python benchmark_matriz.py [latencia_ms]
+"""
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import matriz
+from otimizador import custo_da_ordem
+from otimizador import resolver_rota_quadro
+
+LATENCIA_S = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.002
+VELOCIDADE_MS = 30 / 3.6
+
+
+def _distancia_metros(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h))
+
+
+class GraphHopperSimulado(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, corpo):
+        dados = json.dumps(corpo).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        time.sleep(LATENCIA_S)
+        pontos = parse_qs(urlparse(self.path).query)["point"]
+        a, b = [tuple(map(float, p.split(","))) for p in pontos]
+        distancia = _distancia_metros(a, b)
+        self._responder({"paths": [{"time": int(distancia / VELOCIDADE_MS * 1000), "distance": distancia}]})
+
+    def do_POST(self):
+        time.sleep(LATENCIA_S)
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        # Os pontos chegam como [lon, lat]
+        origens = [(lat, lon) for lon, lat in payload["from_points"]]
+        destinos = [(lat, lon) for lon, lat in payload["to_points"]]
+        distancias = [[_distancia_metros(o, d) for d in destinos] for o in origens]
+        tempos = [[round(d / VELOCIDADE_MS) for d in linha] for linha in distancias]
+        self._responder({"times": tempos, "distances": distancias})
+
+
+def _coordenadas_aleatorias(n):
+    random.seed(n)
+    return [(-5.8 - random.random() * 0.15, -35.2 - random.random() * 0.1) for _ in range(n)]
+
+
+def _medir(coordenadas, usar_matrix_api):
+    # Sem o cache de trechos, para medir sempre o roteamento completo
+    os.environ["CACHE_TRECHOS_ATIVO"] = "false"
+    os.environ["GRAPHHOPPER_MATRIX_API"] = "true" if usar_matrix_api else "false"
+    inicio = time.perf_counter()
+    matriz.construir_matrizes_de_custo(coordenadas)
+    return time.perf_counter() - inicio
+
+
+def _medir_esparsa(coordenadas, esparsa):
+    os.environ["CACHE_TRECHOS_ATIVO"] = "false"
+    os.environ["GRAPHHOPPER_MATRIX_API"] = "false"
+    os.environ["MATRIZ_ESPARSA_MIN_LOCAIS"] = "1" if esparsa else "0"
+    inicio = time.perf_counter()
+    resultado = matriz.construir_matrizes_de_custo_detalhado(coordenadas)
+    n = len(coordenadas)
+    return time.perf_counter() - inicio, n * (n - 1) - resultado["pares_estimados"], resultado
+
+
+if __name__ == "__main__":
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), GraphHopperSimulado)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    os.environ["GRAPHHOPPER_BASE_URL"] = f"http://127.0.0.1:{servidor.server_port}"
+
+    resultados = []
+    for n in (10, 25, 50):
+        coordenadas = _coordenadas_aleatorias(n)
+        tempo_route = _medir(coordenadas, usar_matrix_api=False)
+        tempo_matrix = _medir(coordenadas, usar_matrix_api=True)
+        resultados.append((n, tempo_route, tempo_matrix))
+
+    resultados_esparsa = []
+    for n in (100, 150):
+        coordenadas = _coordenadas_aleatorias(n)
+        tempo_completa, pares_completa, completa = _medir_esparsa(coordenadas, esparsa=False)
+        tempo_esparsa, pares_esparsa, esparsa = _medir_esparsa(coordenadas, esparsa=True)
+        custos = []
+        for resultado in (completa, esparsa):
+            solucao = resolver_rota_quadro(resultado["tempos"], resultado["distancias"])
+            ordem = [parada["indice_parada"] for parada in solucao["detalhes_paradas"]]
+            custos.append(custo_da_ordem(completa["tempos"], ordem))
+        resultados_esparsa.append((n, pares_completa, pares_esparsa, tempo_completa, tempo_esparsa, *custos))
+    servidor.shutdown()
+
+    print(f"\nLatência simulada por requisição: {LATENCIA_S * 1000:.1f} ms")
+    print(f"{'N':>4} | {'/route (s)':>11} | {'/matrix (s)':>11} | {'ganho':>7}")
+    for n, tempo_route, tempo_matrix in resultados:
+        print(f"{n:>4} | {tempo_route:>11.3f} | {tempo_matrix:>11.3f} | {tempo_route / tempo_matrix:>6.1f}x")
+
+    print(f"\n{'N':>4} | {'pares completa':>14} | {'pares esparsa':>13} | {'completa (s)':>12} | {'esparsa (s)':>11} | "
+          f"{'custo completa':>14} | {'custo esparsa':>13}")
+    for n, pares_completa, pares_esparsa, tempo_completa, tempo_esparsa, custo_completa, custo_esparsa in resultados_esparsa:
+        print(f"{n:>4} | {pares_completa:>14} | {pares_esparsa:>13} | {tempo_completa:>12.3f} | {tempo_esparsa:>11.3f} | "
+              f"{custo_completa:>14} | {custo_esparsa:>13}")
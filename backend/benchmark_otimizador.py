@@ -0,0 +1,88 @@
+"""
+Micro-benchmark do otimizador_de_rota_quadro: callbacks Python (implementação anterior)
+contra matrizes registradas no OR-Tools (RegisterTransitMatrix).
+
+Gera matrizes aleatórias (assimétricas, como as do GraphHopper) para cada N, resolve com
+as duas versões e confere que as rotas são idênticas.
+
+Também compara, para quadros pequenos, o Held-Karp exato com o OR-Tools (tempo de
+resolução e custo da rota encontrada).
+
+Uso: python benchmark_otimizador.py [repeticoes]
+"""
+import random
+import sys
+import time
+from ortools.constraint_solver import routing_enums_pb2
+from ortools.constraint_solver import pywrapcp
+from otimizador import otimizador_de_rota_quadro
+from otimizador import otimizador_held_karp
+
+REPETICOES = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+
+def otimizador_com_callbacks(matriz_tempo, matriz_distancia):
+    """Versão anterior: os custos dos arcos vêm de closures Python."""
+    num_locais = len(matriz_tempo)
+    manager = pywrapcp.RoutingIndexManager(num_locais, 1, [0], [num_locais - 1])
+    routing = pywrapcp.RoutingModel(manager)
+
+    def time_callback(from_index, to_index):
+        return matriz_tempo[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+    def distance_callback(from_index, to_index):
+        return matriz_distancia[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+    time_callback_index = routing.RegisterTransitCallback(time_callback)
+    routing.SetArcCostEvaluatorOfAllVehicles(time_callback_index)
+    routing.AddDimension(time_callback_index, 0, 86400, True, 'Time')
+    distance_callback_index = routing.RegisterTransitCallback(distance_callback)
+    routing.AddDimension(distance_callback_index, 0, 10000000, True, 'Distance')
+
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+    solution = routing.SolveWithParameters(search_parameters)
+    rota = []
+    index = routing.Start(0)
+    while not routing.IsEnd(index):
+        rota.append(manager.IndexToNode(index))
+        index = solution.Value(routing.NextVar(index))
+    rota.append(manager.IndexToNode(index))
+    return rota
+
+
+def _matrizes_aleatorias(n):
+    random.seed(n)
+    pontos = [(random.uniform(0, 20000), random.uniform(0, 20000)) for _ in range(n)]
+    distancias = [[0 if i == j else int(abs(a[0] - b[0]) + abs(a[1] - b[1]) + random.uniform(0, 500))
+                   for j, b in enumerate(pontos)] for i, a in enumerate(pontos)]
+    tempos = [[int(d / 8.3) for d in linha] for linha in distancias]
+    return tempos, distancias
+
+
+def _cronometrar(funcao, *args):
+    melhor, resultado = float("inf"), None
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+if __name__ == "__main__":
+    print(f"{'N':>4} | {'callbacks (ms)':>14} | {'matriz (ms)':>11} | {'ganho':>6} | rotas iguais")
+    for n in (10, 25, 50, 100):
+        tempos, distancias = _matrizes_aleatorias(n)
+        tempo_antes, rota_antes = _cronometrar(otimizador_com_callbacks, tempos, distancias)
+        tempo_depois, solucao = _cronometrar(otimizador_de_rota_quadro, tempos, distancias)
+        rota_depois = [parada["indice_parada"] for parada in solucao["detalhes_paradas"]]
+        print(f"{n:>4} | {tempo_antes * 1000:>14.1f} | {tempo_depois * 1000:>11.1f} | "
+              f"{tempo_antes / tempo_depois:>5.1f}x | {rota_antes == rota_depois}")
+
+    print(f"\n{'N':>4} | {'OR-Tools (ms)':>13} | {'Held-Karp (ms)':>14} | {'custo OR-Tools':>14} | {'custo ótimo':>11}")
+    for n in (5, 8, 10, 12):
+        tempos, distancias = _matrizes_aleatorias(n)
+        tempo_ortools, solucao_ortools = _cronometrar(otimizador_de_rota_quadro, tempos, distancias)
+        tempo_held_karp, solucao_held_karp = _cronometrar(otimizador_held_karp, tempos, distancias)
+        print(f"{n:>4} | {tempo_ortools * 1000:>13.1f} | {tempo_held_karp * 1000:>14.1f} | "
+              f"{solucao_ortools['tempo_segundos']:>14} | {solucao_held_karp['tempo_segundos']:>11}")
@@ -0,0 +1,139 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy.exc import SQLAlchemyError
+import models
+from database import SessionLocal
+
+# Abreviações comuns em endereços brasileiros, já sem acentos e em minúsculas
+ABREVIACOES = {
+    "r": "rua",
+    "av": "avenida",
+    "avd": "avenida",
+    "tv": "travessa",
+    "trav": "travessa",
+    "al": "alameda",
+    "rod": "rodovia",
+    "est": "estrada",
+    "pc": "praca",
+    "pca": "praca",
+    "lgo": "largo",
+    "cond": "condominio",
+    "res": "residencial",
+    "cj": "conjunto",
+    "conj": "conjunto",
+    "sra": "senhora",
+    "sr": "senhor",
+    "sto": "santo",
+    "sta": "santa",
+    "dr": "doutor",
+    "prof": "professor",
+    "gov": "governador",
+    "pres": "presidente",
+    "cel": "coronel",
+    "eng": "engenheiro",
+}
+# Palavras que não mudam o endereço (número, "sem número", valores ausentes)
+PALAVRAS_IGNORADAS = {"n", "no", "num", "numero", "none"}
+
+_memoria = OrderedDict()
+_memoria_lock = threading.Lock()
+_metricas = {"hits_memoria": 0, "hits_banco": 0, "misses": 0, "gravados": 0, "erros": 0}
+
+
+def _capacidade_memoria():
+    return int(os.getenv("GEOCODE_CACHE_TAMANHO", "2048"))
+
+
+def _incrementar(**contadores):
+    with _memoria_lock:
+        for nome, valor in contadores.items():
+            _metricas[nome] += valor
+
+
+def normalizar_endereco(endereco):
+    """
+    Normaliza um endereço para uso como chave de cache: remove acentos, pontuação e
+    maiúsculas, expande abreviações ("R." -> "rua", "Av." -> "avenida") e junta os
+    dígitos do CEP ("59129-690" -> "59129690").
+    Ex: "Av. Três Américas, 475 - Lagoa Azul" -> "avenida tres americas 475 lagoa azul"
+    """
+    texto = "".join(
+        c for c in unicodedata.normalize("NFKD", str(endereco))
+        if not unicodedata.combining(c)
+    ).lower()
+    texto = re.sub(r"\b(\d{5})-(\d{3})\b", r"\1\2", texto)
+    texto = texto.replace("º", " ").replace("ª", " ")
+    palavras = re.sub(r"[^a-z0-9]+", " ", texto).split()
+    return " ".join(ABREVIACOES.get(p, p) for p in palavras if p not in PALAVRAS_IGNORADAS)
+
+
+def _guardar_em_memoria(chave, valor):
+    with _memoria_lock:
+        _memoria[chave] = valor
+        _memoria.move_to_end(chave)
+        while len(_memoria) > _capacidade_memoria():
+            _memoria.popitem(last=False)
+
+
+def buscar_geocode(endereco_normalizado):
+    """
+    Retorna (lat, lon, fonte) do endereço normalizado, ou None.
+    Consulta primeiro o LRU em memória e depois a tabela persistente.
+    """
+    with _memoria_lock:
+        valor = _memoria.get(endereco_normalizado)
+        if valor is not None:
+            _memoria.move_to_end(endereco_normalizado)
+            _metricas["hits_memoria"] += 1
+            return valor
+
+    db = SessionLocal()
+    try:
+        registro = db.get(models.GeocodeCacheDB, endereco_normalizado)
+    except SQLAlchemyError as e:
+        print(f"[AVISO] Cache de geocodificação indisponível: {e}")
+        _incrementar(erros=1)
+        registro = None
+    finally:
+        db.close()
+
+    if registro is None:
+        _incrementar(misses=1)
+        return None
+    valor = (registro.lat, registro.lon, registro.fonte)
+    _guardar_em_memoria(endereco_normalizado, valor)
+    _incrementar(hits_banco=1)
+    return valor
+
+
+def salvar_geocode(endereco_normalizado, lat, lon, fonte):
+    """Grava o resultado de uma geocodificação no LRU e na tabela persistente."""
+    valor = (float(lat), float(lon), fonte)
+    _guardar_em_memoria(endereco_normalizado, valor)
+    db = SessionLocal()
+    try:
+        db.merge(models.GeocodeCacheDB(
+            endereco_normalizado=endereco_normalizado,
+            lat=valor[0],
+            lon=valor[1],
+            fonte=fonte,
+            atualizado_em=datetime.now(),
+        ))
+        db.commit()
+        _incrementar(gravados=1)
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[AVISO] Falha ao gravar no cache de geocodificação: {e}")
+        _incrementar(erros=1)
+    finally:
+        db.close()
+
+
+def metricas_cache_geocodes():
+    """Contadores acumulados desde o início do processo."""
+    with _memoria_lock:
+        return {**_metricas, "entradas_memoria": len(_memoria)}
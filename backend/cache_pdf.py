@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+import models
+
+# PDFs já desenhados, por (mapa_id, versao_conteudo), do menos para o mais usado
+_pdfs = OrderedDict()
+_pdfs_lock = threading.Lock()
+_metricas = {"hits": 0, "misses": 0, "gravados": 0, "descartados": 0, "bytes": 0}
+
+
+def _capacidade_bytes():
+    return int(float(os.getenv("PDF_CACHE_TAMANHO_MB", "64")) * 1024 * 1024)
+
+
+def buscar_pdf(mapa_id, versao):
+    """Retorna o PDF guardado para esta versão do mapa, ou None."""
+    with _pdfs_lock:
+        conteudo = _pdfs.get((mapa_id, versao))
+        if conteudo is None:
+            _metricas["misses"] += 1
+            return None
+        _pdfs.move_to_end((mapa_id, versao))
+        _metricas["hits"] += 1
+        return conteudo
+
+
+def guardar_pdf(mapa_id, versao, conteudo):
+    """
+    Guarda o PDF de uma versão do mapa. As versões anteriores do mesmo mapa saem na hora
+    (ninguém mais vai pedi-las); as demais entradas saem da menos usada para a mais usada
+    até o total caber em PDF_CACHE_TAMANHO_MB. Um PDF maior que o limite não é guardado.
+    """
+    if len(conteudo) > _capacidade_bytes():
+        return
+    with _pdfs_lock:
+        for chave in [chave for chave in _pdfs if chave[0] == mapa_id]:
+            _metricas["bytes"] -= len(_pdfs.pop(chave))
+        _pdfs[(mapa_id, versao)] = conteudo
+        _metricas["bytes"] += len(conteudo)
+        _metricas["gravados"] += 1
+        while _metricas["bytes"] > _capacidade_bytes():
+            _, descartado = _pdfs.popitem(last=False)
+            _metricas["bytes"] -= len(descartado)
+            _metricas["descartados"] += 1
+
+
+def metricas_cache_pdf():
+    """Contadores do cache de PDFs (para o endpoint de métricas)."""
+    with _pdfs_lock:
+        return {**_metricas, "entradas": len(_pdfs)}
+
+
+# ==========================================================
+# Versão de conteúdo dos mapas
+# ==========================================================
+
+def _valores(objeto, atributo):
+    """Valor atual e anteriores (se mudou neste flush) de uma coluna do objeto."""
+    historico = inspect(objeto).attrs[atributo].history
+    return [valor for valor in (*historico.added, *historico.unchanged, *historico.deleted) if valor is not None]
+
+
+def _mapas_alterados(session):
+    """IDs dos mapas cujo PDF muda com o que acabou de ser gravado neste flush."""
+    mapa_ids, quadro_ids, rota_ids, passageiro_ids, endereco_ids = set(), set(), set(), set(), set()
+    for objeto in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(objeto, models.MapaTransporteDB):
+            mapa_ids.update(_valores(objeto, "id"))
+        elif isinstance(objeto, models.QuadroDB):
+            mapa_ids.update(_valores(objeto, "mapa_transporte_id"))
+        elif isinstance(objeto, models.RotaDB):
+            # Pelo quadro_id do próprio objeto: a rota pode ter sido apagada neste flush
+            quadro_ids.update(_valores(objeto, "quadro_id"))
+        elif isinstance(objeto, models.ParadaDB):
+            rota_ids.update(_valores(objeto, "rota_id"))
+        elif isinstance(objeto, models.PassageiroDB):
+            passageiro_ids.update(_valores(objeto, "id"))
+        elif isinstance(objeto, models.EnderecoDB):
+            endereco_ids.update(_valores(objeto, "id"))
+
+    quadros = models.QuadroDB.__table__
+    associacao = models.quadro_passageiro_association
+    condicoes = []
+    if quadro_ids:
+        condicoes.append(quadros.c.id.in_(quadro_ids))
+    if rota_ids:
+        condicoes.append(quadros.c.id.in_(select(models.RotaDB.quadro_id).where(models.RotaDB.id.in_(rota_ids))))
+    if endereco_ids:
+        condicoes.append(quadros.c.origem_id.in_(endereco_ids))
+        condicoes.append(quadros.c.destino_id.in_(endereco_ids))
+        passageiro_ids.update(session.connection().scalars(
+            select(models.PassageiroDB.id).where(models.PassageiroDB.endereco_id.in_(endereco_ids))))
+    if passageiro_ids:
+        condicoes.append(quadros.c.id.in_(select(associacao.c.quadro_id).where(associacao.c.passageiro_id.in_(passageiro_ids))))
+    if condicoes:
+        mapa_ids.update(session.connection().scalars(
+            select(quadros.c.mapa_transporte_id).where(or_(*condicoes)).distinct()))
+    mapa_ids.discard(None)
+    return mapa_ids
+
+
+@event.listens_for(Session, "after_flush")
+def _versionar_mapas_alterados(session, contexto_flush):
+    """
+    Sobe a versao_conteudo dos mapas afetados por um flush, na mesma transação. Vale para
+    qualquer sessão (também a síncrona por trás da AsyncSession) e, por estar no banco,
+    para todos os processos da API: um PDF em cache nunca é servido depois de uma escrita.
+    """
+    mapa_ids = _mapas_alterados(session)
+    if mapa_ids:
+        mapas = models.MapaTransporteDB.__table__
+        session.connection().execute(
+            update(mapas).where(mapas.c.id.in_(mapa_ids)).values(versao_conteudo=mapas.c.versao_conteudo + 1))
@@ -0,0 +1,125 @@
+import os
+import threading
+from datetime import datetime
+from datetime import timedelta
+from sqlalchemy.exc import SQLAlchemyError
+import models
+from database import SessionLocal
+
+# Casas decimais usadas para arredondar as coordenadas da chave (5 casas ~ 1 metro)
+PRECISAO_COORDENADAS = 5
+# Limite de parâmetros por consulta IN (o SQLite antigo aceita no máximo 999)
+TAMANHO_LOTE_CONSULTA = 500
+
+_metricas = {"hits": 0, "misses": 0, "expirados": 0, "gravados": 0, "erros": 0}
+_metricas_lock = threading.Lock()
+# Gravações concorrentes da mesma chave (quadros com a mesma origem roteados em paralelo)
+# fariam o merge de duas threads tentar inserir a mesma linha
+_gravacao_lock = threading.Lock()
+
+
+def cache_ativo():
+    return os.getenv("CACHE_TRECHOS_ATIVO", "true").lower() != "false"
+
+
+def versao_grafo():
+    """Versão do grafo OSM carregado no GraphHopper. Altere ao reconstruir o grafo."""
+    return os.getenv("GRAPHHOPPER_GRAPH_VERSION", "1")
+
+
+def _ttl():
+    horas = float(os.getenv("CACHE_TRECHOS_TTL_HORAS", "720"))
+    return timedelta(hours=horas) if horas > 0 else None
+
+
+def _incrementar(**contadores):
+    with _metricas_lock:
+        for nome, valor in contadores.items():
+            _metricas[nome] += valor
+
+
+def chave_trecho(origem, destino, perfil="car"):
+    """Chave do trecho: perfil + coordenadas de origem e destino arredondadas."""
+    (lat_o, lon_o), (lat_d, lon_d) = origem, destino
+    p = PRECISAO_COORDENADAS
+    return f"{perfil}|{float(lat_o):.{p}f},{float(lon_o):.{p}f}|{float(lat_d):.{p}f},{float(lon_d):.{p}f}"
+
+
+def buscar_trechos(chaves):
+    """
+    Retorna {chave: (tempo_segundos, distancia_metros)} para as chaves presentes no cache.
+    Entradas de outra versão do grafo ou mais antigas que o TTL contam como miss.
+    """
+    if not cache_ativo():
+        return {}
+    chaves = list(set(chaves))
+    encontrados = {}
+    expirados = 0
+    versao = versao_grafo()
+    ttl = _ttl()
+    agora = datetime.now()
+    db = SessionLocal()
+    try:
+        for inicio in range(0, len(chaves), TAMANHO_LOTE_CONSULTA):
+            lote = chaves[inicio:inicio + TAMANHO_LOTE_CONSULTA]
+            for trecho in db.query(models.TrechoCacheDB).filter(models.TrechoCacheDB.chave.in_(lote)):
+                if trecho.versao_grafo != versao or (ttl and trecho.atualizado_em < agora - ttl):
+                    expirados += 1
+                    continue
+                encontrados[trecho.chave] = (trecho.tempo_segundos, trecho.distancia_metros)
+    except SQLAlchemyError as e:
+        print(f"[AVISO] Cache de trechos indisponível: {e}")
+        _incrementar(erros=1)
+    finally:
+        db.close()
+    _incrementar(hits=len(encontrados), misses=len(chaves) - len(encontrados), expirados=expirados)
+    return encontrados
+
+
+def salvar_trechos(trechos, perfil="car"):
+    """Grava (ou substitui) no cache os trechos {chave: (tempo_segundos, distancia_metros)}."""
+    if not trechos or not cache_ativo():
+        return
+    versao = versao_grafo()
+    agora = datetime.now()
+    db = SessionLocal()
+    try:
+        with _gravacao_lock:
+            for chave, (tempo_segundos, distancia_metros) in trechos.items():
+                db.merge(models.TrechoCacheDB(
+                    chave=chave,
+                    perfil=perfil,
+                    versao_grafo=versao,
+                    tempo_segundos=tempo_segundos,
+                    distancia_metros=distancia_metros,
+                    atualizado_em=agora,
+                ))
+            db.commit()
+        _incrementar(gravados=len(trechos))
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[AVISO] Falha ao gravar no cache de trechos: {e}")
+        _incrementar(erros=1)
+    finally:
+        db.close()
+
+
+def limpar_trechos_obsoletos():
+    """Remove do cache as entradas de versões anteriores do grafo. Retorna quantas foram apagadas."""
+    db = SessionLocal()
+    try:
+        apagados = (
+            db.query(models.TrechoCacheDB)
+            .filter(models.TrechoCacheDB.versao_grafo != versao_grafo())
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return apagados
+    finally:
+        db.close()
+
+
+def metricas_cache_trechos():
+    """Contadores acumulados desde o início do processo."""
+    with _metricas_lock:
+        return dict(_metricas)
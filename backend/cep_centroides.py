@@ -0,0 +1,125 @@
+import csv
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left
+from cache_geocodes import normalizar_endereco
+
+# Índice carregado sob demanda a partir de CEP_CENTROIDES_PATH (CSV ou SQLite) com as colunas
+# cep, lat, lon e, opcionalmente, bairro e cidade. Os CEPs ficam como inteiros num array
+# ordenado ('I', buscado com bisect), com as coordenadas em dois arrays de float paralelos:
+# 12 bytes por CEP, ~12 MB para a base nacional inteira (~1 milhão de CEPs). Um dict de
+# int para posição passaria de 100 MB.
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def _linhas_csv(caminho):
+    with open(caminho, newline="", encoding="utf-8") as arquivo:
+        for linha in csv.DictReader(arquivo):
+            yield linha.get("cep"), linha.get("lat"), linha.get("lon"), linha.get("bairro"), linha.get("cidade")
+
+
+def _linhas_sqlite(caminho):
+    conexao = sqlite3.connect(caminho)
+    try:
+        colunas = {coluna[1] for coluna in conexao.execute("PRAGMA table_info(cep_centroides)")}
+        bairro = "bairro" if "bairro" in colunas else "NULL"
+        cidade = "cidade" if "cidade" in colunas else "NULL"
+        yield from conexao.execute(f"SELECT cep, lat, lon, {bairro}, {cidade} FROM cep_centroides")
+    finally:
+        conexao.close()
+
+
+def _chave_bairro(bairro, cidade):
+    return f"{normalizar_endereco(bairro)}|{normalizar_endereco(cidade)}"
+
+
+def _digitos_cep(cep):
+    digitos = re.sub(r"\D", "", str(cep or ""))
+    return int(digitos) if len(digitos) == 8 else None
+
+
+def _ordenar_por_cep(ceps, lat, lon):
+    """
+    Ordena os três arrays pelo CEP. Em CEPs repetidos vale a última linha do arquivo,
+    como numa atribuição em dict.
+    """
+    if all(ceps[k] < ceps[k + 1] for k in range(len(ceps) - 1)):
+        return ceps, lat, lon
+    ordem = sorted(range(len(ceps)), key=ceps.__getitem__)  # estável: repetidos na ordem do arquivo
+    ceps_ordenados, lat_ordenada, lon_ordenada = array("I"), array("f"), array("f")
+    for k, posicao in enumerate(ordem):
+        if k + 1 < len(ordem) and ceps[ordem[k + 1]] == ceps[posicao]:
+            continue
+        ceps_ordenados.append(ceps[posicao])
+        lat_ordenada.append(lat[posicao])
+        lon_ordenada.append(lon[posicao])
+    return ceps_ordenados, lat_ordenada, lon_ordenada
+
+
+def _carregar_indice():
+    caminho = os.getenv("CEP_CENTROIDES_PATH")
+    indice = {"ceps": array("I"), "lat": array("f"), "lon": array("f"), "bairros": {}}
+    if not caminho or not os.path.exists(caminho):
+        if caminho:
+            print(f"[AVISO] Arquivo de centroides de CEP não encontrado: {caminho}")
+        return indice
+
+    linhas = _linhas_sqlite(caminho) if caminho.endswith((".db", ".sqlite", ".sqlite3")) else _linhas_csv(caminho)
+    somas_bairros = {}
+    for cep, lat, lon, bairro, cidade in linhas:
+        cep_int = _digitos_cep(cep)
+        if cep_int is None or lat in (None, "") or lon in (None, ""):
+            continue
+        lat, lon = float(lat), float(lon)
+        indice["ceps"].append(cep_int)
+        indice["lat"].append(lat)
+        indice["lon"].append(lon)
+        if bairro and cidade:
+            soma = somas_bairros.setdefault(_chave_bairro(bairro, cidade), [0.0, 0.0, 0])
+            soma[0] += lat
+            soma[1] += lon
+            soma[2] += 1
+
+    indice["ceps"], indice["lat"], indice["lon"] = _ordenar_por_cep(indice["ceps"], indice["lat"], indice["lon"])
+    # Segundo nível: centroide do bairro = média dos centroides dos seus CEPs
+    indice["bairros"] = {chave: (s[0] / s[2], s[1] / s[2]) for chave, s in somas_bairros.items()}
+    print(f"--- Centroides carregados: {len(indice['ceps'])} CEPs, {len(indice['bairros'])} bairros ---")
+    return indice
+
+
+def _obter_indice():
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            _indice = _carregar_indice()
+        return _indice
+
+
+def recarregar_centroides():
+    """Descarta o índice em memória; ele será relido do arquivo na próxima consulta."""
+    global _indice
+    with _indice_lock:
+        _indice = None
+
+
+def buscar_centroide_cep(cep):
+    """Retorna o centroide (lat, lon) do CEP, ou None. Aceita o CEP com ou sem hífen."""
+    cep_int = _digitos_cep(cep)
+    if cep_int is None:
+        return None
+    indice = _obter_indice()
+    posicao = bisect_left(indice["ceps"], cep_int)
+    if posicao == len(indice["ceps"]) or indice["ceps"][posicao] != cep_int:
+        return None
+    return (indice["lat"][posicao], indice["lon"][posicao])
+
+
+def buscar_centroide_bairro(bairro, cidade):
+    """Retorna o centroide (lat, lon) do bairro naquela cidade, ou None."""
+    if not bairro or not cidade:
+        return None
+    return _obter_indice()["bairros"].get(_chave_bairro(bairro, cidade))
@@ -0,0 +1,101 @@
+import numpy as np
+
+# Metros em um grau de latitude (aproximação esférica)
+METROS_POR_GRAU = 111_320
+
+
+def _distancias_quadradas(pontos, centros, cos_lat):
+    """Distância euclidiana ao quadrado numa projeção equirretangular (suficiente para comparar)."""
+    dy = pontos[:, None, 0] - centros[None, :, 0]
+    dx = (pontos[:, None, 1] - centros[None, :, 1]) * cos_lat
+    return dx * dx + dy * dy
+
+
+def agrupar_por_capacidade(coordenadas, capacidades, fixos=None, max_iteracoes=20):
+    """
+    K-means com capacidade: distribui os pontos (lat, lon) em len(capacidades) grupos,
+    sem passar da capacidade de cada um, minimizando a distância ao centro do grupo.
+
+    `fixos` mapeia índice do ponto -> grupo para pontos que não podem mudar de grupo
+    (contam na capacidade e no centro). A cada iteração os pontos livres são atribuídos
+    gulosamente, do par (ponto, centro) mais próximo para o mais distante, e os centros
+    são recalculados; para quando a atribuição não muda mais.
+
+    Retorna uma lista com o grupo de cada ponto, ou -1 para os que não couberam.
+    """
+    fixos = fixos or {}
+    num_grupos = len(capacidades)
+    pontos = np.asarray(coordenadas, dtype=float).reshape(-1, 2)
+    grupos = np.full(len(pontos), -1)
+    if not len(pontos) or not num_grupos:
+        return grupos.tolist()
+    for indice, grupo in fixos.items():
+        grupos[indice] = grupo
+    cos_lat = np.cos(np.radians(pontos[:, 0].mean()))
+    livres = np.array([i for i in range(len(pontos)) if i not in fixos], dtype=int)
+    restante_inicial = np.asarray(capacidades, dtype=int) - np.bincount(grupos[grupos >= 0], minlength=num_grupos)
+
+    # Centros iniciais: média dos pontos fixos do grupo; os demais grupos pegam, um a um,
+    # o ponto livre mais distante dos centros já escolhidos (inicialização determinística)
+    centros = np.zeros((num_grupos, 2))
+    definidos = []
+    for grupo in range(num_grupos):
+        membros = grupos == grupo
+        if membros.any():
+            centros[grupo] = pontos[membros].mean(axis=0)
+            definidos.append(grupo)
+    candidatos = pontos[livres] if len(livres) else pontos
+    for grupo in range(num_grupos):
+        if grupo in definidos:
+            continue
+        referencia = centros[definidos] if definidos else candidatos.mean(axis=0, keepdims=True)
+        distancias = _distancias_quadradas(candidatos, referencia, cos_lat).min(axis=1)
+        centros[grupo] = candidatos[int(np.argmax(distancias))]
+        definidos.append(grupo)
+
+    for _ in range(max_iteracoes):
+        nova_atribuicao = grupos.copy()
+        nova_atribuicao[livres] = -1
+        restante = restante_inicial.copy()
+        if len(livres):
+            distancias = _distancias_quadradas(pontos[livres], centros, cos_lat)
+            for par in np.argsort(distancias, axis=None, kind="stable"):
+                posicao, grupo = divmod(int(par), num_grupos)
+                if nova_atribuicao[livres[posicao]] == -1 and restante[grupo] > 0:
+                    nova_atribuicao[livres[posicao]] = grupo
+                    restante[grupo] -= 1
+        if np.array_equal(nova_atribuicao, grupos):
+            break
+        grupos = nova_atribuicao
+        for grupo in range(num_grupos):
+            membros = grupos == grupo
+            if membros.any():
+                centros[grupo] = pontos[membros].mean(axis=0)
+    return grupos.tolist()
+
+
+def agrupar_coincidentes(coordenadas, raio_metros):
+    """
+    Junta os pontos (lat, lon) que estão a até `raio_metros` uns dos outros (ou exatamente
+    no mesmo lugar, com raio 0). Cada ponto vai para o representante já escolhido mais
+    próximo, se ele estiver dentro do raio; caso contrário, vira um novo representante.
+
+    Retorna (representantes, grupo_de_cada_ponto): os índices dos pontos representantes e,
+    para cada ponto, a posição do seu representante nessa lista.
+    """
+    pontos = np.asarray(coordenadas, dtype=float).reshape(-1, 2)
+    if not len(pontos):
+        return [], []
+    cos_lat = np.cos(np.radians(pontos[:, 0].mean()))
+    raio_graus_quadrado = (raio_metros / METROS_POR_GRAU) ** 2
+    representantes, grupos = [], []
+    for indice, ponto in enumerate(pontos):
+        if representantes:
+            distancias = _distancias_quadradas(ponto[None, :], pontos[representantes], cos_lat)[0]
+            mais_proximo = int(np.argmin(distancias))
+            if distancias[mais_proximo] <= raio_graus_quadrado:
+                grupos.append(mais_proximo)
+                continue
+        grupos.append(len(representantes))
+        representantes.append(indice)
+    return representantes, grupos
@@ -3,4 +3,12 @@ AVISO_TEXT = "AVISO"
 ERROR_TEXT = "FALHA"
 NOMINATIM_TEXT = "Nominatim"
 LOCATION_IQ_TEXT = "LocationIQ"
-INSERCAO_MANUAL = "Manual"
\ No newline at end of file
+INSERCAO_MANUAL = "Manual"
+CENTROIDE_CEP_TEXT = "Centroide CEP"
+CENTROIDE_BAIRRO_TEXT = "Centroide Bairro"
+
+ETAPA_GEOCODE = "geocode"
+ETAPA_MATRIZ = "matrix"
+ETAPA_OTIMIZACAO = "solve"
+ETAPA_PERSISTENCIA = "persist"
+ETAPA_CONCLUIDA = "done"
@@ -1,26 +1,145 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import numpy as np
 import models
 import schemas
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from utils import gerar_link_google_maps_rota
 from generate_pdf import gerar_pdf
-from matriz import construir_matrizes_de_custo
+from cache_pdf import buscar_pdf
+from cache_pdf import guardar_pdf
+from matriz import construir_matrizes_de_custo_detalhado
+from matriz import construir_linha_e_coluna_detalhado
+from otimizador import resolver_rota_quadro
+from otimizador import resolver_configuracao_solver
+from otimizador import otimizar_rota_mapa
 from otimizador import otimizador_de_rota_quadro
+from otimizador import avaliar_ordem
+from otimizador import custo_da_ordem
+from otimizador import inserir_no_mais_barato
+from otimizador import melhorar_2opt
+from clusterizacao import agrupar_por_capacidade
+from matrizes_quadro import salvar_matrizes_quadro
+from matrizes_quadro import carregar_matrizes_quadro
+from matrizes_quadro import invalidar_matrizes_quadros
+from cache_trechos import versao_grafo
+from cache_trechos import PRECISAO_COORDENADAS
+from sqlalchemy import exists
+from sqlalchemy import func
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import selectinload
+from typing import Callable
 from typing import List
+from typing import Optional
 from datetime import datetime
 from datetime import timedelta
-from geocoders import geocode
+from geocoders import geocode_em_lote
+from constants import NOMINATIM_TEXT
+from constants import LOCATION_IQ_TEXT
+from constants import ETAPA_GEOCODE
+from constants import ETAPA_MATRIZ
+from constants import ETAPA_OTIMIZACAO
+from constants import ETAPA_PERSISTENCIA
+from constants import ETAPA_CONCLUIDA
+
+# ==========================================================
+# Perfis de carregamento
+# ==========================================================
+# Cada caso de uso carrega exatamente as relações de que precisa, com selectinload: uma
+# consulta por relação (com IN sobre as chaves já carregadas), sem produto cartesiano e
+# com o mesmo número de consultas qualquer que seja a quantidade de linhas. Os endereços
+# de passageiros e paradas (muitos-para-um) continuam vindo no JOIN padrão dos modelos.
+PERFIL_LISTA = "lista"       # listagens da API
+PERFIL_DETALHE = "detalhe"   # um registro completo na API
+PERFIL_GERACAO = "geracao"   # geração, distribuição e edição de rotas
+PERFIL_PDF = "pdf"           # gerar_pdf
+
+def _carregar_paradas():
+    return selectinload(models.RotaDB.paradas).selectinload(models.ParadaDB.passageiro)
+
+def _carregar_veiculo(relacao):
+    """Veículo com o que schemas.Veiculo serializa (motorista com veiculo_id, e quadro_id)."""
+    return selectinload(relacao).options(
+        selectinload(models.VeiculoDB.motorista).selectinload(models.MotoristaDB.veiculo),
+        selectinload(models.VeiculoDB.quadro),
+    )
+
+def _opcoes_quadro(perfil: str) -> list:
+    """Opções de carregamento de um QuadroDB, relativas ao quadro, para o perfil."""
+    opcoes = [
+        selectinload(models.QuadroDB.origem),
+        selectinload(models.QuadroDB.destino),
+        selectinload(models.QuadroDB.passageiros),
+        selectinload(models.QuadroDB.rota).options(_carregar_paradas()),
+    ]
+    if perfil == PERFIL_GERACAO:
+        return opcoes + [selectinload(models.QuadroDB.veiculo), selectinload(models.QuadroDB.mapa_transporte)]
+    if perfil == PERFIL_PDF:
+        return opcoes
+    # Lista e detalhe: tudo o que schemas.Quadro serializa
+    return opcoes + [_carregar_veiculo(models.QuadroDB.veiculo)]
+
+def _opcoes_mapa(perfil: str) -> list:
+    return [selectinload(models.MapaTransporteDB.quadros).options(*_opcoes_quadro(perfil))]
 
 # ==========================================================
 # CRUD para MapaTransporte (NOVO)
 # ==========================================================
-def get_mapa_transporte(db: Session, mapa_id: int):
-    """Lê um Mapa de Transporte da base de dados pelo seu ID."""
-    return db.query(models.MapaTransporteDB).filter(models.MapaTransporteDB.id == mapa_id).first()
+def get_mapa_transporte(db: Session, mapa_id: int, perfil: str = PERFIL_DETALHE):
+    """Lê um Mapa de Transporte da base de dados pelo seu ID, com as relações do `perfil`."""
+    return (
+        db.query(models.MapaTransporteDB)
+        .options(*_opcoes_mapa(perfil))
+        .filter(models.MapaTransporteDB.id == mapa_id)
+        .first()
+    )
 
 def get_mapas_transporte(db: Session, skip: int = 0, limit: int = 100):
     """Lê uma lista de Mapas de Transporte."""
-    return db.query(models.MapaTransporteDB).offset(skip).limit(limit).all()
+    return db.query(models.MapaTransporteDB).options(*_opcoes_mapa(PERFIL_LISTA)).offset(skip).limit(limit).all()
+
+def _paginar_por_cursor(query, coluna_id, cursor: Optional[int], limit: int) -> dict:
+    """
+    Paginação por cursor (keyset), do id mais recente para o mais antigo: a página seguinte
+    começa depois do último id devolvido, pelo índice da chave primária, com custo constante
+    qualquer que seja a página (ao contrário do OFFSET, que percorre as linhas puladas).
+    """
+    if cursor is not None:
+        query = query.filter(coluna_id < cursor)
+    linhas = query.order_by(coluna_id.desc()).limit(limit + 1).all()
+    itens = [dict(linha._mapping) for linha in linhas[:limit]]
+    return {"itens": itens, "proximo_cursor": itens[-1]["id"] if len(linhas) > limit else None}
+
+def get_mapas_transporte_resumo(db: Session, cursor: Optional[int] = None, limit: int = 50) -> dict:
+    """Mapas de Transporte com contagens calculadas no banco, numa única consulta."""
+    mapa = models.MapaTransporteDB
+    associacao = models.quadro_passageiro_association
+    total_quadros = select(func.count(models.QuadroDB.id)).where(models.QuadroDB.mapa_transporte_id == mapa.id).scalar_subquery()
+    total_passageiros = (
+        select(func.count(associacao.c.passageiro_id))
+        .join(models.QuadroDB, models.QuadroDB.id == associacao.c.quadro_id)
+        .where(models.QuadroDB.mapa_transporte_id == mapa.id)
+        .scalar_subquery()
+    )
+    quadros_com_rota = (
+        select(func.count(models.RotaDB.id))
+        .join(models.QuadroDB, models.QuadroDB.id == models.RotaDB.quadro_id)
+        .where(models.QuadroDB.mapa_transporte_id == mapa.id)
+        .scalar_subquery()
+    )
+    query = db.query(
+        mapa.id, mapa.nome, mapa.descricao, mapa.data_inicio,
+        total_quadros.label("total_quadros"),
+        total_passageiros.label("total_passageiros"),
+        quadros_com_rota.label("quadros_com_rota"),
+    )
+    return _paginar_por_cursor(query, mapa.id, cursor, limit)
 
 def create_mapa_transporte(db: Session, mapa: schemas.MapaTransporteCreate) -> models.MapaTransporteDB:
     """Cria um novo Mapa de Transporte."""
@@ -28,13 +147,24 @@ def create_mapa_transporte(db: Session, mapa: schemas.MapaTransporteCreate) -> m
         nome=mapa.nome,
         descricao=mapa.descricao,
         data_inicio=mapa.data_inicio,
-        regras=mapa.regras
+        regras=mapa.regras,
+        configuracao_solver=mapa.configuracao_solver.model_dump_json(exclude_none=True) if mapa.configuracao_solver else None
     )
     db.add(db_mapa)
     db.commit()
     db.refresh(db_mapa)
     return db_mapa
 
+def update_configuracao_solver_mapa(db: Session, mapa_id: int, configuracao: schemas.ConfiguracaoSolver) -> models.MapaTransporteDB:
+    """Define a configuração padrão do otimizador para as rotas do mapa."""
+    db_mapa = get_mapa_transporte(db, mapa_id=mapa_id)
+    if not db_mapa:
+        raise ValueError(f"Mapa de Transporte com id {mapa_id} não encontrado.")
+    db_mapa.configuracao_solver = configuracao.model_dump_json(exclude_none=True)
+    db.commit()
+    db.refresh(db_mapa)
+    return db_mapa
+
 # ==========================================================
 # CRUD para Endereco
 # ==========================================================
@@ -85,7 +215,16 @@ def get_veiculo(db: Session, veiculo_id: int):
     return db.query(models.VeiculoDB).filter(models.VeiculoDB.id == veiculo_id).first()
 
 def get_veiculos(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.VeiculoDB).offset(skip).limit(limit).all()
+    return (
+        db.query(models.VeiculoDB)
+        .options(
+            selectinload(models.VeiculoDB.motorista).selectinload(models.MotoristaDB.veiculo),
+            selectinload(models.VeiculoDB.quadro),
+        )
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
 
 def create_veiculo(db: Session, veiculo: schemas.VeiculoCreate) -> models.VeiculoDB:
     db_veiculo_existente = get_veiculo_by_placa(db, placa=veiculo.placa)
@@ -100,6 +239,7 @@ def create_veiculo(db: Session, veiculo: schemas.VeiculoCreate) -> models.Veicul
         placa=veiculo.placa,
         modelo=veiculo.modelo,
         cor=veiculo.cor,
+        capacidade=veiculo.capacidade,
         motorista_id=veiculo.motorista_id
     )
     db.add(db_veiculo)
@@ -158,8 +298,16 @@ def update_passageiro(db: Session, passageiro_id: int, passageiro_update: schema
             db_passageiro.endereco_id = None
         elif endereco_data and db_passageiro.endereco:
             # Atualiza o endereço existente
+            endereco_alterado = False
             for key, value in endereco_data.dict(exclude_unset=True).items():
-                setattr(db_passageiro.endereco, key, value)
+                if getattr(db_passageiro.endereco, key) != value:
+                    setattr(db_passageiro.endereco, key, value)
+                    endereco_alterado = True
+            if endereco_alterado:
+                # As coordenadas gravadas deixam de valer; serão geocodificadas de novo na próxima rota
+                db_passageiro.endereco.lat = None
+                db_passageiro.endereco.lon = None
+                invalidar_matrizes_quadros(db, [db_quadro.id for db_quadro in db_passageiro.quadros])
         elif endereco_data and not db_passageiro.endereco:
             # Cria um novo endereço se o passageiro não tiver um
             novo_endereco = create_endereco(db, schemas.EnderecoCreate(**endereco_data.dict()))
@@ -192,14 +340,32 @@ def delete_passageiro(db: Session, passageiro_id: int):
 # CRUD para Quadro
 # ==========================================================
 
-def get_quadro(db: Session, quadro_id: int):
-    return db.query(models.QuadroDB).filter(models.QuadroDB.id == quadro_id).first()
+def get_quadro(db: Session, quadro_id: int, perfil: str = PERFIL_DETALHE):
+    return db.query(models.QuadroDB).options(*_opcoes_quadro(perfil)).filter(models.QuadroDB.id == quadro_id).first()
 
 def get_quadros(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.QuadroDB).offset(skip).limit(limit).all()
+    return db.query(models.QuadroDB).options(*_opcoes_quadro(PERFIL_LISTA)).offset(skip).limit(limit).all()
+
+def get_quadros_resumo(db: Session, mapa_id: Optional[int] = None, cursor: Optional[int] = None, limit: int = 50) -> dict:
+    """Quadros com placa do veículo, total de passageiros e se já há rota, numa única consulta."""
+    quadro = models.QuadroDB
+    associacao = models.quadro_passageiro_association
+    total_passageiros = select(func.count(associacao.c.passageiro_id)).where(associacao.c.quadro_id == quadro.id).scalar_subquery()
+    query = (
+        db.query(
+            quadro.id, quadro.nome, quadro.horario_saida, quadro.mapa_transporte_id,
+            models.VeiculoDB.placa.label("placa_veiculo"),
+            total_passageiros.label("total_passageiros"),
+            exists().where(models.RotaDB.quadro_id == quadro.id).label("tem_rota"),
+        )
+        .outerjoin(models.VeiculoDB, models.VeiculoDB.id == quadro.veiculo_id)
+    )
+    if mapa_id is not None:
+        query = query.filter(quadro.mapa_transporte_id == mapa_id)
+    return _paginar_por_cursor(query, quadro.id, cursor, limit)
 
 def create_quadro(db: Session, quadro: schemas.QuadroCreate) -> models.QuadroDB:
-    db_mapa = get_mapa_transporte(db, mapa_id=quadro.mapa_transporte_id)
+    db_mapa = db.get(models.MapaTransporteDB, quadro.mapa_transporte_id)
     if not db_mapa:
         raise ValueError(f"Mapa de Transporte com id {quadro.mapa_transporte_id} não encontrado.")
 
@@ -270,6 +436,7 @@ def delete_quadro(db: Session, quadro_id: int):
     # O cascade="all, delete-orphan" na relação QuadroDB.rota garantirá que a RotaDB
     # e as suas ParadaDBs associadas sejam apagadas automaticamente.
     db.delete(db_quadro)
+    invalidar_matrizes_quadros(db, [db_quadro.id])
     
     # 3. Commit das alterações (desassociação e deleção)
     db.commit()
@@ -283,42 +450,195 @@ def delete_quadro(db: Session, quadro_id: int):
 # LÓGICA DE OTIMIZAÇÃO E ROTA
 # ==========================================================
 
-def montar_payload_vrp_from_db(origem: str, destino: str, passageiros: List[models.PassageiroDB]):
-    enderecos_formated = []
-    enderecos_formated.append(origem)
-    for passageiro in passageiros:
-        if not passageiro.autonomo:
-            enderecos_formated.append(passageiro.endereco)
-    enderecos_formated.append(destino)
-    lista_coordenadas = geocode(enderecos_formated)
-    return lista_coordenadas
-
-def gerar_e_salvar_rota_otimizada(db: Session, quadro_id: int):
-    db_quadro = get_quadro(db, quadro_id=quadro_id)
-    
+def montar_payload_vrp_from_db(db: Session, enderecos: List[models.EnderecoDB], gravar_coordenadas: bool = True):
+    """
+    Retorna as coordenadas (lat, lon) de cada endereço, na mesma ordem.
+    Só geocodifica os endereços que ainda não têm lat/lon gravados; resultados vindos de
+    um provedor (Nominatim/LocationIQ) são escritos de volta no EnderecoDB para serem
+    reaproveitados nas próximas gerações. Com `gravar_coordenadas=False` os endereços
+    ficam intactos (os resultados ficam só no cache de geocodificação).
+    """
+    coordenadas, indices_sem_coordenadas = _coordenadas_gravadas(enderecos)
+    if indices_sem_coordenadas:
+        resultados = geocode_em_lote([enderecos[i] for i in indices_sem_coordenadas])
+        _aplicar_geocodes(enderecos, coordenadas, indices_sem_coordenadas, resultados, gravar=gravar_coordenadas)
+        if gravar_coordenadas:
+            db.commit()
+    return _exigir_coordenadas(enderecos, coordenadas)
+
+def _coordenadas_gravadas(enderecos: List[models.EnderecoDB]):
+    """(coordenadas já gravadas, ou None, de cada endereço; índices dos que faltam)."""
+    coordenadas = [(endereco.lat, endereco.lon) for endereco in enderecos]
+    return coordenadas, [i for i, endereco in enumerate(enderecos) if endereco.lat is None or endereco.lon is None]
+
+def _aplicar_geocodes(enderecos: List[models.EnderecoDB], coordenadas, indices, resultados, gravar: bool = True):
+    for i, resultado in zip(indices, resultados):
+        coordenadas[i] = resultado["coordenadas"]
+        if gravar and resultado["fonte"] in (NOMINATIM_TEXT, LOCATION_IQ_TEXT):
+            enderecos[i].lat, enderecos[i].lon = resultado["coordenadas"]
+
+def _exigir_coordenadas(enderecos: List[models.EnderecoDB], coordenadas):
+    nao_encontrados = [str(enderecos[i]) for i, coordenada in enumerate(coordenadas) if coordenada is None]
+    if nao_encontrados:
+        raise ValueError(f"Não foi possível geocodificar: {'; '.join(nao_encontrados)}")
+    return coordenadas
+
+def _passageiros_a_visitar(db_quadro: models.QuadroDB) -> List[models.PassageiroDB]:
+    """
+    Passageiros não autônomos do quadro, ordenados por id: a ordem da coleção muda quando
+    ela é recarregada (após um commit, por exemplo) e os índices dos nós precisam ser estáveis.
+    """
+    return sorted((p for p in db_quadro.passageiros if not p.autonomo), key=lambda p: p.id)
+
+def _locais_do_quadro(db_quadro: models.QuadroDB) -> List[models.EnderecoDB]:
+    """Lista de nós do problema: origem, endereços dos passageiros não autônomos e destino."""
+    return [db_quadro.origem] + [p.endereco for p in _passageiros_a_visitar(db_quadro)] + [db_quadro.destino]
+
+def _ordem_da_rota_atual(db_quadro: models.QuadroDB, matriz_tempos) -> Optional[dict]:
+    """
+    Ordem de visita da rota salva (gerada ou definida à mão em salvar_ordem_paradas), nos
+    índices de _locais_do_quadro. Passageiros que ainda não têm parada entram pela inserção
+    mais barata. Retorna {"ordem", "custo", "completa"} ou None se o quadro não tem rota;
+    "completa" indica que a rota salva já atendia exatamente os passageiros atuais.
+    """
+    if not db_quadro.rota or not db_quadro.rota.paradas:
+        return None
+    indices = {p.id: indice for indice, p in enumerate(_passageiros_a_visitar(db_quadro), start=1)}
+    destino = len(indices) + 1
+    paradas = sorted(db_quadro.rota.paradas, key=lambda parada: parada.ordem)
+    na_rota = [indices[parada.passageiro_id] for parada in paradas if parada.passageiro_id in indices]
+    ordem = [0] + na_rota + [destino]
+    for no in sorted(set(indices.values()) - set(na_rota)):
+        ordem = inserir_no_mais_barato(matriz_tempos, ordem, no)
+    custo = custo_da_ordem(matriz_tempos, ordem)
+    completa = len(na_rota) == len(paradas) == len(indices) and db_quadro.rota.duracao_total_estimada == custo
+    return {"ordem": ordem, "custo": custo, "completa": completa}
+
+def _escolher_solucao(rota_solucao: dict, rota_atual: Optional[dict], matriz_tempos, matriz_distancias) -> Optional[dict]:
+    """
+    Compara a solução do otimizador com a ordem de partida. Retorna None quando a rota salva
+    deve ser mantida (estava completa e o otimizador não a superou), a ordem de partida
+    avaliada quando ela é melhor, ou a própria solução.
+    """
+    if not rota_atual or rota_solucao["tempo_segundos"] < rota_atual["custo"]:
+        return rota_solucao
+    if rota_atual["completa"]:
+        return None
+    solucao_inicial = avaliar_ordem(matriz_tempos, matriz_distancias, rota_atual["ordem"])
+    solucao_inicial["configuracao"] = {"algoritmo": "ROTA_ATUAL"}
+    return solucao_inicial
+
+def _coordenada_arredondada(coordenada):
+    return [round(float(coordenada[0]), PRECISAO_COORDENADAS), round(float(coordenada[1]), PRECISAO_COORDENADAS)]
+
+def _nos_em_ordem_canonica(coordenadas) -> List[int]:
+    """Nós intermediários (passageiros) ordenados pela coordenada: a mesma lista para quadros com as mesmas paradas."""
+    return sorted(range(1, len(coordenadas) - 1), key=lambda no: (_coordenada_arredondada(coordenadas[no]), no))
+
+def _impressao_digital_quadro(db_quadro: models.QuadroDB, coordenadas, configuracao: dict) -> str:
+    """
+    Hash determinístico de tudo o que define a rota gerada: coordenadas da origem, do destino
+    e das paradas (ordenadas, para não depender de ids), horário de saída, configuração do
+    otimizador e versão do grafo. Quadros com a mesma impressão digital têm a mesma rota.
+    """
+    dados = {
+        "origem": _coordenada_arredondada(coordenadas[0]),
+        "destino": _coordenada_arredondada(coordenadas[-1]),
+        "paradas": sorted(_coordenada_arredondada(coordenada) for coordenada in coordenadas[1:-1]),
+        "horario_saida": db_quadro.horario_saida.isoformat() if db_quadro.horario_saida else None,
+        "configuracao": configuracao,
+        "versao_grafo": versao_grafo(),
+    }
+    return hashlib.sha256(json.dumps(dados, sort_keys=True).encode()).hexdigest()
+
+def _marcar_impressao_digital(db_rota: models.RotaDB, impressao_digital: str, coordenadas, ordem: List[int]):
+    """Grava na rota a impressão digital e a ordem das paradas em posições canônicas."""
+    posicoes = {no: posicao for posicao, no in enumerate(_nos_em_ordem_canonica(coordenadas))}
+    db_rota.impressao_digital = impressao_digital
+    db_rota.ordem_canonica = json.dumps([posicoes[no] for no in ordem[1:-1]])
+
+def _rota_em_dia(db_quadro: models.QuadroDB, impressao_digital: str) -> bool:
+    """A rota salva foi gerada com exatamente as entradas atuais (e os mesmos passageiros)."""
+    db_rota = db_quadro.rota
+    return bool(
+        db_rota and db_rota.impressao_digital == impressao_digital
+        and {parada.passageiro_id for parada in db_rota.paradas} == {p.id for p in _passageiros_a_visitar(db_quadro)}
+    )
+
+def _copiar_rota_equivalente(db: Session, db_quadro: models.QuadroDB, locais_ordenados: List[models.EnderecoDB],
+                             coordenadas, impressao_digital: str) -> Optional[models.RotaDB]:
+    """
+    Procura a rota de outro quadro com a mesma impressão digital (o mesmo quadro copiado
+    para outro dia, por exemplo) e monta uma rota igual para este, sem matriz nem otimizador:
+    a ordem vem das posições canônicas e os horários acumulados das paradas da original.
+    """
+    original = (
+        db.query(models.RotaDB)
+        .filter(models.RotaDB.impressao_digital == impressao_digital, models.RotaDB.quadro_id != db_quadro.id)
+        .order_by(models.RotaDB.id.desc())
+        .first()
+    )
+    if original is None or original.ordem_canonica is None:
+        return None
+    nos_canonicos = _nos_em_ordem_canonica(coordenadas)
+    ordem_canonica = json.loads(original.ordem_canonica)
+    paradas_originais = sorted(original.paradas, key=lambda parada: parada.ordem)
+    if len(ordem_canonica) != len(nos_canonicos) or len(paradas_originais) != len(nos_canonicos):
+        return None
+
+    partida = datetime.combine(datetime.today(), db_quadro.horario_saida)
+    detalhes_paradas = [{"indice_parada": 0, "tempo_acumulado_s": 0}]
+    for posicao, parada in zip(ordem_canonica, paradas_originais):
+        tempo_acumulado_s = int((datetime.combine(datetime.today(), parada.horario_saida) - partida).total_seconds()) % 86400
+        detalhes_paradas.append({"indice_parada": nos_canonicos[posicao], "tempo_acumulado_s": tempo_acumulado_s})
+    detalhes_paradas.append({"indice_parada": len(coordenadas) - 1, "tempo_acumulado_s": int(original.duracao_total_estimada)})
+    rota_solucao = {
+        "tempo_segundos": int(original.duracao_total_estimada),
+        "distancia_metros": round(original.distancia_total_estimada_km * 1000),
+        "detalhes_paradas": detalhes_paradas,
+        "configuracao": json.loads(original.configuracao_solver) if original.configuracao_solver else None,
+        "curva_melhoria": json.loads(original.curva_melhoria) if original.curva_melhoria else None,
+    }
+    nova_rota_db = _montar_rota_db(db_quadro, locais_ordenados, rota_solucao)
+    _marcar_impressao_digital(nova_rota_db, impressao_digital, coordenadas, [parada["indice_parada"] for parada in detalhes_paradas])
+    print(f"Rota do Quadro ID {db_quadro.id} copiada da Rota ID {original.id} (mesmas entradas).")
+    return nova_rota_db
+
+def _validar_quadro_para_rota(db_quadro: models.QuadroDB):
     if not db_quadro:
         raise ValueError("Quadro não encontrado.")
     if not db_quadro.passageiros:
         raise ValueError("O quadro precisa de ter pelo menos um passageiro associados.")
-    
-    if db_quadro.rota:
-        print(f"Rota ID {db_quadro.rota.id} já existe para o Quadro ID {quadro_id}. Apagando rota antiga...")
-        db.delete(db_quadro.rota)
-        db.commit()
-        db.refresh(db_quadro)
 
-    locais_ordenados = [db_quadro.origem]
-    for passageiro in db_quadro.passageiros:
-        locais_ordenados.append(passageiro.endereco)
-    locais_ordenados.append(db_quadro.destino)
+def _configuracao_solver_efetiva(db_mapa: models.MapaTransporteDB, configuracao_solver: Optional[schemas.ConfiguracaoSolver] = None) -> dict:
+    """Configuração do otimizador: a da chamada sobrepõe a do mapa, que sobrepõe o padrão."""
+    configuracao = json.loads(db_mapa.configuracao_solver) if db_mapa.configuracao_solver else {}
+    if configuracao_solver:
+        configuracao.update(configuracao_solver.model_dump(exclude_none=True))
+    return resolver_configuracao_solver(configuracao)
 
-    coordenadas = montar_payload_vrp_from_db(db_quadro.origem.__str__(), db_quadro.destino.__str__(), db_quadro.passageiros)
-    matriz_tempos, matriz_distancias = construir_matrizes_de_custo(coordenadas)
-    rota_solucao = otimizador_de_rota_quadro(matriz_tempos, matriz_distancias)
+def _construir_matrizes_do_quadro(coordenadas, extremos=None):
+    """
+    Constrói as matrizes de tempo e distância e falha se algum par não puder ser roteado.
+    `extremos` são os índices das origens e destinos (por padrão o primeiro e o último local).
+    """
+    return _matrizes_sem_falhas(construir_matrizes_de_custo_detalhado(coordenadas, extremos))
 
-    if not rota_solucao:
-        raise ValueError("Falha ao obter solução do otimizador.")
+def _matrizes_sem_falhas(matrizes: dict):
+    """(tempos, distancias) do resultado de construir_matrizes_de_custo_detalhado, ou erro se algum par falhou."""
+    if matrizes["falhas"]:
+        pares_com_falha = ", ".join(f"{f['origem']}->{f['destino']}" for f in matrizes["falhas"])
+        raise RuntimeError(f"Falha ao rotear {len(matrizes['falhas'])} par(es) no GraphHopper: {pares_com_falha}")
+    return matrizes["tempos"], matrizes["distancias"]
 
+def _montar_rota_db(db_quadro: models.QuadroDB, locais_ordenados: List[models.EnderecoDB], rota_solucao: dict,
+                    passageiros: Optional[List[models.PassageiroDB]] = None) -> models.RotaDB:
+    """
+    Cria a RotaDB (e as suas ParadaDB) a partir da solução do otimizador, sem fazer commit.
+    `passageiros` acompanha os locais intermediários (o passageiro do local i é passageiros[i - 1]);
+    por padrão, os de _passageiros_a_visitar, que são os usados por _locais_do_quadro.
+    """
+    passageiros = passageiros if passageiros is not None else _passageiros_a_visitar(db_quadro)
     tempo_total_segundos = rota_solucao["tempo_segundos"]
     distancia_total_metros = rota_solucao["distancia_metros"]
     momento_partida = datetime.combine(db_quadro.mapa_transporte.data_inicio.date(), db_quadro.horario_saida)
@@ -329,16 +649,16 @@ def gerar_e_salvar_rota_otimizada(db: Session, quadro_id: int):
         duracao_total_estimada=tempo_total_segundos,
         distancia_total_estimada_km=distancia_total_metros / 1000.0,
         horario_chegada_estimado=momento_chegada,
+        configuracao_solver=json.dumps(rota_solucao.get("configuracao")),
+        curva_melhoria=json.dumps(rota_solucao.get("curva_melhoria")),
         quadro_id=db_quadro.id
     )
     paradas_com_endereco = []
     for ordem, detalhe_parada in enumerate(detalhes_paradas[1:-1], start=1):
         indice_do_local = detalhe_parada["indice_parada"]
         endereco_da_parada = locais_ordenados[indice_do_local]
-        passageiro_da_parada = next(
-            (p for p in db_quadro.passageiros if p.endereco_id == endereco_da_parada.id), 
-            None
-        )
+        # Pelo índice, não pelo endereço: passageiros podem compartilhar o mesmo endereço
+        passageiro_da_parada = passageiros[indice_do_local - 1]
 
         tempo_acumulado_s = detalhe_parada["tempo_acumulado_s"]
         horario_saida_calculado = (datetime.combine(datetime.today(), db_quadro.horario_saida) + timedelta(seconds=tempo_acumulado_s)).time()
@@ -346,7 +666,7 @@ def gerar_e_salvar_rota_otimizada(db: Session, quadro_id: int):
             ordem=ordem,
             horario_saida=horario_saida_calculado,
             passageiro_id=passageiro_da_parada.id,
-            endereco_id=passageiro_da_parada.endereco.id,
+            endereco_id=endereco_da_parada.id,
         )
         nova_parada_db.endereco = endereco_da_parada
         paradas_com_endereco.append(nova_parada_db)
@@ -359,24 +679,473 @@ def gerar_e_salvar_rota_otimizada(db: Session, quadro_id: int):
         paradas=paradas_com_endereco
     )
     nova_rota_db.google_maps_link = link_google_maps
+    return nova_rota_db
 
+def _substituir_rota(db: Session, db_quadro: models.QuadroDB, nova_rota_db: models.RotaDB):
+    """Troca a rota do quadro pela nova, sem fazer commit."""
+    if db_quadro.rota:
+        print(f"Rota ID {db_quadro.rota.id} já existe para o Quadro ID {db_quadro.id}. Apagando rota antiga...")
+        db.delete(db_quadro.rota)
+        # A rota antiga precisa sair antes da nova entrar (quadro_id é único em rotas)
+        db.flush()
     db_quadro.rota = nova_rota_db
+
+def gerar_e_salvar_rota_otimizada(db: Session, quadro_id: int, progresso: Optional[Callable] = None,
+                                  configuracao_solver: Optional[schemas.ConfiguracaoSolver] = None):
+    """
+    Gera e salva a rota otimizada de um quadro.
+    Se `progresso` for informado, ele é chamado como progresso(etapa) no início de cada
+    etapa (geocode, matrix, solve, persist) e como progresso("done", rota_id) ao final.
+    `configuracao_solver` sobrepõe, só nesta chamada, a configuração do mapa.
+
+    Se o quadro já tem rota (gerada ou ordenada à mão), a busca parte dela e o resultado
+    só é gravado se for mais rápido; caso contrário a rota atual é mantida.
+
+    Antes de tudo é calculada a impressão digital das entradas: se a rota atual foi gerada
+    com as mesmas entradas ela é devolvida na hora, e se outro quadro tem uma rota com a
+    mesma impressão digital ela é copiada, sem matriz nem otimização.
+    """
+    progresso = progresso or (lambda etapa, rota_id=None: None)
+    db_quadro = get_quadro(db, quadro_id=quadro_id, perfil=PERFIL_GERACAO)
+    _validar_quadro_para_rota(db_quadro)
+    locais_ordenados = _locais_do_quadro(db_quadro)
+
+    progresso(ETAPA_GEOCODE)
+    coordenadas = montar_payload_vrp_from_db(db, locais_ordenados)
+    configuracao = _configuracao_solver_efetiva(db_quadro.mapa_transporte, configuracao_solver)
+    impressao_digital = _impressao_digital_quadro(db_quadro, coordenadas, configuracao)
+    rota_reaproveitada = _reaproveitar_rota(db, db_quadro, locais_ordenados, coordenadas, impressao_digital, progresso)
+    if rota_reaproveitada is not None:
+        return rota_reaproveitada
+
+    progresso(ETAPA_MATRIZ)
+    matriz_tempos, matriz_distancias = _construir_matrizes_do_quadro(coordenadas)
+    salvar_matrizes_quadro(db, db_quadro.id, locais_ordenados, coordenadas, matriz_tempos, matriz_distancias)
+    progresso(ETAPA_OTIMIZACAO)
+    rota_atual = _ordem_da_rota_atual(db_quadro, matriz_tempos)
+    rota_solucao = resolver_rota_quadro(matriz_tempos, matriz_distancias, configuracao,
+                                        ordem_inicial=rota_atual["ordem"] if rota_atual else None)
+    return _gravar_solucao(db, db_quadro, locais_ordenados, coordenadas, impressao_digital,
+                           rota_solucao, rota_atual, matriz_tempos, matriz_distancias, progresso)
+
+def _reaproveitar_rota(db: Session, db_quadro: models.QuadroDB, locais_ordenados: List[models.EnderecoDB],
+                       coordenadas, impressao_digital: str, progresso: Callable) -> Optional[models.RotaDB]:
+    """
+    Rota do quadro sem matriz nem otimização: a atual, se está em dia, ou a cópia (já gravada)
+    da rota de um quadro com a mesma impressão digital. None se for preciso otimizar.
+    """
+    if _rota_em_dia(db_quadro, impressao_digital):
+        print(f"Rota ID={db_quadro.rota.id} já está em dia (entradas sem alteração).")
+        progresso(ETAPA_CONCLUIDA, db_quadro.rota.id)
+        return db_quadro.rota
+    rota_copiada = _copiar_rota_equivalente(db, db_quadro, locais_ordenados, coordenadas, impressao_digital)
+    if rota_copiada is None:
+        return None
+    progresso(ETAPA_PERSISTENCIA)
+    _substituir_rota(db, db_quadro, rota_copiada)
+    db.commit()
+    db.refresh(db_quadro)
+    progresso(ETAPA_CONCLUIDA, db_quadro.rota.id)
+    return db_quadro.rota
+
+def _gravar_solucao(db: Session, db_quadro: models.QuadroDB, locais_ordenados: List[models.EnderecoDB], coordenadas,
+                    impressao_digital: str, rota_solucao: Optional[dict], rota_atual: Optional[dict],
+                    matriz_tempos, matriz_distancias, progresso: Callable) -> models.RotaDB:
+    """
+    Grava a solução do otimizador como a nova rota do quadro, ou mantém a rota atual se a
+    solução não a superou (ver _escolher_solucao). Faz o commit e retorna a rota do quadro.
+    """
+    if not rota_solucao:
+        raise ValueError("Falha ao obter solução do otimizador.")
+    rota_solucao = _escolher_solucao(rota_solucao, rota_atual, matriz_tempos, matriz_distancias)
+    if rota_solucao is None:
+        _marcar_impressao_digital(db_quadro.rota, impressao_digital, coordenadas, rota_atual["ordem"])
+        db.commit()
+        print(f"Rota ID={db_quadro.rota.id} mantida: a otimização não melhorou a ordem atual.")
+        progresso(ETAPA_CONCLUIDA, db_quadro.rota.id)
+        return db_quadro.rota
+
+    progresso(ETAPA_PERSISTENCIA)
+    nova_rota_db = _montar_rota_db(db_quadro, locais_ordenados, rota_solucao)
+    _marcar_impressao_digital(nova_rota_db, impressao_digital, coordenadas, [p["indice_parada"] for p in rota_solucao["detalhes_paradas"]])
+    _substituir_rota(db, db_quadro, nova_rota_db)
     db.commit()
     db.refresh(db_quadro)
 
     print(f"Rota ID={nova_rota_db.id} otimizada e salva na base de dados.")
+    progresso(ETAPA_CONCLUIDA, nova_rota_db.id)
+    return db_quadro.rota
+
+def _matrizes_incrementais(db: Session, db_quadro: models.QuadroDB, locais_ordenados: List[models.EnderecoDB],
+                           coordenadas, adicionar_passageiro_id: Optional[int]):
+    """
+    Matrizes (tempos, distancias) do quadro a partir das guardadas: na remoção, ou se o novo
+    passageiro mora num endereço já conhecido, basta recortá-las; na adição, só a linha e a
+    coluna do novo nó são roteadas. Sem matrizes guardadas, constrói tudo.
+    """
+    matrizes = carregar_matrizes_quadro(db, db_quadro.id, locais_ordenados)
+    if matrizes is not None:
+        return matrizes[0].tolist(), matrizes[1].tolist()
+    indice_novo = next((indice for indice, p in enumerate(_passageiros_a_visitar(db_quadro), start=1)
+                        if p.id == adicionar_passageiro_id), None)
+    if indice_novo is not None:
+        outros = [indice for indice in range(len(locais_ordenados)) if indice != indice_novo]
+        matrizes = carregar_matrizes_quadro(db, db_quadro.id, [locais_ordenados[indice] for indice in outros])
+    if matrizes is None:
+        return _construir_matrizes_do_quadro(coordenadas)
+    matriz_tempos, matriz_distancias = (
+        np.asarray(matriz) for matriz in _matrizes_sem_falhas(construir_linha_e_coluna_detalhado(coordenadas, indice_novo))
+    )
+    matriz_tempos[np.ix_(outros, outros)] = matrizes[0]
+    matriz_distancias[np.ix_(outros, outros)] = matrizes[1]
+    return matriz_tempos.tolist(), matriz_distancias.tolist()
+
+def atualizar_rota_incremental(db: Session, quadro_id: int, adicionar_passageiro_id: Optional[int] = None,
+                               remover_passageiro_id: Optional[int] = None, polir: bool = False,
+                               configuracao_solver: Optional[schemas.ConfiguracaoSolver] = None):
+    """
+    Adiciona ou remove um passageiro do quadro e ajusta a rota existente sem refazer tudo:
+    só o endereço novo é geocodificado, as matrizes guardadas do quadro são reaproveitadas
+    (só a linha e a coluna do novo nó são roteadas) e a ordem atual das paradas é mantida, com o
+    novo passageiro entrando pela inserção mais barata ou, na remoção, reparada por 2-opt.
+
+    Com `polir`, o OR-Tools parte da ordem ajustada (warm start) para melhorá-la. A rota
+    recebe a impressão digital das entradas, então uma geração logo depois não refaz nada.
+    Se o quadro ainda não tem rota, cai na geração completa.
+    """
+    db_quadro = get_quadro(db, quadro_id=quadro_id, perfil=PERFIL_GERACAO)
+    if not db_quadro:
+        raise ValueError("Quadro não encontrado.")
+
+    if adicionar_passageiro_id is not None:
+        db_passageiro = get_passageiro(db, passageiro_id=adicionar_passageiro_id)
+        if not db_passageiro:
+            raise ValueError(f"Passageiro com id {adicionar_passageiro_id} não encontrado.")
+        if db_passageiro not in db_quadro.passageiros:
+            db_quadro.passageiros.append(db_passageiro)
+    if remover_passageiro_id is not None:
+        db_passageiro = next((p for p in db_quadro.passageiros if p.id == remover_passageiro_id), None)
+        if not db_passageiro:
+            raise ValueError(f"Passageiro com id {remover_passageiro_id} não está neste quadro.")
+        db_quadro.passageiros.remove(db_passageiro)
+    _validar_quadro_para_rota(db_quadro)
+
+    if not db_quadro.rota or not db_quadro.rota.paradas:
+        return gerar_e_salvar_rota_otimizada(db, quadro_id, configuracao_solver=configuracao_solver)
+
+    locais_ordenados = _locais_do_quadro(db_quadro)
+    coordenadas = montar_payload_vrp_from_db(db, locais_ordenados)
+    matriz_tempos, matriz_distancias = _matrizes_incrementais(db, db_quadro, locais_ordenados, coordenadas, adicionar_passageiro_id)
+    salvar_matrizes_quadro(db, db_quadro.id, locais_ordenados, coordenadas, matriz_tempos, matriz_distancias)
+    ordem = _ordem_da_rota_atual(db_quadro, matriz_tempos)["ordem"]
+    if remover_passageiro_id is not None:
+        ordem = melhorar_2opt(matriz_tempos, ordem)
+
+    configuracao = _configuracao_solver_efetiva(db_quadro.mapa_transporte, configuracao_solver)
+    if polir:
+        rota_solucao = otimizador_de_rota_quadro(matriz_tempos, matriz_distancias, configuracao, ordem_inicial=ordem)
+    else:
+        rota_solucao = avaliar_ordem(matriz_tempos, matriz_distancias, ordem)
+        rota_solucao["configuracao"] = {"algoritmo": "INCREMENTAL"}
+    if not rota_solucao:
+        raise ValueError("Falha ao obter solução do otimizador.")
+
+    nova_rota_db = _montar_rota_db(db_quadro, locais_ordenados, rota_solucao)
+    _marcar_impressao_digital(nova_rota_db, _impressao_digital_quadro(db_quadro, coordenadas, configuracao),
+                              coordenadas, [p["indice_parada"] for p in rota_solucao["detalhes_paradas"]])
+    _substituir_rota(db, db_quadro, nova_rota_db)
+    db.commit()
+    db.refresh(db_quadro)
+    print(f"Rota ID={db_quadro.rota.id} atualizada incrementalmente.")
     return db_quadro.rota
 
-def gerar_e_salvar_rota_otimizada_mt(db: Session, mapa_id: int):
-    db_mapa_transporte = get_mapa_transporte(db, mapa_id=mapa_id)
+_pool_otimizacao = None
+_pool_otimizacao_lock = threading.Lock()
+
+def _obter_pool_otimizacao() -> ProcessPoolExecutor:
+    """Pool de processos para as resoluções do OR-Tools, com um processo por núcleo."""
+    global _pool_otimizacao
+    with _pool_otimizacao_lock:
+        if _pool_otimizacao is None:
+            max_workers = int(os.getenv("OTIMIZADOR_MAX_PROCESSOS", "0")) or os.cpu_count() or 1
+            # "spawn" evita herdar o estado de threads e conexões do processo do servidor
+            _pool_otimizacao = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool_otimizacao
+
+def gerar_e_salvar_rota_otimizada_mt(db: Session, mapa_id: int, progresso: Optional[Callable] = None, paralelo: bool = True,
+                                     configuracao_solver: Optional[schemas.ConfiguracaoSolver] = None):
+    """
+    Gera as rotas de todos os quadros de um mapa.
+    Se `progresso` for informado, ele é chamado como progresso(quadro_id, etapa[, rota_id]).
+    `configuracao_solver` sobrepõe, só nesta chamada, a configuração do mapa.
+
+    No modo paralelo, os quadros passam juntos por cada etapa: uma única geocodificação em
+    lote para todos os endereços, as matrizes construídas em paralelo (ROTA_MT_MAX_QUADROS_PARALELOS)
+    e as resoluções do OR-Tools num pool de processos. Só a persistência é serializada,
+    numa única transação para todas as rotas. Como no modo sequencial, a rota salva de cada
+    quadro é o ponto de partida e só é substituída se for superada.
+    """
+    db_mapa_transporte = get_mapa_transporte(db, mapa_id=mapa_id, perfil=PERFIL_GERACAO)
     if not db_mapa_transporte:
         raise ValueError("Mapa de Transporte não encontrado.")
+    progresso = progresso or (lambda quadro_id, etapa, rota_id=None: None)
+    quadros = list(db_mapa_transporte.quadros)
+
+    if not paralelo:
+        rotas = []
+        for db_quadro in quadros:
+            progresso_quadro = lambda etapa, rota_id=None, quadro_id=db_quadro.id: progresso(quadro_id, etapa, rota_id)
+            rota = gerar_e_salvar_rota_otimizada(db, db_quadro.id, progresso=progresso_quadro, configuracao_solver=configuracao_solver)
+            rotas.append(rota)
+        return rotas
+
+    for db_quadro in quadros:
+        _validar_quadro_para_rota(db_quadro)
+    locais_por_quadro = [_locais_do_quadro(db_quadro) for db_quadro in quadros]
+
+    for db_quadro in quadros:
+        progresso(db_quadro.id, ETAPA_GEOCODE)
+    todos_os_locais = [local for locais in locais_por_quadro for local in locais]
+    todas_as_coordenadas = montar_payload_vrp_from_db(db, todos_os_locais)
+    coordenadas_por_quadro = []
+    inicio = 0
+    for locais in locais_por_quadro:
+        coordenadas_por_quadro.append(todas_as_coordenadas[inicio:inicio + len(locais)])
+        inicio += len(locais)
+
+    # Quadros cujas entradas não mudaram, ou iguais às de outro quadro, dispensam matriz e otimização
+    configuracao = _configuracao_solver_efetiva(db_mapa_transporte, configuracao_solver)
+    situacao = {}
+    pendentes = []
+    for db_quadro, locais_ordenados, coordenadas in zip(quadros, locais_por_quadro, coordenadas_por_quadro):
+        impressao_digital = _impressao_digital_quadro(db_quadro, coordenadas, configuracao)
+        if _rota_em_dia(db_quadro, impressao_digital):
+            situacao[db_quadro.id] = "já está em dia (entradas sem alteração)"
+            continue
+        rota_copiada = _copiar_rota_equivalente(db, db_quadro, locais_ordenados, coordenadas, impressao_digital)
+        if rota_copiada is not None:
+            progresso(db_quadro.id, ETAPA_PERSISTENCIA)
+            _substituir_rota(db, db_quadro, rota_copiada)
+            situacao[db_quadro.id] = "copiada de um quadro com as mesmas entradas"
+            continue
+        pendentes.append((db_quadro, locais_ordenados, coordenadas, impressao_digital))
+
+    for db_quadro, *_ in pendentes:
+        progresso(db_quadro.id, ETAPA_MATRIZ)
+    max_quadros_paralelos = int(os.getenv("ROTA_MT_MAX_QUADROS_PARALELOS", "4"))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_quadros_paralelos, len(pendentes)))) as executor:
+        matrizes_por_quadro = list(executor.map(_construir_matrizes_do_quadro, [coordenadas for _, _, coordenadas, _ in pendentes]))
+
+    for db_quadro, *_ in pendentes:
+        progresso(db_quadro.id, ETAPA_OTIMIZACAO)
+    pool = _obter_pool_otimizacao()
+    rotas_atuais = [_ordem_da_rota_atual(db_quadro, tempos) for (db_quadro, *_), (tempos, _) in zip(pendentes, matrizes_por_quadro)]
+    futuros = [
+        pool.submit(resolver_rota_quadro, tempos, distancias, configuracao, rota_atual["ordem"] if rota_atual else None)
+        for (tempos, distancias), rota_atual in zip(matrizes_por_quadro, rotas_atuais)
+    ]
+    solucoes = [futuro.result() for futuro in futuros]
+    if not all(solucoes):
+        raise ValueError("Falha ao obter solução do otimizador.")
+
+    for (db_quadro, locais_ordenados, coordenadas, impressao_digital), rota_solucao, rota_atual, (tempos, distancias) in zip(
+            pendentes, solucoes, rotas_atuais, matrizes_por_quadro):
+        salvar_matrizes_quadro(db, db_quadro.id, locais_ordenados, coordenadas, tempos, distancias)
+        rota_solucao = _escolher_solucao(rota_solucao, rota_atual, tempos, distancias)
+        if rota_solucao is None:
+            _marcar_impressao_digital(db_quadro.rota, impressao_digital, coordenadas, rota_atual["ordem"])
+            situacao[db_quadro.id] = "mantida: a otimização não melhorou a ordem atual"
+            continue
+        progresso(db_quadro.id, ETAPA_PERSISTENCIA)
+        nova_rota_db = _montar_rota_db(db_quadro, locais_ordenados, rota_solucao)
+        _marcar_impressao_digital(nova_rota_db, impressao_digital, coordenadas, [p["indice_parada"] for p in rota_solucao["detalhes_paradas"]])
+        _substituir_rota(db, db_quadro, nova_rota_db)
+    db.commit()
+
     rotas = []
-    for db_quadro in db_mapa_transporte.quadros:
-        rota = gerar_e_salvar_rota_otimizada(db, db_quadro.id)
-        rotas.append(rota)
+    for db_quadro in quadros:
+        db.refresh(db_quadro)
+        print(f"Rota ID={db_quadro.rota.id} {situacao.get(db_quadro.id, 'otimizada e salva na base de dados.')}")
+        progresso(db_quadro.id, ETAPA_CONCLUIDA, db_quadro.rota.id)
+        rotas.append(db_quadro.rota)
     return rotas
 
+def _distribuir_via_vrp(quadros, fixos_por_quadro, novos, coordenadas, configuracao):
+    """
+    Uma única resolução do VRP capacitado com todos os quadros e passageiros.
+    `coordenadas` mapeia endereco_id -> (lat, lon).
+    Retorna ([(passageiros_na_ordem, rota_solucao) por quadro], passageiros_sem_lugar).
+    """
+    coordenadas_nos, inicios, fins, capacidades = [], [], [], []
+    for db_quadro in quadros:
+        inicios.append(len(coordenadas_nos))
+        fins.append(len(coordenadas_nos) + 1)
+        coordenadas_nos += [coordenadas[db_quadro.origem_id], coordenadas[db_quadro.destino_id]]
+        capacidades.append(_capacidade_do_veiculo(db_quadro.veiculo))
+    passageiros_por_no, veiculos_permitidos = {}, {}
+    for veiculo_idx, fixos in enumerate(fixos_por_quadro):
+        for passageiro in fixos:
+            veiculos_permitidos[len(coordenadas_nos)] = [veiculo_idx]
+            passageiros_por_no[len(coordenadas_nos)] = passageiro
+            coordenadas_nos.append(coordenadas[passageiro.endereco_id])
+    for passageiro in novos:
+        passageiros_por_no[len(coordenadas_nos)] = passageiro
+        coordenadas_nos.append(coordenadas[passageiro.endereco_id])
+
+    matriz_tempos, matriz_distancias = _construir_matrizes_do_quadro(coordenadas_nos, inicios + fins)
+    solucao = otimizar_rota_mapa(matriz_tempos, matriz_distancias, inicios, fins, capacidades, veiculos_permitidos, configuracao)
+    if not solucao:
+        raise DistribuicaoInviavel("O otimizador não encontrou uma distribuição viável para os quadros do mapa.")
+
+    resultados = []
+    for rota_veiculo in solucao["rotas"]:
+        detalhes_paradas = rota_veiculo["detalhes_paradas"]
+        passageiros_da_rota = [passageiros_por_no[parada["indice_parada"]] for parada in detalhes_paradas[1:-1]]
+        # Renumera os nós para a lista de locais do próprio quadro, na ordem da rota
+        rota_quadro = {
+            **rota_veiculo,
+            "detalhes_paradas": [{**parada, "indice_parada": posicao} for posicao, parada in enumerate(detalhes_paradas)],
+            "configuracao": solucao["configuracao"],
+        }
+        resultados.append((passageiros_da_rota, rota_quadro))
+    return resultados, [passageiros_por_no[node] for node in solucao["nao_atendidos"]]
+
+def _distribuir_por_clusters(quadros, fixos_por_quadro, novos, coordenadas, configuracao):
+    """
+    Decomposição "agrupar primeiro, rotear depois": os passageiros são divididos entre os
+    veículos por k-means com capacidade sobre as coordenadas e cada grupo vira um problema
+    de um quadro só. As matrizes crescem com o tamanho do grupo, não com o total de
+    passageiros, e os grupos são roteados e resolvidos em paralelo como no gerar_e_salvar_rota_otimizada_mt.
+    Retorna o mesmo formato de _distribuir_via_vrp.
+    """
+    passageiros = [p for fixos in fixos_por_quadro for p in fixos] + list(novos)
+    fixos = {}
+    for veiculo_idx, fixos_do_quadro in enumerate(fixos_por_quadro):
+        for passageiro in fixos_do_quadro:
+            fixos[len(fixos)] = veiculo_idx
+    grupos = agrupar_por_capacidade(
+        [coordenadas[p.endereco_id] for p in passageiros],
+        [_capacidade_do_veiculo(db_quadro.veiculo) for db_quadro in quadros],
+        fixos,
+    )
+    passageiros_por_quadro = [[] for _ in quadros]
+    for passageiro, grupo in zip(passageiros, grupos):
+        if grupo >= 0:
+            passageiros_por_quadro[grupo].append(passageiro)
+
+    coordenadas_por_quadro = [
+        [coordenadas[db_quadro.origem_id]] + [coordenadas[p.endereco_id] for p in membros] + [coordenadas[db_quadro.destino_id]]
+        for db_quadro, membros in zip(quadros, passageiros_por_quadro)
+    ]
+    max_quadros_paralelos = int(os.getenv("ROTA_MT_MAX_QUADROS_PARALELOS", "4"))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_quadros_paralelos, len(quadros)))) as executor:
+        matrizes_por_quadro = list(executor.map(_construir_matrizes_do_quadro, coordenadas_por_quadro))
+    pool = _obter_pool_otimizacao()
+    futuros = [pool.submit(resolver_rota_quadro, tempos, distancias, configuracao) for tempos, distancias in matrizes_por_quadro]
+    solucoes = [futuro.result() for futuro in futuros]
+    if not all(solucoes):
+        raise DistribuicaoInviavel("O otimizador não encontrou rota para algum dos grupos de passageiros.")
+
+    resultados = []
+    for membros, rota_solucao in zip(passageiros_por_quadro, solucoes):
+        # Os nós intermediários do grupo são 1..k, na ordem de `membros`
+        passageiros_da_rota = [membros[parada["indice_parada"] - 1] for parada in rota_solucao["detalhes_paradas"][1:-1]]
+        resultados.append((passageiros_da_rota, rota_solucao))
+    return resultados, [p for p, grupo in zip(passageiros, grupos) if grupo < 0]
+
+def _capacidade_do_veiculo(db_veiculo: models.VeiculoDB) -> int:
+    return db_veiculo.capacidade or int(os.getenv("VEICULO_CAPACIDADE_PADRAO", "15"))
+
+class DistribuicaoInviavel(Exception):
+    """Não há distribuição que respeite as capacidades (e as associações já feitas)."""
+
+def _exigir_capacidade_para_fixos(quadros, fixos_por_quadro):
+    """
+    Os passageiros já associados ficam no seu quadro; se eles sozinhos excedem a capacidade
+    do veículo, nenhum dos modos consegue distribuir (o VRP não acha solução e os clusters
+    gravariam uma rota acima da lotação), então a distribuição é recusada antes.
+    """
+    excedidos = [
+        f"{db_quadro.nome} (ID {db_quadro.id}): {len(fixos)} passageiros para {_capacidade_do_veiculo(db_quadro.veiculo)} lugares"
+        for db_quadro, fixos in zip(quadros, fixos_por_quadro)
+        if len(fixos) > _capacidade_do_veiculo(db_quadro.veiculo)
+    ]
+    if excedidos:
+        raise DistribuicaoInviavel(f"Os passageiros já associados excedem a capacidade do veículo: {'; '.join(excedidos)}.")
+
+def distribuir_passageiros_mapa(db: Session, mapa_id: int, passageiros_ids: Optional[List[int]] = None,
+                                configuracao_solver: Optional[schemas.ConfiguracaoSolver] = None,
+                                modo: Optional[str] = None) -> dict:
+    """
+    Distribui passageiros entre os quadros do mapa que têm veículo e ordena as paradas de
+    todos eles, respeitando a capacidade do veículo (ou VEICULO_CAPACIDADE_PADRAO quando
+    não cadastrada).
+
+    Sem `passageiros_ids`, distribui todos os passageiros não autônomos que ainda não estão
+    em nenhum quadro do mapa. Quem já está num quadro com veículo continua nele, mas entra
+    na reordenação. As associações e as novas rotas são gravadas numa única transação.
+
+    `modo` "vrp" resolve um único VRP capacitado com todos os passageiros; "clusters"
+    agrupa os passageiros por veículo e resolve cada grupo separadamente, em paralelo.
+    Sem `modo`, usa "clusters" acima de DISTRIBUICAO_MAX_PASSAGEIROS_VRP passageiros (80).
+
+    Retorna None se o mapa não existe. Levanta DistribuicaoInviavel se os passageiros já
+    associados a algum quadro excedem a capacidade do veículo (nos dois modos) ou se o
+    otimizador não acha solução, e ValueError para pedidos inválidos.
+    """
+    db_mapa = get_mapa_transporte(db, mapa_id=mapa_id, perfil=PERFIL_GERACAO)
+    if not db_mapa:
+        return None
+    quadros = [db_quadro for db_quadro in db_mapa.quadros if db_quadro.veiculo]
+    if not quadros:
+        raise ValueError("O mapa precisa de pelo menos um quadro com veículo associado.")
+
+    ja_alocados = {p.id for db_quadro in db_mapa.quadros for p in db_quadro.passageiros}
+    consulta = db.query(models.PassageiroDB).filter(models.PassageiroDB.autonomo == False)
+    if passageiros_ids is None:
+        novos = consulta.filter(models.PassageiroDB.id.notin_(ja_alocados)).all() if ja_alocados else consulta.all()
+    else:
+        novos = consulta.filter(models.PassageiroDB.id.in_(passageiros_ids)).all()
+        if len(novos) != len(set(passageiros_ids)):
+            raise ValueError("Um ou mais IDs de passageiros não foram encontrados ou são autônomos.")
+        novos = [p for p in novos if p.id not in ja_alocados]
+    fixos_por_quadro = [[p for p in db_quadro.passageiros if not p.autonomo] for db_quadro in quadros]
+    _exigir_capacidade_para_fixos(quadros, fixos_por_quadro)
+
+    # Uma geocodificação em lote para todos os endereços envolvidos
+    passageiros = [p for fixos in fixos_por_quadro for p in fixos] + novos
+    enderecos = [e for db_quadro in quadros for e in (db_quadro.origem, db_quadro.destino)] + [p.endereco for p in passageiros]
+    coordenadas = dict(zip((e.id for e in enderecos), montar_payload_vrp_from_db(db, enderecos)))
+
+    if modo is None:
+        modo = "clusters" if len(passageiros) > int(os.getenv("DISTRIBUICAO_MAX_PASSAGEIROS_VRP", "80")) else "vrp"
+    configuracao = _configuracao_solver_efetiva(db_mapa, configuracao_solver)
+    distribuir = _distribuir_por_clusters if modo == "clusters" else _distribuir_via_vrp
+    resultados, sem_lugar = distribuir(quadros, fixos_por_quadro, novos, coordenadas, configuracao)
+
+    quadros_com_rota = []
+    for db_quadro, (passageiros_da_rota, rota_quadro) in zip(quadros, resultados):
+        for passageiro in passageiros_da_rota:
+            if passageiro not in db_quadro.passageiros:
+                db_quadro.passageiros.append(passageiro)
+        if not passageiros_da_rota:
+            continue
+        locais_do_quadro = [db_quadro.origem] + [p.endereco for p in passageiros_da_rota] + [db_quadro.destino]
+        _substituir_rota(db, db_quadro, _montar_rota_db(db_quadro, locais_do_quadro, rota_quadro, passageiros_da_rota))
+        quadros_com_rota.append(db_quadro)
+    db.commit()
+
+    for db_quadro in quadros_com_rota:
+        db.refresh(db_quadro)
+    print(f"Mapa ID={mapa_id} ({modo}): {len(novos) - len(sem_lugar)} passageiro(s) distribuído(s), {len(sem_lugar)} sem lugar.")
+    return {
+        "modo": modo,
+        "rotas_ids": [db_quadro.rota.id for db_quadro in quadros_com_rota],
+        "passageiros_nao_alocados": [p.id for p in sem_lugar],
+        "tempo_total_segundos": sum(rota_quadro["tempo_segundos"] for _, rota_quadro in resultados),
+        "distancia_total_km": sum(rota_quadro["distancia_metros"] for _, rota_quadro in resultados) / 1000.0,
+    }
+
 def get_rota(db: Session, rota_id: int):
     """
     Lê uma rota da base de dados pelo seu ID, pré-carregando todas as 
@@ -385,42 +1154,116 @@ def get_rota(db: Session, rota_id: int):
     return (
         db.query(models.RotaDB)
         .options(
-            # Carrega o quadro e suas relações diretas
-            joinedload(models.RotaDB.quadro).joinedload(models.QuadroDB.veiculo).joinedload(models.VeiculoDB.motorista),
-            joinedload(models.RotaDB.quadro).joinedload(models.QuadroDB.origem),
-            joinedload(models.RotaDB.quadro).joinedload(models.QuadroDB.destino),
-            
-            # Carrega as paradas e as suas relações aninhadas
-            joinedload(models.RotaDB.paradas).joinedload(models.ParadaDB.passageiro).joinedload(models.PassageiroDB.endereco),
-            joinedload(models.RotaDB.paradas).joinedload(models.ParadaDB.endereco)
+            _carregar_veiculo(models.RotaDB.veiculo),
+            selectinload(models.RotaDB.quadro).options(*_opcoes_quadro(PERFIL_DETALHE)),
+            _carregar_paradas(),
         )
         .filter(models.RotaDB.id == rota_id)
         .first()
     )
 
-def get_mapa_consolidado_pdf_filepath(db: Session, mapa_id: int) -> str:
+def get_versao_mapa_transporte(db: Session, mapa_id: int):
+    """Nome e versao_conteudo de um mapa (None se não existe), sem carregar as relações."""
+    return (
+        db.query(models.MapaTransporteDB.nome, models.MapaTransporteDB.versao_conteudo)
+        .filter(models.MapaTransporteDB.id == mapa_id)
+        .first()
+    )
+
+def get_mapa_consolidado_pdf(db: Session, mapa_id: int) -> tuple:
     """
-    Busca os dados de um Mapa de Transporte e chama o gerador de PDF consolidado.
+    Retorna (nome do mapa, bytes do PDF consolidado). O PDF de cada versão do mapa é
+    desenhado uma vez e depois servido do cache_pdf até a próxima escrita no mapa.
     """
-    # A função get_mapa_transporte já está configurada com 'joinedload' para buscar tudo
-    db_mapa = get_mapa_transporte(db, mapa_id=mapa_id)
-    if not db_mapa:
+    versao = get_versao_mapa_transporte(db, mapa_id=mapa_id)
+    if not versao:
         raise ValueError(f"Mapa de Transporte com id {mapa_id} não encontrado.")
 
-    # Chama a função que itera sobre os quadros/rotas e desenha o PDF
-    filepath = gerar_pdf(db_mapa=db_mapa)
-    
-    return filepath
+    conteudo = buscar_pdf(mapa_id, versao.versao_conteudo)
+    if conteudo is None:
+        # Chama a função que itera sobre os quadros/rotas e desenha o PDF
+        conteudo = gerar_pdf(db_mapa=get_mapa_transporte(db, mapa_id=mapa_id, perfil=PERFIL_PDF))
+        guardar_pdf(mapa_id, versao.versao_conteudo, conteudo)
+    return versao.nome, conteudo
+
+def _avaliar_ordem_manual(db: Session, quadro_id: int, passageiros_ids_ordenados: List[int],
+                          gravar_coordenadas: bool = True):
+    """
+    Calcula tempos e distâncias de uma ordem de paradas escolhida à mão, usando as matrizes
+    guardadas do quadro (sem GraphHopper nem otimizador). Se ainda não há matrizes válidas,
+    elas são construídas uma vez para todos os passageiros do quadro e guardadas (sem commit).
+    `gravar_coordenadas` vai para montar_payload_vrp_from_db.
+    Retorna (db_quadro, locais_ordenados, rota_solucao).
+    """
+    db_quadro = get_quadro(db, quadro_id=quadro_id, perfil=PERFIL_GERACAO)
+    if not db_quadro:
+        raise ValueError("Quadro não encontrado.")
+    passageiros_map = {p.id: p for p in db_quadro.passageiros}
+    for pid in passageiros_ids_ordenados:
+        if pid not in passageiros_map:
+            raise ValueError(f"Passageiro ID {pid} inválido, autônomo ou sem endereço.")
+    locais_ordenados = [db_quadro.origem] + [passageiros_map[pid].endereco for pid in passageiros_ids_ordenados] + [db_quadro.destino]
+
+    matrizes = carregar_matrizes_quadro(db, db_quadro.id, locais_ordenados)
+    if matrizes is None:
+        todos_os_locais = _locais_do_quadro(db_quadro)
+        todos_os_locais += [local for local in locais_ordenados if local not in todos_os_locais]
+        coordenadas = montar_payload_vrp_from_db(db, todos_os_locais, gravar_coordenadas)
+        salvar_matrizes_quadro(db, db_quadro.id, todos_os_locais, coordenadas, *_construir_matrizes_do_quadro(coordenadas))
+        db.flush() # a sessão não faz autoflush, e carregar_matrizes_quadro lê o registro com db.get
+        matrizes = carregar_matrizes_quadro(db, db_quadro.id, locais_ordenados)
+    rota_solucao = avaliar_ordem(*matrizes, list(range(len(locais_ordenados))))
+    rota_solucao["configuracao"] = {"algoritmo": "MANUAL"}
+    return db_quadro, locais_ordenados, rota_solucao
+
+def avaliar_ordem_paradas(db: Session, quadro_id: int, passageiros_ids_ordenados: List[int]) -> dict:
+    """
+    Horários de saída de cada parada, duração, distância e chegada de uma ordem. Não altera
+    o quadro, a rota nem os endereços (e portanto a versão do mapa): só as matrizes do quadro
+    construídas agora ficam guardadas, para as próximas avaliações.
+    """
+    db_quadro, _, rota_solucao = _avaliar_ordem_manual(db, quadro_id, passageiros_ids_ordenados, gravar_coordenadas=False)
+    db.commit() # só o MatrizQuadroDB
+    partida = datetime.combine(db_quadro.mapa_transporte.data_inicio.date(), db_quadro.horario_saida) if db_quadro.horario_saida else None
+    return {
+        "duracao_total_estimada": rota_solucao["tempo_segundos"],
+        "distancia_total_estimada_km": rota_solucao["distancia_metros"] / 1000.0,
+        "horario_chegada_estimado": partida + timedelta(seconds=rota_solucao["tempo_segundos"]) if partida else None,
+        "paradas": [
+            {
+                "passageiro_id": pid,
+                "ordem": ordem,
+                "horario_saida": (partida + timedelta(seconds=detalhe["tempo_acumulado_s"])).time() if partida else None,
+            }
+            for ordem, (pid, detalhe) in enumerate(zip(passageiros_ids_ordenados, rota_solucao["detalhes_paradas"][1:-1]), start=1)
+        ],
+    }
 
 def salvar_ordem_paradas(db: Session, quadro_id: int, passageiros_ids_ordenados: List[int]):
     """
     Recebe uma lista de IDs de passageiros na ordem definida pelo utilizador
-    e cria/atualiza os objetos ParadaDB.
+    e cria/atualiza os objetos ParadaDB, com os horários calculados pelas matrizes
+    guardadas do quadro (ver _avaliar_ordem_manual).
     """
-    db_quadro = get_quadro(db, quadro_id=quadro_id)
+    db_quadro = get_quadro(db, quadro_id=quadro_id, perfil=PERFIL_GERACAO)
     if not db_quadro:
         raise ValueError("Quadro não encontrado.")
 
+    if db_quadro.horario_saida is not None:
+        try:
+            db_quadro, locais_ordenados, rota_solucao = _avaliar_ordem_manual(db, quadro_id, passageiros_ids_ordenados)
+            passageiros_map = {p.id: p for p in db_quadro.passageiros}
+            passageiros = [passageiros_map[pid] for pid in passageiros_ids_ordenados]
+            _substituir_rota(db, db_quadro, _montar_rota_db(db_quadro, locais_ordenados, rota_solucao, passageiros))
+            db.commit()
+            db.refresh(db_quadro)
+            return db_quadro.rota
+        except (RuntimeError, ValueError) as e:
+            # Sem matrizes e sem GraphHopper/geocodificação: grava a ordem sem horários
+            print(f"[AVISO] Não foi possível calcular os horários da ordem manual: {e}")
+            db.rollback()
+            db.refresh(db_quadro)
+
     if db_quadro.rota:
         db.delete(db_quadro.rota)
         db.commit()
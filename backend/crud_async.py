@@ -0,0 +1,207 @@
+"""
+Versão assíncrona das operações de crud.py usadas pelos endpoints `async def`.
+
+As consultas reaproveitam as funções síncronas de crud.py (e os seus perfis de
+carregamento) por AsyncSession.run_sync: elas rodam num greenlet e cada ida ao banco é
+aguardada no event loop, sem ocupar uma thread. Como a resposta é serializada depois,
+fora do greenlet, tudo o que ela usa precisa ter vindo carregado pelo perfil.
+
+Na geração de rota, geocodificação e matrizes usam os clientes HTTP assíncronos, e o
+OR-Tools roda no pool de processos de crud._obter_pool_otimizacao.
+"""
+import asyncio
+import contextlib
+import models
+import schemas
+import crud
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from geocoders import geocode_em_lote_async
+from matriz import construir_matrizes_de_custo_detalhado_async
+import generate_pdf
+from cache_pdf import buscar_pdf
+from cache_pdf import guardar_pdf
+from database import AsyncSessionLocal
+from database import engine_async
+from matrizes_quadro import salvar_matrizes_quadro
+from otimizador import resolver_rota_quadro
+
+# O SQLite aceita um escritor por vez: as gerações em paralelo enfileiram as suas escritas
+# aqui, sem segurar conexão do pool, em vez de disputar o lock do arquivo até o busy_timeout.
+_trava_escrita_sqlite = asyncio.Lock()
+
+# PDFs sendo desenhados agora, por (mapa_id, versao_conteudo)
+_pdfs_em_andamento = {}
+
+
+def _sem_progresso(etapa, rota_id=None):
+    pass
+
+async def _liberar_conexao(db: AsyncSession):
+    """
+    Encerra a transação (só de leitura até aqui) antes de uma espera longa, devolvendo a
+    conexão ao pool: sem isso, cada geração em andamento prenderia uma conexão enquanto
+    espera o geocodificador, o GraphHopper ou o OR-Tools. Os objetos continuam utilizáveis
+    (expire_on_commit=False) e a próxima consulta abre outra transação.
+    """
+    await db.commit()
+
+def _escrita():
+    """Trecho de escrita da geração; serializado no SQLite, livre nos demais bancos."""
+    if engine_async.dialect.name == "sqlite":
+        return _trava_escrita_sqlite
+    return contextlib.nullcontext()
+
+# ==========================================================
+# Consultas
+# ==========================================================
+
+async def get_motoristas(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return await db.run_sync(crud.get_motoristas, skip=skip, limit=limit)
+
+async def get_veiculos(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return await db.run_sync(crud.get_veiculos, skip=skip, limit=limit)
+
+async def get_passageiros(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return await db.run_sync(crud.get_passageiros, skip=skip, limit=limit)
+
+async def get_mapa_transporte(db: AsyncSession, mapa_id: int, perfil: str = crud.PERFIL_DETALHE):
+    return await db.run_sync(crud.get_mapa_transporte, mapa_id=mapa_id, perfil=perfil)
+
+async def get_mapas_transporte(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return await db.run_sync(crud.get_mapas_transporte, skip=skip, limit=limit)
+
+async def get_mapas_transporte_resumo(db: AsyncSession, cursor: Optional[int] = None, limit: int = 50) -> dict:
+    return await db.run_sync(crud.get_mapas_transporte_resumo, cursor=cursor, limit=limit)
+
+async def get_versao_mapa_transporte(db: AsyncSession, mapa_id: int):
+    return await db.run_sync(crud.get_versao_mapa_transporte, mapa_id=mapa_id)
+
+async def get_quadro(db: AsyncSession, quadro_id: int, perfil: str = crud.PERFIL_DETALHE):
+    return await db.run_sync(crud.get_quadro, quadro_id=quadro_id, perfil=perfil)
+
+async def get_quadros(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return await db.run_sync(crud.get_quadros, skip=skip, limit=limit)
+
+async def get_quadros_resumo(db: AsyncSession, mapa_id: Optional[int] = None, cursor: Optional[int] = None, limit: int = 50) -> dict:
+    return await db.run_sync(crud.get_quadros_resumo, mapa_id=mapa_id, cursor=cursor, limit=limit)
+
+async def get_rota(db: AsyncSession, rota_id: int):
+    return await db.run_sync(crud.get_rota, rota_id=rota_id)
+
+# ==========================================================
+# Geração de rota
+# ==========================================================
+
+async def montar_payload_vrp(db: AsyncSession, enderecos):
+    """Versão assíncrona de crud.montar_payload_vrp_from_db."""
+    coordenadas, indices_sem_coordenadas = crud._coordenadas_gravadas(enderecos)
+    if indices_sem_coordenadas:
+        await _liberar_conexao(db)
+        resultados = await geocode_em_lote_async([enderecos[i] for i in indices_sem_coordenadas])
+        crud._aplicar_geocodes(enderecos, coordenadas, indices_sem_coordenadas, resultados)
+        async with _escrita():
+            await db.commit()
+    return crud._exigir_coordenadas(enderecos, coordenadas)
+
+async def resolver_rota_quadro_em_processo(matriz_tempos, matriz_distancias, configuracao: dict, ordem_inicial=None):
+    """
+    otimizador.resolver_rota_quadro num processo do pool de otimização: o OR-Tools segura
+    o GIL, e numa thread deste processo pararia também o event loop.
+    """
+    laco = asyncio.get_running_loop()
+    return await laco.run_in_executor(crud._obter_pool_otimizacao(), resolver_rota_quadro,
+                                      matriz_tempos, matriz_distancias, configuracao, ordem_inicial)
+
+async def gerar_e_salvar_rota_otimizada(db: AsyncSession, quadro_id: int,
+                                        configuracao_solver: Optional[schemas.ConfiguracaoSolver] = None) -> models.RotaDB:
+    """
+    Versão assíncrona de crud.gerar_e_salvar_rota_otimizada, com as mesmas regras
+    (impressão digital, cópia de rota equivalente, rota atual como ponto de partida).
+    Retorna a rota com as relações que schemas.Rota serializa.
+    """
+    db_quadro = await get_quadro(db, quadro_id=quadro_id, perfil=crud.PERFIL_GERACAO)
+    crud._validar_quadro_para_rota(db_quadro)
+    locais_ordenados = crud._locais_do_quadro(db_quadro)
+
+    coordenadas = await montar_payload_vrp(db, locais_ordenados)
+    configuracao = crud._configuracao_solver_efetiva(db_quadro.mapa_transporte, configuracao_solver)
+    impressao_digital = crud._impressao_digital_quadro(db_quadro, coordenadas, configuracao)
+    async with _escrita():
+        rota = await db.run_sync(_reaproveitar_rota_atual, db_quadro, locais_ordenados, coordenadas, impressao_digital)
+    if rota is None:
+        await _liberar_conexao(db)
+        matrizes = await construir_matrizes_de_custo_detalhado_async(coordenadas)
+        matriz_tempos, matriz_distancias = crud._matrizes_sem_falhas(matrizes)
+        rota_atual = crud._ordem_da_rota_atual(db_quadro, matriz_tempos)
+        rota_solucao = await resolver_rota_quadro_em_processo(matriz_tempos, matriz_distancias, configuracao,
+                                                              rota_atual["ordem"] if rota_atual else None)
+        async with _escrita():
+            rota = await db.run_sync(_gravar_matrizes_e_solucao, db_quadro, locais_ordenados, coordenadas, impressao_digital,
+                                     rota_solucao, matriz_tempos, matriz_distancias)
+    return await get_rota(db, rota_id=rota.id)
+
+def _recarregar_rota(db, db_quadro):
+    """
+    Relê a rota do quadro e as suas paradas. db_quadro foi carregado antes das esperas
+    (geocodificação, GraphHopper, OR-Tools), e nesse meio tempo outra geração do mesmo
+    quadro (um clique duplo, outro planejador) pode ter gravado ou trocado a rota.
+    """
+    db.refresh(db_quadro, ["rota"])
+    if db_quadro.rota is not None:
+        db.refresh(db_quadro.rota, ["paradas"])
+
+def _reaproveitar_rota_atual(db, db_quadro, locais_ordenados, coordenadas, impressao_digital):
+    """crud._reaproveitar_rota sobre a rota atual do quadro."""
+    _recarregar_rota(db, db_quadro)
+    return crud._reaproveitar_rota(db, db_quadro, locais_ordenados, coordenadas, impressao_digital, _sem_progresso)
+
+def _gravar_matrizes_e_solucao(db, db_quadro, locais_ordenados, coordenadas, impressao_digital,
+                               rota_solucao, matriz_tempos, matriz_distancias):
+    """
+    Matrizes e rota numa única transação, aberta só depois do OR-Tools. Se outra geração
+    gravou nesse meio tempo uma rota com a mesma impressão digital, ela é mantida; se a rota
+    mudou por outro motivo, a solução é comparada com a rota como ela está agora.
+    """
+    _recarregar_rota(db, db_quadro)
+    if crud._rota_em_dia(db_quadro, impressao_digital):
+        print(f"Rota ID={db_quadro.rota.id} já foi gravada por outra geração com as mesmas entradas.")
+        db.commit()
+        return db_quadro.rota
+    rota_atual = crud._ordem_da_rota_atual(db_quadro, matriz_tempos)
+    salvar_matrizes_quadro(db, db_quadro.id, locais_ordenados, coordenadas, matriz_tempos, matriz_distancias)
+    return crud._gravar_solucao(db, db_quadro, locais_ordenados, coordenadas, impressao_digital,
+                                rota_solucao, rota_atual, matriz_tempos, matriz_distancias, _sem_progresso)
+
+# ==========================================================
+# PDF
+# ==========================================================
+
+async def _desenhar_pdf(mapa_id: int, versao: int) -> bytes:
+    # Sessão própria: o desenho é compartilhado e não pode depender da requisição que o iniciou
+    async with AsyncSessionLocal() as db:
+        db_mapa = await get_mapa_transporte(db, mapa_id=mapa_id, perfil=crud.PERFIL_PDF)
+    # O ReportLab é só CPU: numa thread, para não parar o event loop
+    conteudo = await asyncio.to_thread(generate_pdf.gerar_pdf, db_mapa)
+    guardar_pdf(mapa_id, versao, conteudo)
+    return conteudo
+
+async def get_mapa_consolidado_pdf(db: AsyncSession, mapa_id: int) -> Optional[tuple]:
+    """
+    Versão assíncrona de crud.get_mapa_consolidado_pdf (None se o mapa não existe).
+    Downloads simultâneos de uma versão ainda fora do cache esperam um único desenho.
+    """
+    versao = await get_versao_mapa_transporte(db, mapa_id=mapa_id)
+    if not versao:
+        return None
+    chave = (mapa_id, versao.versao_conteudo)
+    conteudo = buscar_pdf(*chave)
+    if conteudo is None:
+        desenho = _pdfs_em_andamento.get(chave)
+        if desenho is None:
+            desenho = asyncio.ensure_future(_desenhar_pdf(*chave))
+            _pdfs_em_andamento[chave] = desenho
+            desenho.add_done_callback(lambda _: _pdfs_em_andamento.pop(chave, None))
+        # shield: quem desistir do download não cancela o desenho dos demais
+        conteudo = await asyncio.shield(desenho)
+    return versao.nome, conteudo
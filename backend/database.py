@@ -1,16 +1,125 @@
+import os
+from alembic import command
+from alembic.config import Config
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = "sqlite:///./logistica.db"
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./logistica.db")
+
+# Migração que corresponde ao schema criado pelo antigo create_all, antes das migrações
+REVISAO_SCHEMA_INICIAL = "0001"
+
+
+def _url_async(url: str) -> str:
+    """
+    URL do driver assíncrono equivalente (DATABASE_URL_ASYNC, se definida, tem precedência):
+    SQLite via aiosqlite e PostgreSQL via psycopg (versão 3, que serve aos dois modos).
+    """
+    if os.getenv("DATABASE_URL_ASYNC"):
+        return os.getenv("DATABASE_URL_ASYNC")
+    esquema, resto = url.split("://", 1)
+    if esquema.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{resto}"
+    if esquema.startswith("postgresql"):
+        return f"postgresql+psycopg://{resto}"
+    return url
+
+
+def _configurar_sqlite(engine):
+    """
+    PRAGMAs aplicados a cada conexão SQLite: WAL (leitores não bloqueiam o escritor, o que
+    importa durante a geração de rotas em paralelo), synchronous=NORMAL (seguro com WAL),
+    cache de páginas e mmap maiores e espera pelo lock em vez de falhar na hora.
+    """
+    @event.listens_for(engine, "connect")
+    def _aplicar_pragmas(conexao_dbapi, _registro):
+        cursor = conexao_dbapi.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', '65536'))}")
+        cursor.execute(f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_BYTES', str(256 * 1024 * 1024)))}")
+        cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+
+def criar_engine(url: str = DATABASE_URL):
+    """
+    Cria o engine para a URL (DATABASE_URL). SQLite recebe os PRAGMAs de _configurar_sqlite;
+    os demais bancos (PostgreSQL, ex.: postgresql+psycopg://...) usam um pool de conexões
+    configurável por DB_POOL_SIZE, DB_MAX_OVERFLOW e DB_POOL_RECYCLE_S.
+    """
+    if url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+        _configurar_sqlite(engine)
+        return engine
+    return create_engine(
+        url,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE_S", "1800")),
+        pool_pre_ping=True,
+    )
+
+
+def criar_engine_async(url: str = DATABASE_URL):
+    """
+    Engine assíncrono para a mesma base de criar_engine (ver _url_async), com os mesmos
+    PRAGMAs no SQLite e o mesmo pool nos demais bancos. Usado pelos endpoints `async def`.
+    """
+    url_async = _url_async(url)
+    if url_async.startswith("sqlite"):
+        engine_async = create_async_engine(url_async)
+        _configurar_sqlite(engine_async.sync_engine)
+        return engine_async
+    return create_async_engine(
+        url_async,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE_S", "1800")),
+        pool_pre_ping=True,
+    )
+
+
+engine = criar_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine_async = criar_engine_async()
+# expire_on_commit=False: depois do commit a resposta é serializada fora do greenlet da sessão,
+# onde um atributo expirado não pode mais ser recarregado
+AsyncSessionLocal = async_sessionmaker(engine_async, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
+
+
+def atualizar_schema():
+    """
+    Aplica as migrações pendentes (equivalente a `alembic upgrade head` na pasta backend).
+    Bases criadas pelo antigo create_all, sem a tabela alembic_version, são marcadas como
+    REVISAO_SCHEMA_INICIAL antes, e as migrações seguintes completam o que faltar nelas.
+    """
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    config = Config(os.path.join(pasta, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(pasta, "migracoes"))
+    with engine.begin() as conexao:
+        config.attributes["connection"] = conexao
+        tabelas = set(inspect(conexao).get_table_names())
+        if "quadros" in tabelas and "alembic_version" not in tabelas:
+            command.stamp(config, REVISAO_SCHEMA_INICIAL)
+        command.upgrade(config, "head")
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_db_async():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,3 +1,4 @@
+from io import BytesIO
 from reportlab.lib.pagesizes import landscape, letter
 from reportlab.platypus import SimpleDocTemplate, Spacer, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -22,16 +23,18 @@ def formatar_distancia(quilometros: float) -> str:
 
 # --- Função Principal de Geração de PDF ---
 
-def gerar_pdf(db_mapa: MapaTransporte):
+def gerar_pdf(db_mapa: MapaTransporte) -> bytes:
     """
     Gera um PDF com layout e dados fixos, corrigindo os problemas de alinhamento,
     espaçamento, cores e quebra de texto para espelhar fielmente o anexo.
+    O documento é desenhado em memória e retornado como bytes: downloads simultâneos
+    não compartilham arquivo.
     """
-    nome_ficheiro = "mapa_de_transporte_layout.pdf"
+    buffer = BytesIO()
     quadros = db_mapa.quadros
     # --- Configuração do Documento ---
     # Usamos margens menores para maximizar o espaço horizontal
-    doc = SimpleDocTemplate(nome_ficheiro, pagesize=landscape(letter),
+    doc = SimpleDocTemplate(buffer, pagesize=landscape(letter),
                             leftMargin=0.25*inch, rightMargin=0.25*inch,
                             topMargin=0.25*inch, bottomMargin=0.25*inch)
 
@@ -239,6 +242,6 @@ def gerar_pdf(db_mapa: MapaTransporte):
 
     # Constrói o PDF
     doc.build(story)
-    print(f"PDF '{nome_ficheiro}' gerado com sucesso!")
+    print(f"PDF do mapa '{db_mapa.nome}' gerado com sucesso!")
 
-    return nome_ficheiro
+    return buffer.getvalue()
@@ -1,112 +1,350 @@
+import asyncio
+import httpx
 import requests
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from constants import NOMINATIM_TEXT
 from constants import LOCATION_IQ_TEXT
-from constants import INSERCAO_MANUAL
+from constants import CENTROIDE_CEP_TEXT
+from constants import CENTROIDE_BAIRRO_TEXT
 from constants import SUCESSO_TEXT
 from constants import AVISO_TEXT
 from constants import ERROR_TEXT
+from cache_geocodes import normalizar_endereco
+from cache_geocodes import buscar_geocode
+from cache_geocodes import salvar_geocode
+from cep_centroides import buscar_centroide_cep
+from cep_centroides import buscar_centroide_bairro
+from http_async import requisitar
 
-enderecos = [
-    "R. Câmara Cascudo, 1961, Portal do Sol - Extremoz",
-    "R. Caminho Novo, 100 - Nossa Senhora da Apresentação",
-    "Av. Três Américas, 475 - Lagoa Azul, Natal - RN, 59129-690",
-    "Cond. Parque Residencial Serrambi V R. Lajes, 91 - Nova Parnamirim",
-    "R. Praia de Muriú, 2001 - Nova Parnamirim",
-    "R. Serra do Carmo, 60 - Nova Parnamirim",
-    "R. Caraú, 50 - Nova Parnamirim",
-    "R. Aeroporto de Ponta Porã, 122 - Emaus, Parnamirim/RN",
-    "R. Miramangue, 315 - Planalto",
-    "Condomínio Quatro Estações Av. das Brancas Dunas, 65 - Candelária",
-    "R. Eletricista Elias Ferreira, 2600 - Candelária",
-    "R. Lucia viveiros, 255 (Cond. Central Park) - Neópolis",
-    "Rua Milton Santos 13. Lagoa Nova - Natal/RN",
-    "Av. Lima e Silva, 1527 - Nossa Senhora de Nazaré",
-    "R. Estácio de Sá, 75 - Lagoa Nova",
-    "R. Francisco Simplicio, 145 - Vila de Ponta Negra",
-    "Av. Praia de Muriú, 9148 - Ponta Negra",
-    "R. Ismael Pereira da Silva, 1756 - Capim Macio",
-    "Av. Governador José Varela, 2951 - Capim Macio, Natal/RN",
-    "R. Sampaio Correia - Nossa Sra. de Nazaré, Natal - RN, 59060-150",
-    "R. Delmiro Gouveia, 2855 - Neópolis",
-    "R. Alberto Maranhão, 1122 - Tirol",
-    "Rua Parque Embu-guaçu 156 - Nova Esperança, Parnamirim/RN",
-    "Rua Parque Abrolhos, 99 - Nova Esperança. Parnamirim",
-    "R. Princesa Isabel, 749 - Cidade Alta, Natal - RN, 59012-400"
-]
-
-enderecos_invalidos = [
-        (-5.741643, -35.2679834),
-        (-5.885666, -35.2021986),
-        (-5.8562527, -35.2534115),
-        (-5.8446895, -35.2159314),
-        (-5.8606901, -35.2135356),
-        (-5.8646144, -35.191077),
-        (-5.8064121, -35.2334489),
-        (-5.9467014, -35.2774133),
-        (-5.9513001, -35.2768802)
-    ]
+class LimitadorProvedor:
+    """
+    Limita as chamadas a um provedor: no máximo `max_concorrencia` requisições simultâneas
+    e, se `max_qps` > 0, um intervalo mínimo de 1/max_qps segundos entre o início de duas delas.
+    """
 
-def geocode_nominatim_local(endereco):
-    """Tenta geocodificar usando o servidor Nominatim local."""
+    def __init__(self, max_concorrencia, max_qps):
+        self._semaforo = threading.BoundedSemaphore(max(1, max_concorrencia))
+        self._intervalo = 1.0 / max_qps if max_qps > 0 else 0.0
+        self._proxima_liberacao = 0.0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._semaforo.acquire()
+        if self._intervalo:
+            espera = self._reservar_intervalo()
+            if espera > 0:
+                time.sleep(espera)
+        return self
+
+    def __exit__(self, *exc):
+        self._semaforo.release()
+        return False
+
+    def _reservar_intervalo(self):
+        """Reserva o próximo horário de início e retorna quanto esperar até ele."""
+        with self._lock:
+            agora = time.monotonic()
+            espera = self._proxima_liberacao - agora
+            self._proxima_liberacao = max(agora, self._proxima_liberacao) + self._intervalo
+        return espera
+
+    async def __aenter__(self):
+        # Mesmo semáforo do uso síncrono (o limite é do provedor), mas sem bloquear o event loop
+        while not self._semaforo.acquire(blocking=False):
+            await asyncio.sleep(0.05)
+        if self._intervalo:
+            espera = self._reservar_intervalo()
+            if espera > 0:
+                await asyncio.sleep(espera)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._semaforo.release()
+        return False
+
+
+class CircuitBreaker:
+    """
+    Abre o circuito de um provedor após `limite_falhas` falhas seguidas. Enquanto aberto,
+    os endereços vão direto para o próximo provedor. Após `tempo_aberto_s` segundos o
+    circuito fica meio-aberto: uma única chamada de teste é liberada (as demais continuam
+    pulando o provedor); se ela funcionar o circuito fecha, se falhar ele reabre na hora.
+    """
+
+    def __init__(self, limite_falhas, tempo_aberto_s):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto_s = tempo_aberto_s
+        self._falhas_seguidas = 0
+        self._aberto_ate = None  # None: circuito fechado
+        self._teste_ate = 0.0    # Chamada de teste em andamento até este instante
+        self._lock = threading.Lock()
+
+    def permite_chamada(self):
+        with self._lock:
+            if self._aberto_ate is None:
+                return True
+            agora = time.monotonic()
+            if agora < self._aberto_ate or agora < self._teste_ate:
+                return False
+            # Meio-aberto: esta é a chamada de teste. O prazo libera outra se ela nunca
+            # chegar a registrar sucesso ou falha (exceção não tratada por quem chamou).
+            self._teste_ate = agora + self.tempo_aberto_s
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._falhas_seguidas = 0
+            self._aberto_ate = None
+            self._teste_ate = 0.0
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas_seguidas += 1
+            if self._aberto_ate is not None or self._falhas_seguidas >= self.limite_falhas:
+                # Falha com o circuito meio-aberto (ou no limite): reabre já
+                self._aberto_ate = time.monotonic() + self.tempo_aberto_s
+                self._teste_ate = 0.0
+                self._falhas_seguidas = 0
+
+
+def _criar_provedores():
+    limite_falhas = int(os.getenv("GEOCODE_CIRCUIT_FALHAS", "3"))
+    tempo_aberto_s = float(os.getenv("GEOCODE_CIRCUIT_ABERTO_S", "60"))
+    return {
+        NOMINATIM_TEXT: {
+            "limitador": LimitadorProvedor(
+                int(os.getenv("NOMINATIM_MAX_CONCURRENCY", "4")),
+                float(os.getenv("NOMINATIM_MAX_QPS", "0")),
+            ),
+            "circuito": CircuitBreaker(limite_falhas, tempo_aberto_s),
+        },
+        LOCATION_IQ_TEXT: {
+            "limitador": LimitadorProvedor(
+                int(os.getenv("LOCATIONIQ_MAX_CONCURRENCY", "2")),
+                float(os.getenv("LOCATIONIQ_MAX_QPS", "2")),
+            ),
+            "circuito": CircuitBreaker(limite_falhas, tempo_aberto_s),
+        },
+    }
+
+PROVEDORES = _criar_provedores()
+
+def _url_nominatim(endereco):
     url_nominatim = os.getenv("NOMINATIM_BASE_URL", "http://localhost:8080")
-    url = f"{url_nominatim}/search?q={endereco}&format=json"
-    try:
-        response = requests.get(url, timeout=2)
-        response.raise_for_status()
-        data = response.json()
-        if data:
-            lat, lon = data[0]['lat'], data[0]['lon']
-            return (lat, lon)
-    except requests.exceptions.RequestException as error:
-        print(error)
-    return None
+    return f"{url_nominatim}/search?q={endereco}&format=json"
 
-def geocode_locationiq(endereco):
-    """Tenta geocodificar usando a API online do LocationIQ."""
+def _url_locationiq(endereco):
+    """URL de busca do LocationIQ, ou None se não houver chave configurada."""
     api_key = os.getenv("LOCATIONIQ_API_KEY")
     if not api_key:
         return None
     url_locationiq = os.getenv("LOCATIONIQ_BASE_URL", "https://us1.locationiq.com/v1/search.php")
-    url = f"{url_locationiq}?key={api_key}&q={endereco}&format=json"
-    try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        if data:
-            lat, lon = data[0]['lat'], data[0]['lon']
-            return (lat, lon)
-        print(f"\t\t  [{LOCATION_IQ_TEXT}] - [{AVISO_TEXT}] Endereço não encontrado: {endereco}")
-    except requests.exceptions.RequestException as e:
-        print(e)
+    return f"{url_locationiq}?key={api_key}&q={endereco}&format=json"
+
+def _primeira_coordenada(data, fonte, endereco):
+    if data:
+        lat, lon = data[0]['lat'], data[0]['lon']
+        return (lat, lon)
+    print(f"\t\t  [{fonte}] - [{AVISO_TEXT}] Endereço não encontrado: {endereco}")
     return None
 
-def geocode(enderecos):
+def geocode_nominatim_local(endereco):
     """
-    Função principal de geocodificação.
-    Tenta o Nominatim local primeiro e usa o LocationIQ como fallback.
+    Tenta geocodificar usando o servidor Nominatim local.
+    Retorna None se o endereço não for encontrado e propaga erros de rede/HTTP.
     """
-    print("--- Iniciando Geocodificação ---")
-    coordenadas = []
-    # Ensejo para teste com dados do MT fornecido - Remover Abaixo
-    index_de_endereco_invalido = 0
-    
-    # Ensejo para teste com dados do MT fornecido - Remover Acima
-    for endereco in enderecos:
-        coordenadas_endereco = geocode_nominatim_local(endereco)
+    response = requests.get(_url_nominatim(endereco), timeout=2)
+    response.raise_for_status()
+    return _primeira_coordenada(response.json(), NOMINATIM_TEXT, endereco)
+
+def geocode_locationiq(endereco):
+    """
+    Tenta geocodificar usando a API online do LocationIQ.
+    Retorna None se não houver chave configurada ou se o endereço não for encontrado,
+    e propaga erros de rede/HTTP.
+    """
+    url = _url_locationiq(endereco)
+    if not url:
+        return None
+    response = requests.get(url, timeout=5)
+    response.raise_for_status()
+    return _primeira_coordenada(response.json(), LOCATION_IQ_TEXT, endereco)
+
+async def geocode_nominatim_local_async(endereco):
+    """Versão assíncrona de geocode_nominatim_local."""
+    response = await requisitar("GET", _url_nominatim(endereco), timeout=2)
+    response.raise_for_status()
+    return _primeira_coordenada(response.json(), NOMINATIM_TEXT, endereco)
+
+async def geocode_locationiq_async(endereco):
+    """Versão assíncrona de geocode_locationiq."""
+    url = _url_locationiq(endereco)
+    if not url:
+        return None
+    response = await requisitar("GET", url, timeout=5)
+    response.raise_for_status()
+    return _primeira_coordenada(response.json(), LOCATION_IQ_TEXT, endereco)
+
+def _consultar_provedores(endereco):
+    """
+    Percorre a cadeia de provedores (Nominatim -> LocationIQ) respeitando o limite de
+    cada um e pulando os que estão com o circuito aberto. Retorna (coordenadas, fonte).
+    """
+    cadeia = ((NOMINATIM_TEXT, geocode_nominatim_local), (LOCATION_IQ_TEXT, geocode_locationiq))
+    for fonte, funcao_geocode in cadeia:
+        provedor = PROVEDORES[fonte]
+        if not provedor["circuito"].permite_chamada():
+            continue
+        try:
+            with provedor["limitador"]:
+                coordenadas_endereco = funcao_geocode(endereco)
+        except (requests.exceptions.RequestException, ValueError, KeyError) as error:
+            print(f"\t\t  [{fonte}] - [{ERROR_TEXT}] {error}")
+            provedor["circuito"].registrar_falha()
+            continue
+        provedor["circuito"].registrar_sucesso()
+        if coordenadas_endereco:
+            return (float(coordenadas_endereco[0]), float(coordenadas_endereco[1])), fonte
+    return None, None
+
+async def _consultar_provedores_async(endereco):
+    """Versão assíncrona de _consultar_provedores, com os mesmos limites e circuitos."""
+    cadeia = ((NOMINATIM_TEXT, geocode_nominatim_local_async), (LOCATION_IQ_TEXT, geocode_locationiq_async))
+    for fonte, funcao_geocode in cadeia:
+        provedor = PROVEDORES[fonte]
+        if not provedor["circuito"].permite_chamada():
+            continue
+        try:
+            async with provedor["limitador"]:
+                coordenadas_endereco = await funcao_geocode(endereco)
+        except (httpx.HTTPError, ValueError, KeyError) as error:
+            print(f"\t\t  [{fonte}] - [{ERROR_TEXT}] {error}")
+            provedor["circuito"].registrar_falha()
+            continue
+        provedor["circuito"].registrar_sucesso()
+        if coordenadas_endereco:
+            return (float(coordenadas_endereco[0]), float(coordenadas_endereco[1])), fonte
+    return None, None
+
+def _geocode_centroide(endereco):
+    """
+    Coordenada aproximada sem rede: centroide do CEP e, se não houver, do bairro+cidade.
+    Aceita um EnderecoDB (usa os campos cep/bairro/cidade) ou texto livre (procura o CEP).
+    """
+    cep = getattr(endereco, "cep", None)
+    if cep is None:
+        encontrado = re.search(r"\b\d{5}-?\d{3}\b", str(endereco))
+        cep = encontrado.group(0) if encontrado else None
+    coordenadas_endereco = buscar_centroide_cep(cep)
+    if coordenadas_endereco:
+        return coordenadas_endereco, CENTROIDE_CEP_TEXT
+    coordenadas_endereco = buscar_centroide_bairro(getattr(endereco, "bairro", None), getattr(endereco, "cidade", None))
+    if coordenadas_endereco:
+        return coordenadas_endereco, CENTROIDE_BAIRRO_TEXT
+    return None, None
+
+def _buscar_em_cache(enderecos):
+    """
+    Normaliza os endereços e consulta o cache. Retorna (normalizados, resolvidos, pendentes):
+    resolvidos mapeia normalizado -> (coordenadas, fonte) e pendentes normalizado -> texto
+    a enviar aos provedores (um por endereço normalizado).
+    """
+    normalizados = [normalizar_endereco(endereco) for endereco in enderecos]
+    resolvidos = {}
+    pendentes = {}
+    for endereco, endereco_normalizado in zip(enderecos, normalizados):
+        if endereco_normalizado in resolvidos or endereco_normalizado in pendentes:
+            continue
+        em_cache = buscar_geocode(endereco_normalizado)
+        if em_cache:
+            resolvidos[endereco_normalizado] = ((em_cache[0], em_cache[1]), em_cache[2])
+        else:
+            pendentes[endereco_normalizado] = str(endereco)
+    return normalizados, resolvidos, pendentes
+
+def _montar_resultados(enderecos, normalizados, resolvidos):
+    resultados = []
+    for endereco, endereco_normalizado in zip(enderecos, normalizados):
+        coordenadas_endereco, fonte = resolvidos.get(endereco_normalizado, (None, None))
         if not coordenadas_endereco:
-            coordenadas_endereco = None # geocode_locationiq(endereco)
-            if not coordenadas_endereco:
-                coordenadas_invalidas = True
-                while coordenadas_invalidas:
-                    try:
-                        # Ensejo para teste com dados do MT fornecido - Remover Inicio
-                        coordenadas_endereco = enderecos_invalidos[index_de_endereco_invalido]
-                        coordenadas_invalidas = False
-                        index_de_endereco_invalido += 1
-                        # Ensejo para teste com dados do MT fornecido - Remover Fim
-                    except Exception as error:
-                        print("Error: ", error)
-        coordenadas.append(coordenadas_endereco)
+            # Fallback offline: coordenada aproximada pelo centroide do CEP ou do bairro
+            coordenadas_endereco, fonte = _geocode_centroide(endereco)
+        status = SUCESSO_TEXT if fonte in (NOMINATIM_TEXT, LOCATION_IQ_TEXT) else AVISO_TEXT if fonte else ERROR_TEXT
+        if status != SUCESSO_TEXT:
+            print(f"\t\t  [{fonte or '-'}] - [{status}] {endereco}")
+        resultados.append({
+            "endereco": str(endereco),
+            "coordenadas": coordenadas_endereco,
+            "fonte": fonte,
+            "status": status,
+        })
+    return resultados
+
+def geocode_em_lote(enderecos):
+    """
+    Geocodifica uma lista de endereços em paralelo (até GEOCODE_MAX_WORKERS de uma vez).
+    Consulta o cache de endereços normalizados (memória + banco) e só envia os misses
+    aos provedores; endereços iguais ou trivialmente diferentes custam uma única consulta.
+
+    Endereços que nenhum provedor encontra recebem o centroide do CEP (ou do bairro)
+    do índice offline. Aceita textos ou objetos EnderecoDB.
+
+    Retorna, na mesma ordem, um dicionário por endereço com "endereco", "coordenadas"
+    ((lat, lon) ou None), "fonte" (Nominatim, LocationIQ, Centroide CEP/Bairro) e "status".
+    """
+    print("--- Iniciando Geocodificação ---")
+    normalizados, resolvidos, pendentes = _buscar_em_cache(enderecos)
+
+    if pendentes:
+        max_workers = min(int(os.getenv("GEOCODE_MAX_WORKERS", "8")), len(pendentes))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {
+                executor.submit(_consultar_provedores, endereco): endereco_normalizado
+                for endereco_normalizado, endereco in pendentes.items()
+            }
+            for futuro in as_completed(futuros):
+                endereco_normalizado = futuros[futuro]
+                coordenadas_endereco, fonte = futuro.result()
+                if coordenadas_endereco:
+                    salvar_geocode(endereco_normalizado, *coordenadas_endereco, fonte)
+                    resolvidos[endereco_normalizado] = (coordenadas_endereco, fonte)
+
+    resultados = _montar_resultados(enderecos, normalizados, resolvidos)
+    print("--- Geocodificação Concluída ---\n")
+    return resultados
+
+async def geocode_em_lote_async(enderecos):
+    """
+    Versão assíncrona de geocode_em_lote, com o mesmo resultado. As consultas aos provedores
+    ficam pendentes no event loop (os limites de cada provedor continuam valendo); só o
+    acesso ao cache (curto) vai para uma thread.
+    """
+    print("--- Iniciando Geocodificação ---")
+    normalizados, resolvidos, pendentes = await asyncio.to_thread(_buscar_em_cache, enderecos)
+
+    if pendentes:
+        respostas = await asyncio.gather(*(_consultar_provedores_async(endereco) for endereco in pendentes.values()))
+        encontrados = {
+            endereco_normalizado: resposta
+            for endereco_normalizado, resposta in zip(pendentes, respostas)
+            if resposta[0]
+        }
+        for endereco_normalizado, (coordenadas_endereco, fonte) in encontrados.items():
+            await asyncio.to_thread(salvar_geocode, endereco_normalizado, *coordenadas_endereco, fonte)
+        resolvidos.update(encontrados)
+
+    resultados = _montar_resultados(enderecos, normalizados, resolvidos)
     print("--- Geocodificação Concluída ---\n")
-    return coordenadas
\ No newline at end of file
+    return resultados
+
+def geocode(enderecos):
+    """
+    Função principal de geocodificação.
+    Retorna a lista de coordenadas (lat, lon), ou None para os não encontrados,
+    na mesma ordem dos endereços recebidos.
+    """
+    return [resultado["coordenadas"] for resultado in geocode_em_lote(enderecos)]
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import httpx
+
+# Respostas que valem uma nova tentativa (mesmas do Retry da sessão síncrona do GraphHopper)
+STATUS_RETENTATIVA = (429, 500, 502, 503, 504)
+
+_cliente = None
+_laco_do_cliente = None
+
+
+def _cliente_http() -> httpx.AsyncClient:
+    """
+    Cliente HTTP assíncrono compartilhado (keep-alive) pelo geocodificador e pela matriz.
+    As conexões ficam presas ao event loop que as abriu: se o loop mudar (outro processo
+    de teste, asyncio.run de um script), um cliente novo é criado para o loop atual.
+    """
+    global _cliente, _laco_do_cliente
+    laco = asyncio.get_running_loop()
+    if _cliente is None or _laco_do_cliente is not laco:
+        _cliente = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=int(os.getenv("HTTP_ASYNC_MAX_CONEXOES", "100")),
+            max_keepalive_connections=int(os.getenv("HTTP_ASYNC_MAX_CONEXOES_OCIOSAS", "20")),
+        ))
+        _laco_do_cliente = laco
+    return _cliente
+
+
+async def requisitar(metodo: str, url: str, retentativas: int = 0, **kwargs) -> httpx.Response:
+    """
+    Faz a requisição pelo cliente compartilhado. Com `retentativas`, falhas de conexão e
+    respostas STATUS_RETENTATIVA são repetidas com backoff exponencial (0,3 s, 0,6 s, ...);
+    a última resposta (ou exceção) é devolvida a quem chamou. O `timeout` vale para conectar
+    e ler; a espera por uma conexão livre do pool não expira, como numa fila.
+    """
+    cliente = _cliente_http()
+    kwargs["timeout"] = httpx.Timeout(kwargs.get("timeout"), pool=None)
+    for tentativa in range(retentativas + 1):
+        ultima = tentativa == retentativas
+        try:
+            resposta = await cliente.request(metodo, url, **kwargs)
+        except httpx.TransportError:
+            if ultima:
+                raise
+        else:
+            if resposta.status_code not in STATUS_RETENTATIVA or ultima:
+                return resposta
+        await asyncio.sleep(0.3 * 2 ** tentativa)
+
+
+async def fechar_cliente_http():
+    """Fecha o cliente compartilhado (no encerramento da API)."""
+    global _cliente, _laco_do_cliente
+    if _cliente is not None:
+        await _cliente.aclose()
+    _cliente, _laco_do_cliente = None, None
@@ -0,0 +1,133 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import crud
+from database import SessionLocal
+
+JOB_PENDENTE = "pendente"
+JOB_EXECUTANDO = "executando"
+JOB_CONCLUIDO = "concluido"
+JOB_FALHOU = "falhou"
+
+# Poucos workers: cada job já paraleliza internamente a rede (geocodificação e matrizes),
+# e a fila limita quantos jobs podem esperar sem prender threads do servidor.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ROTA_JOBS_MAX_WORKERS", "2")),
+    thread_name_prefix="rota-job",
+)
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+class FilaDeJobsCheia(Exception):
+    """Há jobs demais aguardando execução."""
+
+
+class JobComOutraConfiguracao(Exception):
+    """O mapa já tem um job pendente ou em execução com outra configuração do solver."""
+
+
+def _max_pendentes():
+    return int(os.getenv("ROTA_JOBS_MAX_PENDENTES", "50"))
+
+
+def _max_historico():
+    return int(os.getenv("ROTA_JOBS_HISTORICO", "200"))
+
+
+def _mesma_configuracao(a, b):
+    """Compara duas ConfiguracaoSolver (ou None); campos não informados equivalem a ausentes."""
+    return (a.model_dump(exclude_none=True) if a else {}) == (b.model_dump(exclude_none=True) if b else {})
+
+
+def _descartar_jobs_antigos():
+    """Mantém em memória apenas os ROTA_JOBS_HISTORICO jobs finalizados mais recentes."""
+    finalizados = [job_id for job_id, job in _jobs.items() if job["status"] in (JOB_CONCLUIDO, JOB_FALHOU)]
+    for job_id in finalizados[:max(0, len(finalizados) - _max_historico())]:
+        del _jobs[job_id]
+
+
+def _atualizar_progresso(job, quadro_id, etapa, rota_id=None):
+    with _jobs_lock:
+        progresso = job["quadros"].setdefault(quadro_id, {"quadro_id": quadro_id, "etapa": None, "rota_id": None})
+        progresso["etapa"] = etapa
+        if rota_id is not None:
+            progresso["rota_id"] = rota_id
+
+
+def _executar_geracao_mapa(job):
+    with _jobs_lock:
+        job["status"] = JOB_EXECUTANDO
+        job["iniciado_em"] = datetime.now()
+    db = SessionLocal()
+    try:
+        rotas = crud.gerar_e_salvar_rota_otimizada_mt(
+            db,
+            job["mapa_id"],
+            progresso=lambda quadro_id, etapa, rota_id=None: _atualizar_progresso(job, quadro_id, etapa, rota_id),
+            configuracao_solver=job["configuracao_solver"],
+        )
+        with _jobs_lock:
+            job["rotas_ids"] = [rota.id for rota in rotas]
+            job["status"] = JOB_CONCLUIDO
+    except Exception as e:
+        print(f"[ERRO] Job {job['id']} falhou: {e}")
+        with _jobs_lock:
+            job["erro"] = str(e)
+            job["status"] = JOB_FALHOU
+    finally:
+        db.close()
+        with _jobs_lock:
+            job["finalizado_em"] = datetime.now()
+
+
+def enfileirar_geracao_mapa(mapa_id: int, configuracao_solver=None):
+    """
+    Enfileira a geração de rotas de todos os quadros de um mapa e retorna o job.
+    `configuracao_solver` (schemas.ConfiguracaoSolver) sobrepõe a configuração do mapa.
+    Se já houver um job pendente ou em execução para o mesmo mapa, retorna esse job; se ele
+    usa outra configuração, levanta JobComOutraConfiguracao (dois jobs gravariam as rotas
+    dos mesmos quadros ao mesmo tempo).
+    """
+    with _jobs_lock:
+        for job in _jobs.values():
+            if job["mapa_id"] == mapa_id and job["status"] in (JOB_PENDENTE, JOB_EXECUTANDO):
+                if not _mesma_configuracao(job["configuracao_solver"], configuracao_solver):
+                    raise JobComOutraConfiguracao(
+                        f"Já existe um job ({job['id']}) {job['status']} para o mapa {mapa_id} com outra configuração do solver. "
+                        "Aguarde a conclusão dele para gerar com esta configuração."
+                    )
+                return _copiar(job)
+        pendentes = sum(1 for job in _jobs.values() if job["status"] == JOB_PENDENTE)
+        if pendentes >= _max_pendentes():
+            raise FilaDeJobsCheia(f"Há {pendentes} jobs aguardando. Tente novamente em instantes.")
+        job = {
+            "id": uuid.uuid4().hex,
+            "mapa_id": mapa_id,
+            "status": JOB_PENDENTE,
+            "criado_em": datetime.now(),
+            "iniciado_em": None,
+            "finalizado_em": None,
+            "quadros": {},
+            "rotas_ids": [],
+            "erro": None,
+            "configuracao_solver": configuracao_solver,
+        }
+        _jobs[job["id"]] = job
+        _descartar_jobs_antigos()
+    _executor.submit(_executar_geracao_mapa, job)
+    return _copiar(job)
+
+
+def _copiar(job):
+    return {**job, "quadros": [dict(progresso) for progresso in job["quadros"].values()], "rotas_ids": list(job["rotas_ids"])}
+
+
+def obter_job(job_id: str):
+    """Retorna uma cópia do estado atual do job, ou None se ele não existir (ou já foi descartado)."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return _copiar(job) if job else None
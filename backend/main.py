@@ -1,28 +1,54 @@
+import os
+from contextlib import asynccontextmanager
 from typing import List
+from typing import Optional
+from urllib.parse import quote
 from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 load_dotenv()
 
 # FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import Response
 from fastapi import FastAPI
 from fastapi import Depends
 from fastapi import HTTPException
+from fastapi import Query
 
 import crud
+import crud_async
 import schemas
-import models
-import generate_pdf
+import jobs
+from cache_trechos import metricas_cache_trechos
+from cache_geocodes import metricas_cache_geocodes
+from cache_pdf import metricas_cache_pdf
 from database import get_db
-from database import engine
+from database import get_db_async
+from database import engine_async
+from database import atualizar_schema
+from http_async import fechar_cliente_http
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Aplica as migrações pendentes ao subir a API. Com vários workers (ou em deploys que
+    rodam `alembic upgrade head` antes), defina MIGRAR_NA_INICIALIZACAO=false.
+    No encerramento, fecha o cliente HTTP assíncrono e as conexões do engine assíncrono.
+    """
+    if os.getenv("MIGRAR_NA_INICIALIZACAO", "true").lower() != "false":
+        atualizar_schema()
+    yield
+    await fechar_cliente_http()
+    await engine_async.dispose()
 
-models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="API de Otimização de Rotas para Mapa de Transporte",
     description="API para gerir e otimizar o transporte de equipas de produção.",
-    version="0.0.1"
+    version="0.0.1",
+    lifespan=lifespan,
 )
 
 # Lista de "origens" (endereços de front-end) que têm permissão para aceder à sua API
@@ -49,9 +75,9 @@ def create_motorista(motorista: schemas.MotoristaCreate, db: Session = Depends(g
     return crud.create_motorista(db=db, motorista=motorista)
 
 @app.get("/api/motoristas/", response_model=List[schemas.Motorista], tags=["Recursos: Motoristas"])
-def read_motoristas(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_motoristas(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db_async)):
     """Lista todos os motoristas cadastrados."""
-    motoristas = crud.get_motoristas(db, skip=skip, limit=limit)
+    motoristas = await crud_async.get_motoristas(db, skip=skip, limit=limit)
     return motoristas
 
 @app.post("/api/veiculos/", response_model=schemas.Veiculo, tags=["Recursos: Veículos"])
@@ -64,9 +90,9 @@ def create_veiculo(veiculo: schemas.VeiculoCreate, db: Session = Depends(get_db)
         raise HTTPException(status_code=404, detail=str(e))
 
 @app.get("/api/veiculos/", response_model=List[schemas.Veiculo], tags=["Recursos: Veículos"])
-def read_veiculos(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_veiculos(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db_async)):
     """Lista todos os veículos cadastrados."""
-    veiculos = crud.get_veiculos(db, skip=skip, limit=limit)
+    veiculos = await crud_async.get_veiculos(db, skip=skip, limit=limit)
     return veiculos
 
 @app.post("/api/passageiros/", response_model=schemas.Passageiro, tags=["Recursos: Passageiros"])
@@ -98,9 +124,9 @@ def delete_passageiro(passageiro_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=409, detail=str(e))
 
 @app.get("/api/passageiros/", response_model=List[schemas.Passageiro], tags=["Recursos: Passageiros"])
-def read_passageiros(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_passageiros(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db_async)):
     """Lista todos os passageiros cadastrados."""
-    passageiros = crud.get_passageiros(db, skip=skip, limit=limit)
+    passageiros = await crud_async.get_passageiros(db, skip=skip, limit=limit)
     return passageiros
 
 # ==========================================================
@@ -120,51 +146,100 @@ def create_mapa_transporte(mapa: schemas.MapaTransporteCreate, db: Session = Dep
         raise HTTPException(status_code=404, detail=str(e))
 
 @app.get("/api/mapas_transporte/", response_model=List[schemas.MapaTransporte], tags=["Planejamento: Mapa de Transporte"])
-def read_mapas_transporte(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_mapas_transporte(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db_async)):
     """Lista todos os Mapas de Transporte."""
-    mapas = crud.get_mapas_transporte(db, skip=skip, limit=limit)
+    mapas = await crud_async.get_mapas_transporte(db, skip=skip, limit=limit)
     return mapas
 
+@app.get("/api/mapas_transporte/resumo/", response_model=schemas.PaginaMapasTransporte, tags=["Planejamento: Mapa de Transporte"])
+async def read_mapas_transporte_resumo(cursor: Optional[int] = None, limit: int = Query(50, ge=1, le=200), db: AsyncSession = Depends(get_db_async)):
+    """
+    Lista os Mapas de Transporte (mais recentes primeiro) só com os campos e contagens usados
+    nas listagens. Para a página seguinte, passe o `proximo_cursor` recebido como `cursor`.
+    """
+    return await crud_async.get_mapas_transporte_resumo(db, cursor=cursor, limit=limit)
+
 @app.get("/api/mapas_transporte/{mapa_id}", response_model=schemas.MapaTransporte, tags=["Planejamento: Mapa de Transporte"])
-def read_mapa_transporte(mapa_id: int, db: Session = Depends(get_db)):
+async def read_mapa_transporte(mapa_id: int, db: AsyncSession = Depends(get_db_async)):
     """Obtém os detalhes de um quadro específico."""
-    db_mapa_transporte = crud.get_mapa_transporte(db, mapa_id=mapa_id)
+    db_mapa_transporte = await crud_async.get_mapa_transporte(db, mapa_id=mapa_id)
     if db_mapa_transporte is None:
         raise HTTPException(status_code=404, detail="Mapa não encontrado")
     return db_mapa_transporte
 
-@app.post("/api/mapas_transporte/{mapa_id}/gerar_rota/", response_model=List[schemas.Rota], tags=["Execução: Geração de Rota"])
-def gerar_rota_para_mapa_de_transporte(mapa_id: int, db: Session = Depends(get_db)):
+@app.put("/api/mapas_transporte/{mapa_id}/configuracao_solver", response_model=schemas.MapaTransporte, tags=["Planejamento: Mapa de Transporte"])
+def update_configuracao_solver_mapa(mapa_id: int, configuracao: schemas.ConfiguracaoSolver, db: Session = Depends(get_db)):
+    """Define a configuração padrão do otimizador (estratégia, metaheurística, limites) para o mapa."""
+    try:
+        return crud.update_configuracao_solver_mapa(db=db, mapa_id=mapa_id, configuracao=configuracao)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/api/mapas_transporte/{mapa_id}/gerar_rota/", response_model=schemas.Job, status_code=202, tags=["Execução: Geração de Rota"])
+async def gerar_rota_para_mapa_de_transporte(mapa_id: int, configuracao_solver: Optional[schemas.ConfiguracaoSolver] = None,
+                                             db: AsyncSession = Depends(get_db_async)):
     """
-    Dispara a otimização de uma rota para um quadro específico, salva o resultado
-    e retorna a rota otimizada.
+    Enfileira a otimização das rotas de todos os quadros de um Mapa de Transporte e
+    retorna imediatamente o job. Acompanhe o progresso em GET /api/jobs/{job_id}.
+    O corpo opcional (ConfiguracaoSolver) sobrepõe a configuração do mapa só nesta geração.
     """
+    if await crud_async.get_versao_mapa_transporte(db, mapa_id=mapa_id) is None:
+        raise HTTPException(status_code=404, detail="Mapa de Transporte não encontrado.")
     try:
-        rotas_salva = crud.gerar_e_salvar_rota_otimizada_mt(db=db, mapa_id=mapa_id)
-        return rotas_salva
+        return jobs.enfileirar_geracao_mapa(mapa_id, configuracao_solver=configuracao_solver)
+    except jobs.FilaDeJobsCheia as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except jobs.JobComOutraConfiguracao as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/api/mapas_transporte/{mapa_id}/distribuir_passageiros/", response_model=schemas.DistribuicaoMapa, tags=["Execução: Geração de Rota"])
+def distribuir_passageiros_mapa(mapa_id: int, request: Optional[schemas.DistribuicaoMapaRequest] = None, db: Session = Depends(get_db)):
+    """
+    Distribui os passageiros entre os quadros com veículo do mapa, respeitando a capacidade
+    de cada veículo, e gera as rotas de todos eles numa única otimização.
+    """
+    request = request or schemas.DistribuicaoMapaRequest()
+    try:
+        distribuicao = crud.distribuir_passageiros_mapa(db=db, mapa_id=mapa_id, passageiros_ids=request.passageiros_ids,
+                                                        configuracao_solver=request.configuracao_solver, modo=request.modo)
+    except crud.DistribuicaoInviavel as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
-        # Erros de negócio (ex: quadro não encontrado, falta de passageiros)
-        raise HTTPException(status_code=404, detail=str(e))
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
-        # Outros erros (ex: falha na comunicação com o GraphHopper)
-        raise HTTPException(status_code=500, detail=f"Ocorreu um erro interno ao gerar a rota: {e}")
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro interno ao distribuir os passageiros: {e}")
+    if distribuicao is None:
+        raise HTTPException(status_code=404, detail="Mapa de Transporte não encontrado.")
+    return distribuicao
+
+@app.get("/api/jobs/{job_id}", response_model=schemas.Job, tags=["Execução: Geração de Rota"])
+async def read_job(job_id: str):
+    """Obtém o estado de um job de geração de rotas: etapa de cada quadro e IDs das rotas geradas."""
+    job = jobs.obter_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
 
 @app.get("/api/mapas_transporte/{mapa_id}/pdf", tags=["Execução"])
-def download_mapa_pdf(mapa_id: int, db: Session = Depends(get_db)):
+async def download_mapa_pdf(mapa_id: int, db: AsyncSession = Depends(get_db_async)):
     """
     Gera um PDF consolidado com todos os quadros e rotas de um Mapa de Transporte.
+    Enquanto o mapa não muda, os downloads seguintes saem do cache de PDFs.
     """
-    db_mapa = crud.get_mapa_transporte(db, mapa_id=mapa_id)
-    if not db_mapa:
+    pdf = await crud_async.get_mapa_consolidado_pdf(db, mapa_id=mapa_id)
+    if pdf is None:
         raise HTTPException(status_code=404, detail="Mapa de Transporte não encontrado")
-    # Chama a nova função que gera o PDF consolidado
-    caminho_do_pdf = generate_pdf.gerar_pdf(db_mapa)
-    
-    return FileResponse(
-        path=caminho_do_pdf,
-        media_type='application/pdf',
-        filename=f"mapa_consolidado_{db_mapa.nome}.pdf"
-    )
+    nome, conteudo = pdf
+    return _resposta_pdf(conteudo, f"mapa_consolidado_{nome}.pdf")
+
+def _resposta_pdf(conteudo: bytes, nome_arquivo: str) -> Response:
+    """PDF em memória como anexo (mesmo Content-Disposition que o FileResponse montaria)."""
+    nome_citado = quote(nome_arquivo)
+    if nome_citado != nome_arquivo:
+        disposicao = f"attachment; filename*=utf-8''{nome_citado}"
+    else:
+        disposicao = f'attachment; filename="{nome_arquivo}"'
+    return Response(content=conteudo, media_type="application/pdf", headers={"Content-Disposition": disposicao})
 
 
 # ==========================================================
@@ -180,15 +255,25 @@ def create_quadro(quadro: schemas.QuadroCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail=str(e))
 
 @app.get("/api/quadros/", response_model=List[schemas.Quadro], tags=["Planejamento: Quadro"])
-def read_quadros(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_quadros(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db_async)):
     """Lista todos os quadros de transporte criados."""
-    quadros = crud.get_quadros(db, skip=skip, limit=limit)
+    quadros = await crud_async.get_quadros(db, skip=skip, limit=limit)
     return quadros
 
+@app.get("/api/quadros/resumo/", response_model=schemas.PaginaQuadros, tags=["Planejamento: Quadro"])
+async def read_quadros_resumo(mapa_id: Optional[int] = None, cursor: Optional[int] = None, limit: int = Query(50, ge=1, le=200),
+                              db: AsyncSession = Depends(get_db_async)):
+    """
+    Lista os quadros (mais recentes primeiro, opcionalmente de um só mapa) com placa do
+    veículo, total de passageiros e se já há rota. Paginação por cursor, como em
+    /api/mapas_transporte/resumo/.
+    """
+    return await crud_async.get_quadros_resumo(db, mapa_id=mapa_id, cursor=cursor, limit=limit)
+
 @app.get("/api/quadros/{quadro_id}", response_model=schemas.Quadro, tags=["Planejamento: Quadro"])
-def read_quadro(quadro_id: int, db: Session = Depends(get_db)):
+async def read_quadro(quadro_id: int, db: AsyncSession = Depends(get_db_async)):
     """Obtém os detalhes de um quadro específico."""
-    db_quadro = crud.get_quadro(db, quadro_id=quadro_id)
+    db_quadro = await crud_async.get_quadro(db, quadro_id=quadro_id)
     if db_quadro is None:
         raise HTTPException(status_code=404, detail="Quadro não encontrado")
     return db_quadro
@@ -201,6 +286,36 @@ def update_quadro_associacoes(quadro_id: int, associacoes: schemas.AssociacaoQua
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@app.post("/api/quadros/{quadro_id}/passageiros/{passageiro_id}", response_model=schemas.Rota, tags=["Planejamento: Associar ao Quadro"])
+def adicionar_passageiro_ao_quadro(quadro_id: int, passageiro_id: int, polir: bool = False,
+                                   configuracao_solver: Optional[schemas.ConfiguracaoSolver] = None, db: Session = Depends(get_db)):
+    """
+    Adiciona um passageiro ao quadro e encaixa-o na rota atual pela inserção mais barata,
+    sem refazer a otimização. Com `polir=true`, o OR-Tools parte dessa rota para melhorá-la.
+    """
+    try:
+        return crud.atualizar_rota_incremental(db=db, quadro_id=quadro_id, adicionar_passageiro_id=passageiro_id,
+                                               polir=polir, configuracao_solver=configuracao_solver)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro interno ao atualizar a rota: {e}")
+
+@app.delete("/api/quadros/{quadro_id}/passageiros/{passageiro_id}", response_model=schemas.Rota, tags=["Planejamento: Associar ao Quadro"])
+def remover_passageiro_do_quadro(quadro_id: int, passageiro_id: int, polir: bool = False,
+                                 configuracao_solver: Optional[schemas.ConfiguracaoSolver] = None, db: Session = Depends(get_db)):
+    """
+    Remove um passageiro do quadro e repara a rota atual com 2-opt, sem refazer a otimização.
+    Com `polir=true`, o OR-Tools parte da rota reparada para melhorá-la.
+    """
+    try:
+        return crud.atualizar_rota_incremental(db=db, quadro_id=quadro_id, remover_passageiro_id=passageiro_id,
+                                               polir=polir, configuracao_solver=configuracao_solver)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro interno ao atualizar a rota: {e}")
+
 @app.delete("/api/quadros/{quadro_id}", response_model=schemas.Quadro, tags=["Planeamento"])
 def delete_quadro(quadro_id: int, db: Session = Depends(get_db)):
     """Apaga um Quadro de Transporte e desassocia seus passageiros."""
@@ -211,13 +326,15 @@ def delete_quadro(quadro_id: int, db: Session = Depends(get_db)):
     return db_quadro_apagado
 
 @app.post("/api/quadros/{quadro_id}/gerar_rota/", response_model=schemas.Rota, tags=["Execução: Geração de Rota"])
-def gerar_rota_para_mapa_de_transporte(quadro_id: int, db: Session = Depends(get_db)):
+async def gerar_rota_para_mapa_de_transporte(quadro_id: int, configuracao_solver: Optional[schemas.ConfiguracaoSolver] = None,
+                                             db: AsyncSession = Depends(get_db_async)):
     """
     Dispara a otimização de uma rota para um quadro específico, salva o resultado
-    e retorna a rota otimizada.
+    e retorna a rota otimizada. O corpo opcional (ConfiguracaoSolver) sobrepõe a
+    configuração do mapa só nesta geração.
     """
     try:
-        rotas_salva = crud.gerar_e_salvar_rota_otimizada(db=db, quadro_id=quadro_id)
+        rotas_salva = await crud_async.gerar_e_salvar_rota_otimizada(db=db, quadro_id=quadro_id, configuracao_solver=configuracao_solver)
         return rotas_salva
     except ValueError as e:
         # Erros de negócio (ex: quadro não encontrado, falta de passageiros)
@@ -227,9 +344,9 @@ def gerar_rota_para_mapa_de_transporte(quadro_id: int, db: Session = Depends(get
         raise HTTPException(status_code=500, detail=f"Ocorreu um erro interno ao gerar a rota: {e}")
 
 @app.get("/api/rotas/{rota_id}", response_model=schemas.Rota, tags=["Execução: Exibição de Rota"])
-def read_rota(rota_id: int, db: Session = Depends(get_db)):
+async def read_rota(rota_id: int, db: AsyncSession = Depends(get_db_async)):
     """Obtém os detalhes de uma rota otimizada específica."""
-    db_rota = crud.get_rota(db, rota_id=rota_id)
+    db_rota = await crud_async.get_rota(db, rota_id=rota_id)
     if db_rota is None:
         raise HTTPException(status_code=404, detail="Rota não encontrada")
     return db_rota
@@ -242,19 +359,28 @@ def read_rota(rota_id: int, db: Session = Depends(get_db)):
 def download_mapa_consolidado_pdf(mapa_id: int, db: Session = Depends(get_db)):
     """Gera um PDF consolidado com todos os quadros e rotas de um Mapa de Transporte."""
     try:
-        caminho_do_pdf = crud.get_mapa_consolidado_pdf_filepath(db=db, mapa_id=mapa_id)
-        
-        return FileResponse(
-            path=caminho_do_pdf,
-            media_type='application/pdf',
-            filename=f"mapa_consolidado_{mapa_id}.pdf"
-        )
+        _, conteudo = crud.get_mapa_consolidado_pdf(db=db, mapa_id=mapa_id)
+
+        return _resposta_pdf(conteudo, f"mapa_consolidado_{mapa_id}.pdf")
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ocorreu um erro ao gerar o PDF: {e}")
 
 # Em main.py
+@app.post("/api/quadros/{quadro_id}/avaliar_ordem_paradas/", response_model=schemas.AvaliacaoOrdem, tags=["Planeamento"])
+def avaliar_ordem_paradas_endpoint(quadro_id: int, request: schemas.OrdemParadasRequest, db: Session = Depends(get_db)):
+    """
+    Calcula, sem gravar, os horários de cada parada, a duração e a chegada de uma ordem
+    definida pelo utilizador, a partir das matrizes já guardadas do quadro.
+    """
+    try:
+        return crud.avaliar_ordem_paradas(db=db, quadro_id=quadro_id, passageiros_ids_ordenados=request.passageiros_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @app.put("/api/quadros/{quadro_id}/salvar_ordem_paradas/", response_model=schemas.Rota, tags=["Planeamento"])
 def salvar_ordem_paradas_endpoint(quadro_id: int, request: schemas.OrdemParadasRequest, db: Session = Depends(get_db)):
     try:
@@ -262,3 +388,22 @@ def salvar_ordem_paradas_endpoint(quadro_id: int, request: schemas.OrdemParadasR
         return rota_atualizada
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+
+# ==========================================================
+# MÉTRICAS
+# ==========================================================
+
+@app.get("/api/metricas/cache_trechos", tags=["Métricas"])
+async def read_metricas_cache_trechos():
+    """Contadores de hits/misses do cache persistente de trechos do GraphHopper."""
+    return metricas_cache_trechos()
+
+@app.get("/api/metricas/cache_geocodes", tags=["Métricas"])
+async def read_metricas_cache_geocodes():
+    """Contadores de hits/misses do cache de geocodificação por endereço normalizado."""
+    return metricas_cache_geocodes()
+
+@app.get("/api/metricas/cache_pdf", tags=["Métricas"])
+async def read_metricas_cache_pdf():
+    """Contadores do cache de PDFs dos mapas (hits, misses, descartes e bytes em memória)."""
+    return metricas_cache_pdf()
@@ -1,29 +1,484 @@
+import asyncio
 import os
+import threading
+import httpx
+import numpy as np
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from utils import formatar_tempo
+from cache_trechos import buscar_trechos
+from cache_trechos import salvar_trechos
+from cache_trechos import chave_trecho
+from clusterizacao import agrupar_coincidentes
+from http_async import requisitar
 
-def construir_matrizes_de_custo(coordenadas):
-    """Constrói uma matriz de tempo de viagem usando o GraphHopper local."""
-    print("--- Construindo Matriz de Custos (Tempo e Distância) ---")
-    graphhopper_url = os.getenv("GRAPHHOPPER_BASE_URL", "http://localhost:8989")
+# Códigos HTTP que indicam que o servidor GraphHopper não expõe o endpoint /matrix
+# (a versão open source self-hosted, por exemplo). Nesses casos caímos para o /route.
+STATUS_MATRIX_INDISPONIVEL = (404, 405, 501)
+
+# Estimativa dos pares não roteados no modo esparso, quando não há pares roteados para calibrar:
+# fator de desvio da rua em relação à linha reta e velocidade média (m/s)
+FATOR_DESVIO_PADRAO = 1.3
+VELOCIDADE_MEDIA_PADRAO = 30 / 3.6
+RAIO_TERRA_METROS = 6371000
+
+# Cache por URL base: evita sondar o /matrix a cada geração quando já sabemos que não existe.
+_matrix_api_disponivel = {}
+
+_sessao = None
+_sessao_lock = threading.Lock()
+
+
+class MatrixApiIndisponivel(Exception):
+    """O servidor GraphHopper não oferece o endpoint /matrix (ou ele falhou)."""
+
+
+def _graphhopper_url():
+    return os.getenv("GRAPHHOPPER_BASE_URL", "http://localhost:8989")
+
+
+def _max_concorrencia():
+    return max(1, int(os.getenv("GRAPHHOPPER_MAX_CONCURRENCY", "8")))
+
+
+def _timeout():
+    return float(os.getenv("GRAPHHOPPER_TIMEOUT", "10"))
+
+
+def _sessao_http():
+    """
+    Sessão HTTP compartilhada (keep-alive) com pool do tamanho da concorrência máxima
+    e retentativas com backoff exponencial para falhas de conexão e respostas 429/5xx.
+    """
+    global _sessao
+    with _sessao_lock:
+        if _sessao is None:
+            retentativas = Retry(
+                total=int(os.getenv("GRAPHHOPPER_RETRIES", "3")),
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET", "POST"),
+            )
+            adaptador = HTTPAdapter(pool_maxsize=_max_concorrencia(), max_retries=retentativas)
+            _sessao = requests.Session()
+            _sessao.mount("http://", adaptador)
+            _sessao.mount("https://", adaptador)
+        return _sessao
+
+
+def _blocos_matrix(coordenadas, pares_pendentes):
+    """
+    Divide a sub-matriz origens x destinos envolvida nos pares em blocos de até
+    GRAPHHOPPER_MATRIX_CHUNK_SIZE pontos por lado e gera (origens, destinos, payload)
+    para cada bloco que contém algum par pendente.
+    """
+    tamanho_bloco = int(os.getenv("GRAPHHOPPER_MATRIX_CHUNK_SIZE", "50"))
+    todas_origens = sorted({i for i, _ in pares_pendentes})
+    todos_destinos = sorted({j for _, j in pares_pendentes})
+    # O /matrix recebe os pontos no formato [lon, lat]
+    pontos = [[float(lon), float(lat)] for lat, lon in coordenadas]
+    for inicio_origem in range(0, len(todas_origens), tamanho_bloco):
+        origens = todas_origens[inicio_origem:inicio_origem + tamanho_bloco]
+        for inicio_destino in range(0, len(todos_destinos), tamanho_bloco):
+            destinos = todos_destinos[inicio_destino:inicio_destino + tamanho_bloco]
+            if not any((i, j) in pares_pendentes for i in origens for j in destinos):
+                continue
+            payload = {
+                "from_points": [pontos[i] for i in origens],
+                "to_points": [pontos[j] for j in destinos],
+                "out_arrays": ["times", "distances"],
+                "profile": "car",
+            }
+            yield origens, destinos, payload
+
+
+def _verificar_status_matrix(graphhopper_url, status_code):
+    if status_code in STATUS_MATRIX_INDISPONIVEL:
+        _matrix_api_disponivel[graphhopper_url] = False
+        raise MatrixApiIndisponivel(f"/matrix respondeu {status_code}")
+
+
+def _ler_bloco_matrix(data, origens, destinos, pares_pendentes, resultados, falhas):
+    """
+    Acrescenta a `resultados` os pares pendentes de um bloco respondido pelo /matrix; os
+    que vieram sem rota vão para `falhas`.
+    """
+    tempos, distancias = data.get("times"), data.get("distances")
+    if tempos is None or distancias is None:
+        raise MatrixApiIndisponivel("Resposta do /matrix sem 'times' ou 'distances'.")
+    for a, i in enumerate(origens):
+        for b, j in enumerate(destinos):
+            if (i, j) not in pares_pendentes:
+                continue
+            # Pares sem rota vêm como null: falha, nunca custo 0 na matriz (nem no cache de trechos)
+            if tempos[a][b] is None or distancias[a][b] is None:
+                falhas.append({"origem": i, "destino": j, "erro": "sem rota"})
+            else:
+                resultados[(i, j)] = (int(tempos[a][b]), int(distancias[a][b]))
+
+
+def _rotear_via_matrix_api(coordenadas, pares):
+    """
+    Roteia os pares (i, j) com chamadas em lote ao /matrix do GraphHopper, um bloco de
+    _blocos_matrix por chamada. Retorna ({(i, j): (tempo_s, distancia_m)}, falhas).
+    """
+    graphhopper_url = _graphhopper_url()
+    sessao = _sessao_http()
+    pares_pendentes = set(pares)
+    resultados = {}
+    falhas = []
+    for origens, destinos, payload in _blocos_matrix(coordenadas, pares_pendentes):
+        try:
+            response = sessao.post(f"{graphhopper_url}/matrix", json=payload, timeout=_timeout())
+            _verificar_status_matrix(graphhopper_url, response.status_code)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise MatrixApiIndisponivel(str(e)) from e
+        _ler_bloco_matrix(data, origens, destinos, pares_pendentes, resultados, falhas)
+
+    _matrix_api_disponivel[graphhopper_url] = True
+    return resultados, falhas
+
+
+async def _rotear_via_matrix_api_async(coordenadas, pares):
+    """Versão assíncrona de _rotear_via_matrix_api (cliente de http_async)."""
+    graphhopper_url = _graphhopper_url()
+    retentativas = int(os.getenv("GRAPHHOPPER_RETRIES", "3"))
+    pares_pendentes = set(pares)
+    resultados = {}
+    falhas = []
+    for origens, destinos, payload in _blocos_matrix(coordenadas, pares_pendentes):
+        try:
+            response = await requisitar("POST", f"{graphhopper_url}/matrix", retentativas, json=payload, timeout=_timeout())
+            _verificar_status_matrix(graphhopper_url, response.status_code)
+            response.raise_for_status()
+            data = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise MatrixApiIndisponivel(str(e)) from e
+        _ler_bloco_matrix(data, origens, destinos, pares_pendentes, resultados, falhas)
+
+    _matrix_api_disponivel[graphhopper_url] = True
+    return resultados, falhas
+
+
+def _url_route(origem, destino):
+    return f"{_graphhopper_url()}/route?point={origem[0]},{origem[1]}&point={destino[0]},{destino[1]}&type=json&profile=car"
+
+
+def _rotear_par(sessao, origem, destino):
+    """Consulta o /route para um par origem -> destino e retorna (tempo_s, distancia_m)."""
+    response = sessao.get(_url_route(origem, destino), timeout=_timeout())
+    response.raise_for_status()
+    data = response.json()
+    return data['paths'][0]['time'] // 1000, int(data['paths'][0]['distance'])
+
+
+async def _rotear_par_async(limite, origem, destino):
+    """Versão assíncrona de _rotear_par; `limite` é o semáforo da concorrência máxima."""
+    async with limite:
+        response = await requisitar("GET", _url_route(origem, destino), int(os.getenv("GRAPHHOPPER_RETRIES", "3")),
+                                    timeout=_timeout())
+    response.raise_for_status()
+    data = response.json()
+    return data['paths'][0]['time'] // 1000, int(data['paths'][0]['distance'])
+
+
+def _rotear_via_route(coordenadas, pares):
+    """
+    Roteia os pares (i, j) com uma chamada ao /route para cada um.
+    Os pares são enviados em paralelo por um pool de até GRAPHHOPPER_MAX_CONCURRENCY
+    threads, compartilhando a mesma sessão HTTP (keep-alive).
+    Retorna ({(i, j): (tempo_s, distancia_m)}, falhas).
+    """
+    resultados = {}
+    falhas = []
+    if not pares:
+        return resultados, falhas
+
+    sessao = _sessao_http()
+    with ThreadPoolExecutor(max_workers=min(_max_concorrencia(), len(pares))) as executor:
+        futuros = {
+            executor.submit(_rotear_par, sessao, coordenadas[i], coordenadas[j]): (i, j)
+            for i, j in pares
+        }
+        for futuro in as_completed(futuros):
+            i, j = futuros[futuro]
+            try:
+                resultados[(i, j)] = futuro.result()
+            except (requests.exceptions.RequestException, KeyError, IndexError, ValueError) as e:
+                falhas.append({"origem": i, "destino": j, "erro": str(e)})
+    return resultados, falhas
+
+
+async def _rotear_via_route_async(coordenadas, pares):
+    """
+    Versão assíncrona de _rotear_via_route: as chamadas ficam pendentes no event loop
+    (até GRAPHHOPPER_MAX_CONCURRENCY de uma vez), sem ocupar uma thread por par.
+    """
+    resultados = {}
+    falhas = []
+    limite = asyncio.Semaphore(_max_concorrencia())
+    respostas = await asyncio.gather(
+        *(_rotear_par_async(limite, coordenadas[i], coordenadas[j]) for i, j in pares),
+        return_exceptions=True,
+    )
+    for (i, j), resposta in zip(pares, respostas):
+        if isinstance(resposta, (httpx.HTTPError, KeyError, IndexError, ValueError)):
+            falhas.append({"origem": i, "destino": j, "erro": str(resposta)})
+        elif isinstance(resposta, BaseException):
+            raise resposta
+        else:
+            resultados[(i, j)] = resposta
+    return resultados, falhas
+
+
+def _raio_agrupamento_metros():
+    return float(os.getenv("PARADAS_RAIO_AGRUPAMENTO_M", "10"))
+
+
+def _distancias_haversine(coordenadas):
+    """Matriz N x N das distâncias em linha reta (m) entre os pontos (lat, lon)."""
+    pontos = np.radians(np.asarray(coordenadas, dtype=float).reshape(-1, 2))
+    lat, lon = pontos[:, 0], pontos[:, 1]
+    h = (np.sin((lat[:, None] - lat[None, :]) / 2) ** 2
+         + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin((lon[:, None] - lon[None, :]) / 2) ** 2)
+    return 2 * RAIO_TERRA_METROS * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+def _pares_esparsos(linha_reta, extremos, vizinhos):
+    """
+    Pares (i, j) que valem ser roteados no modo esparso: cada ponto com os seus `vizinhos`
+    mais próximos em linha reta (nos dois sentidos) e todos os pares que envolvem os extremos
+    (origens e destinos), que participam de qualquer rota.
+    """
+    num_locais = len(linha_reta)
+    distancias = linha_reta.copy()
+    np.fill_diagonal(distancias, np.inf)
+    k = min(vizinhos, num_locais - 1)
+    mais_proximos = np.argpartition(distancias, k - 1, axis=1)[:, :k]
+    selecionados = np.zeros((num_locais, num_locais), dtype=bool)
+    selecionados[np.arange(num_locais)[:, None], mais_proximos] = True
+    selecionados |= selecionados.T
+    extremos = list(extremos)
+    selecionados[extremos, :] = True
+    selecionados[:, extremos] = True
+    np.fill_diagonal(selecionados, False)
+    return {(int(i), int(j)) for i, j in zip(*np.nonzero(selecionados))}
+
+
+def _estimar_pares(linha_reta, conhecidos, pares):
+    """
+    Estima (tempo_s, distancia_m) dos pares não roteados: linha reta x fator de desvio, à
+    velocidade média. Fator e velocidade são as medianas dos pares conhecidos desta matriz
+    (ou FATOR_DESVIO_PADRAO / VELOCIDADE_MEDIA_PADRAO se não houver nenhum utilizável).
+    """
+    amostras = [
+        (distancia / linha_reta[i][j], distancia / tempo)
+        for (i, j), (tempo, distancia) in conhecidos.items()
+        if linha_reta[i][j] > 0 and tempo > 0 and distancia > 0
+    ]
+    fator_desvio, velocidade = FATOR_DESVIO_PADRAO, VELOCIDADE_MEDIA_PADRAO
+    if amostras:
+        fator_desvio, velocidade = np.median(np.asarray(amostras), axis=0)
+    estimados = {}
+    for i, j in pares:
+        distancia = float(linha_reta[i][j]) * fator_desvio
+        estimados[(i, j)] = (int(round(distancia / velocidade)), int(round(distancia)))
+    return estimados
+
+
+def construir_matrizes_de_custo_detalhado(coordenadas, extremos=None):
+    """
+    Constrói as matrizes de tempo (s) e distância (m) usando o GraphHopper local.
+    Os pares já conhecidos vêm do cache persistente de trechos; apenas os misses são roteados,
+    pelo endpoint em lote /matrix quando disponível ou pelo /route par a par caso contrário.
+
+    Locais coincidentes (a até PARADAS_RAIO_AGRUPAMENTO_M metros, padrão 10) viram um único
+    nó no roteamento e a matriz é expandida de volta: entre eles o custo é 0 e as linhas e
+    colunas são iguais. Passageiros do mesmo endereço não multiplicam os pares roteados.
+
+    Com MATRIZ_ESPARSA_MIN_LOCAIS pontos ou mais (padrão 60; 0 desativa), a matriz é esparsa:
+    só são roteados os pares entre cada ponto e os seus MATRIZ_ESPARSA_VIZINHOS vizinhos mais
+    próximos em linha reta (padrão 10) e os que envolvem os `extremos` (índices das origens e
+    destinos; por padrão o primeiro e o último ponto). Os demais pares, que dificilmente são
+    vizinhos numa boa rota, recebem a distância em linha reta x um fator de desvio calibrado
+    com os pares roteados. O otimizador continua recebendo a matriz completa, mas as chamadas
+    ao GraphHopper caem de O(N²) para O(N·k).
+
+    Retorna um dicionário com "tempos", "distancias", "metodo" ("cache", "matrix" ou "route"),
+    "trechos_em_cache", "pares_estimados", "locais_agrupados" e "falhas": a lista de pares
+    {"origem", "destino", "erro"} que não puderam ser roteados (esses ficam com 0 na matriz).
+    """
+    representantes, grupos, extremos_agrupados = _agrupar_locais(coordenadas, extremos)
+    resultado = _construir_matrizes_sem_repeticao([coordenadas[i] for i in representantes], extremos_agrupados)
+    return _expandir_matrizes(resultado, representantes, grupos)
+
+
+async def construir_matrizes_de_custo_detalhado_async(coordenadas, extremos=None):
+    """
+    Versão assíncrona de construir_matrizes_de_custo_detalhado, com o mesmo resultado.
+    As chamadas ao GraphHopper usam o cliente de http_async e não ocupam threads enquanto
+    esperam; só as consultas e gravações do cache de trechos (curtas) vão para uma thread.
+    """
+    representantes, grupos, extremos_agrupados = _agrupar_locais(coordenadas, extremos)
+    coordenadas_unicas = [coordenadas[i] for i in representantes]
+    plano = await asyncio.to_thread(_planejar_matrizes, coordenadas_unicas, extremos_agrupados)
+    roteados, metodo, falhas = {}, "cache", []
+    if plano["faltantes"]:
+        roteados, metodo, falhas = await _rotear_faltantes_async(coordenadas_unicas, plano["faltantes"])
+    resultado = await asyncio.to_thread(_concluir_matrizes, plano, roteados, metodo, falhas)
+    return _expandir_matrizes(resultado, representantes, grupos)
+
+
+def construir_linha_e_coluna_detalhado(coordenadas, indice):
+    """
+    Roteia só os pares que envolvem o local `indice` (a sua linha e a sua coluna), para
+    quando as matrizes dos demais locais já são conhecidas: os trechos vêm do cache e os
+    misses vão ao GraphHopper como em construir_matrizes_de_custo_detalhado. Retorna o
+    mesmo dicionário, com 0 nas células que não envolvem `indice`.
+    """
+    num_locais = len(coordenadas)
+    pares = [(indice, j) for j in range(num_locais) if j != indice] + [(i, indice) for i in range(num_locais) if i != indice]
+    chaves = {(i, j): chave_trecho(coordenadas[i], coordenadas[j]) for i, j in pares}
+    em_cache = buscar_trechos(chaves.values())
+    resultados = {par: em_cache[chave] for par, chave in chaves.items() if chave in em_cache}
+    plano = {
+        "num_locais": num_locais,
+        "pares": pares,
+        "chaves": chaves,
+        "resultados": resultados,
+        "faltantes": [par for par in pares if par not in resultados],
+        "estimados": [],
+        "linha_reta": None,
+    }
+    roteados, metodo, falhas = {}, "cache", []
+    if plano["faltantes"]:
+        roteados, metodo, falhas = _rotear_faltantes(coordenadas, plano["faltantes"])
+    resultado = _concluir_matrizes(plano, roteados, metodo, falhas)
+    resultado["locais_agrupados"] = 0
+    return resultado
+
+
+def _agrupar_locais(coordenadas, extremos):
+    """Agrupa os locais coincidentes: (representantes, grupo de cada local, extremos em grupos)."""
+    representantes, grupos = agrupar_coincidentes(coordenadas, _raio_agrupamento_metros())
+    extremos = extremos if extremos is not None else [0, len(coordenadas) - 1]
+    return representantes, grupos, sorted({grupos[i] for i in extremos if 0 <= i < len(coordenadas)})
+
+
+def _expandir_matrizes(resultado, representantes, grupos):
+    """Leva as matrizes (e as falhas) dos representantes de volta para todos os locais."""
+    for chave in ("tempos", "distancias"):
+        matriz = resultado[chave]
+        resultado[chave] = [[matriz[a][b] for b in grupos] for a in grupos]
+    for falha in resultado["falhas"]:
+        falha["origem"], falha["destino"] = representantes[falha["origem"]], representantes[falha["destino"]]
+    resultado["locais_agrupados"] = len(grupos) - len(representantes)
+    return resultado
+
+
+def _construir_matrizes_sem_repeticao(coordenadas, extremos):
+    plano = _planejar_matrizes(coordenadas, extremos)
+    roteados, metodo, falhas = {}, "cache", []
+    if plano["faltantes"]:
+        roteados, metodo, falhas = _rotear_faltantes(coordenadas, plano["faltantes"])
+    return _concluir_matrizes(plano, roteados, metodo, falhas)
+
+
+def _planejar_matrizes(coordenadas, extremos):
+    """
+    Separa os pares em: já em cache, a rotear e (no modo esparso) a estimar.
+    Retorna o plano usado por _concluir_matrizes.
+    """
     num_locais = len(coordenadas)
+    pares = [(i, j) for i in range(num_locais) for j in range(num_locais) if i != j]
+    chaves = {(i, j): chave_trecho(coordenadas[i], coordenadas[j]) for i, j in pares}
+
+    em_cache = buscar_trechos(chaves.values())
+    resultados = {par: em_cache[chave] for par, chave in chaves.items() if chave in em_cache}
+    faltantes = [par for par in pares if par not in resultados]
+    linha_reta, estimados = None, []
+
+    min_locais_esparsa = int(os.getenv("MATRIZ_ESPARSA_MIN_LOCAIS", "60"))
+    if faltantes and min_locais_esparsa and num_locais >= min_locais_esparsa:
+        linha_reta = _distancias_haversine(coordenadas)
+        a_rotear = _pares_esparsos(linha_reta, extremos, int(os.getenv("MATRIZ_ESPARSA_VIZINHOS", "10")))
+        estimados = [par for par in faltantes if par not in a_rotear]
+        faltantes = [par for par in faltantes if par in a_rotear]
+    return {
+        "num_locais": num_locais,
+        "pares": pares,
+        "chaves": chaves,
+        "resultados": resultados,
+        "faltantes": faltantes,
+        "estimados": estimados,
+        "linha_reta": linha_reta,
+    }
+
+
+def _usar_matrix_api():
+    usar_matrix_api = os.getenv("GRAPHHOPPER_MATRIX_API", "true").lower() != "false"
+    return usar_matrix_api and _matrix_api_disponivel.get(_graphhopper_url(), True)
+
+
+def _rotear_faltantes(coordenadas, faltantes):
+    """Roteia os pares pelo /matrix ou, se indisponível, pelo /route. Retorna (roteados, metodo, falhas)."""
+    if _usar_matrix_api():
+        try:
+            roteados, falhas = _rotear_via_matrix_api(coordenadas, faltantes)
+            return roteados, "matrix", falhas
+        except MatrixApiIndisponivel as e:
+            print(f"[AVISO] Endpoint /matrix indisponível ({e}). Usando /route par a par.")
+    roteados, falhas = _rotear_via_route(coordenadas, faltantes)
+    return roteados, "route", falhas
+
+
+async def _rotear_faltantes_async(coordenadas, faltantes):
+    """Versão assíncrona de _rotear_faltantes."""
+    if _usar_matrix_api():
+        try:
+            roteados, falhas = await _rotear_via_matrix_api_async(coordenadas, faltantes)
+            return roteados, "matrix", falhas
+        except MatrixApiIndisponivel as e:
+            print(f"[AVISO] Endpoint /matrix indisponível ({e}). Usando /route par a par.")
+    roteados, falhas = await _rotear_via_route_async(coordenadas, faltantes)
+    return roteados, "route", falhas
+
+
+def _concluir_matrizes(plano, roteados, metodo, falhas):
+    """Grava os pares roteados no cache, estima os demais (modo esparso) e monta as matrizes."""
+    num_locais = plano["num_locais"]
+    resultados = plano["resultados"]
+    if roteados:
+        salvar_trechos({plano["chaves"][par]: custo for par, custo in roteados.items()})
+        resultados.update(roteados)
+    if plano["estimados"]:
+        # Estimativas não vão para o cache de trechos
+        resultados.update(_estimar_pares(plano["linha_reta"], resultados, plano["estimados"]))
+
     matriz_tempos = [[0] * num_locais for _ in range(num_locais)]
     matriz_distancias = [[0] * num_locais for _ in range(num_locais)]
-    
-    for i in range(num_locais):
-        for j in range(num_locais):
-            if i == j:
-                continue
-            origem, destino = coordenadas[i], coordenadas[j]
-            url = f"{graphhopper_url}/route?point={origem[0]},{origem[1]}&point={destino[0]},{destino[1]}&type=json&profile=car"
-            try:
-                response = requests.get(url)
-                response.raise_for_status()
-                data = response.json()
-                tempo_segundos = data['paths'][0]['time'] // 1000
-                matriz_tempos[i][j] = tempo_segundos
-                matriz_distancias[i][j] = int(data['paths'][0]['distance'])
-            except requests.exceptions.RequestException as e:
-                print(f"[ERRO] Falha ao conectar com o GraphHopper: {e}")
+    for (i, j), (tempo_segundos, distancia_metros) in resultados.items():
+        matriz_tempos[i][j] = tempo_segundos
+        matriz_distancias[i][j] = distancia_metros
+    return {
+        "tempos": matriz_tempos,
+        "distancias": matriz_distancias,
+        "metodo": metodo,
+        "trechos_em_cache": len(plano["pares"]) - len(plano["faltantes"]) - len(plano["estimados"]),
+        "pares_estimados": len(plano["estimados"]),
+        "falhas": falhas,
+    }
+
+
+def construir_matrizes_de_custo(coordenadas):
+    """Constrói as matrizes de tempo (s) e distância (m) e retorna o par (tempos, distancias)."""
+    print("--- Construindo Matriz de Custos (Tempo e Distância) ---")
+    resultado = construir_matrizes_de_custo_detalhado(coordenadas)
+    if resultado["falhas"]:
+        print(f"[ERRO] {len(resultado['falhas'])} par(es) não puderam ser roteados pelo GraphHopper.")
     print("--- Matriz de Tempos e Matriz de Distância Concluída ---")
-    return matriz_tempos, matriz_distancias
+    return resultado["tempos"], resultado["distancias"]
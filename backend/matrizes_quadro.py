@@ -0,0 +1,58 @@
+import json
+from datetime import datetime
+import numpy as np
+import models
+from cache_trechos import versao_grafo
+from cache_trechos import PRECISAO_COORDENADAS
+
+
+def salvar_matrizes_quadro(db, quadro_id, enderecos, coordenadas, tempos, distancias):
+    """
+    Guarda (sem commit) as matrizes de um quadro, substituindo as anteriores. As linhas e
+    colunas seguem a ordem de `enderecos`; as coordenadas usadas ficam junto para detectar
+    endereços que mudaram depois.
+    """
+    nos = [
+        [endereco.id, round(float(lat), PRECISAO_COORDENADAS), round(float(lon), PRECISAO_COORDENADAS)]
+        for endereco, (lat, lon) in zip(enderecos, coordenadas)
+    ]
+    db.merge(models.MatrizQuadroDB(
+        quadro_id=quadro_id,
+        nos=json.dumps(nos),
+        versao_grafo=versao_grafo(),
+        tempos=np.asarray(tempos, dtype=np.int32).tobytes(),
+        distancias=np.asarray(distancias, dtype=np.int32).tobytes(),
+        atualizado_em=datetime.now(),
+    ))
+
+
+def carregar_matrizes_quadro(db, quadro_id, enderecos):
+    """
+    Recorta das matrizes guardadas do quadro as sub-matrizes (tempos, distancias) na ordem
+    de `enderecos`. Retorna None se não há matrizes, se são de outra versão do grafo, se
+    falta algum endereço ou se algum já geocodificado mudou de coordenada.
+    """
+    registro = db.get(models.MatrizQuadroDB, quadro_id)
+    if registro is None or registro.versao_grafo != versao_grafo():
+        return None
+    nos = json.loads(registro.nos)
+    posicoes = {endereco_id: posicao for posicao, (endereco_id, _, _) in enumerate(nos)}
+    indices = []
+    for endereco in enderecos:
+        posicao = posicoes.get(endereco.id)
+        if posicao is None:
+            return None
+        if endereco.lat is not None and [round(endereco.lat, PRECISAO_COORDENADAS), round(endereco.lon, PRECISAO_COORDENADAS)] != nos[posicao][1:]:
+            return None
+        indices.append(posicao)
+    num_nos = len(nos)
+    recorte = np.ix_(indices, indices)
+    tempos = np.frombuffer(registro.tempos, dtype=np.int32).reshape(num_nos, num_nos)[recorte]
+    distancias = np.frombuffer(registro.distancias, dtype=np.int32).reshape(num_nos, num_nos)[recorte]
+    return tempos, distancias
+
+
+def invalidar_matrizes_quadros(db, quadro_ids):
+    """Descarta (sem commit) as matrizes guardadas dos quadros indicados."""
+    if quadro_ids:
+        db.query(models.MatrizQuadroDB).filter(models.MatrizQuadroDB.quadro_id.in_(list(quadro_ids))).delete(synchronize_session=False)
@@ -0,0 +1,37 @@
+import os
+import sys
+from alembic import context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models
+from database import engine
+
+# render_as_batch: no SQLite, alterações de colunas recriam a tabela (ALTER TABLE limitado)
+OPCOES = {"target_metadata": models.Base.metadata, "render_as_batch": True, "compare_type": True}
+
+
+def executar_offline():
+    context.configure(url=str(engine.url), literal_binds=True, **OPCOES)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def executar_online():
+    # database.atualizar_schema passa a conexão já aberta; pela linha de comando abrimos uma
+    conexao = context.config.attributes.get("connection")
+    if conexao is not None:
+        context.configure(connection=conexao, **OPCOES)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+    with engine.connect() as conexao:
+        context.configure(connection=conexao, **OPCOES)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    executar_offline()
+else:
+    executar_online()
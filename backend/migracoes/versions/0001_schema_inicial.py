@@ -0,0 +1,102 @@
+"""schema inicial (o que o antigo create_all criava)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "motoristas",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("nome", sa.String(), unique=True),
+        sa.Column("contato", sa.String()),
+    )
+    op.create_table(
+        "enderecos",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("rua", sa.String()),
+        sa.Column("bairro", sa.String()),
+        sa.Column("cidade", sa.String()),
+        sa.Column("estado", sa.String()),
+        sa.Column("cep", sa.String()),
+        sa.Column("numero", sa.String()),
+        sa.Column("lat", sa.Float(), nullable=True),
+        sa.Column("lon", sa.Float(), nullable=True),
+    )
+    op.create_table(
+        "veiculos",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("placa", sa.String(), unique=True),
+        sa.Column("modelo", sa.String()),
+        sa.Column("cor", sa.String()),
+        sa.Column("motorista_id", sa.Integer(), sa.ForeignKey("motoristas.id")),
+    )
+    op.create_table(
+        "passageiros",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("nome", sa.String()),
+        sa.Column("contato", sa.String()),
+        sa.Column("funcao", sa.Enum("CAMERA", "ELETRICA", "SOM", "PRODUCAO", "OUTRO", name="funcao")),
+        sa.Column("autonomo", sa.Boolean()),
+        sa.Column("endereco_id", sa.Integer(), sa.ForeignKey("enderecos.id")),
+    )
+    op.create_table(
+        "mapas_transporte",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("nome", sa.String()),
+        sa.Column("descricao", sa.String(), nullable=True),
+        sa.Column("data_inicio", sa.DateTime()),
+        sa.Column("regras", sa.String(), nullable=True),
+    )
+    op.create_table(
+        "quadros",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("nome", sa.String()),
+        sa.Column("descricao", sa.Text(), nullable=True),
+        sa.Column("horario_saida", sa.Time(), nullable=True),
+        sa.Column("origem_id", sa.Integer(), sa.ForeignKey("enderecos.id")),
+        sa.Column("destino_id", sa.Integer(), sa.ForeignKey("enderecos.id")),
+        sa.Column("veiculo_id", sa.Integer(), sa.ForeignKey("veiculos.id"), nullable=True, unique=True),
+        sa.Column("mapa_transporte_id", sa.Integer(), sa.ForeignKey("mapas_transporte.id")),
+    )
+    op.create_table(
+        "quadro_passageiro_association",
+        sa.Column("quadro_id", sa.Integer(), sa.ForeignKey("quadros.id"), primary_key=True),
+        sa.Column("passageiro_id", sa.Integer(), sa.ForeignKey("passageiros.id"), primary_key=True),
+    )
+    op.create_table(
+        "rotas",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("id_rota_str", sa.String(), unique=True),
+        sa.Column("duracao_total_estimada", sa.Float()),
+        sa.Column("distancia_total_estimada_km", sa.Float()),
+        sa.Column("horario_chegada_estimado", sa.DateTime(), nullable=True),
+        sa.Column("google_maps_link", sa.String(), nullable=True),
+        sa.Column("quadro_id", sa.Integer(), sa.ForeignKey("quadros.id"), unique=True),
+        sa.Column("veiculo_id", sa.Integer(), sa.ForeignKey("veiculos.id")),
+    )
+    op.create_table(
+        "paradas",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("ordem", sa.Integer()),
+        sa.Column("horario_saida", sa.Time(), nullable=True),
+        sa.Column("rota_id", sa.Integer(), sa.ForeignKey("rotas.id")),
+        sa.Column("passageiro_id", sa.Integer(), sa.ForeignKey("passageiros.id")),
+        sa.Column("endereco_id", sa.Integer(), sa.ForeignKey("enderecos.id")),
+    )
+
+
+def downgrade():
+    for tabela in ("paradas", "rotas", "quadro_passageiro_association", "quadros", "mapas_transporte",
+                   "passageiros", "veiculos", "enderecos", "motoristas"):
+        op.drop_table(tabela)
+    sa.Enum(name="funcao").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,82 @@
+"""colunas e tabelas de cache adicionadas para a otimização de rotas
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+Bases criadas pelo antigo create_all já podem ter parte destas colunas e tabelas
+(dependendo da versão em que foram criadas), por isso cada uma só é criada se faltar.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+COLUNAS = {
+    "veiculos": [sa.Column("capacidade", sa.Integer(), nullable=True)],
+    "mapas_transporte": [sa.Column("configuracao_solver", sa.Text(), nullable=True)],
+    "rotas": [
+        sa.Column("configuracao_solver", sa.Text(), nullable=True),
+        sa.Column("curva_melhoria", sa.Text(), nullable=True),
+        sa.Column("impressao_digital", sa.String(), nullable=True),
+        sa.Column("ordem_canonica", sa.Text(), nullable=True),
+    ],
+}
+
+
+def upgrade():
+    inspetor = sa.inspect(op.get_bind())
+    tabelas = set(inspetor.get_table_names())
+    for tabela, colunas in COLUNAS.items():
+        existentes = {coluna["name"] for coluna in inspetor.get_columns(tabela)}
+        faltantes = [coluna for coluna in colunas if coluna.name not in existentes]
+        if faltantes:
+            with op.batch_alter_table(tabela) as batch:
+                for coluna in faltantes:
+                    batch.add_column(coluna)
+    if "ix_rotas_impressao_digital" not in {indice["name"] for indice in inspetor.get_indexes("rotas")}:
+        op.create_index("ix_rotas_impressao_digital", "rotas", ["impressao_digital"])
+
+    if "trechos_cache" not in tabelas:
+        op.create_table(
+            "trechos_cache",
+            sa.Column("chave", sa.String(), primary_key=True),
+            sa.Column("perfil", sa.String()),
+            sa.Column("versao_grafo", sa.String()),
+            sa.Column("tempo_segundos", sa.Integer()),
+            sa.Column("distancia_metros", sa.Integer()),
+            sa.Column("atualizado_em", sa.DateTime()),
+        )
+    if "geocodes_cache" not in tabelas:
+        op.create_table(
+            "geocodes_cache",
+            sa.Column("endereco_normalizado", sa.String(), primary_key=True),
+            sa.Column("lat", sa.Float()),
+            sa.Column("lon", sa.Float()),
+            sa.Column("fonte", sa.String()),
+            sa.Column("atualizado_em", sa.DateTime()),
+        )
+    if "matrizes_quadro" not in tabelas:
+        op.create_table(
+            "matrizes_quadro",
+            sa.Column("quadro_id", sa.Integer(), sa.ForeignKey("quadros.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("nos", sa.Text()),
+            sa.Column("versao_grafo", sa.String()),
+            sa.Column("tempos", sa.LargeBinary()),
+            sa.Column("distancias", sa.LargeBinary()),
+            sa.Column("atualizado_em", sa.DateTime()),
+        )
+
+
+def downgrade():
+    op.drop_table("matrizes_quadro")
+    op.drop_table("geocodes_cache")
+    op.drop_table("trechos_cache")
+    op.drop_index("ix_rotas_impressao_digital", table_name="rotas")
+    for tabela, colunas in COLUNAS.items():
+        with op.batch_alter_table(tabela) as batch:
+            for coluna in colunas:
+                batch.drop_column(coluna.name)
@@ -0,0 +1,40 @@
+"""índices das chaves estrangeiras
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+Nem o SQLite nem o PostgreSQL indexam chaves estrangeiras sozinhos: sem estes índices,
+carregar os quadros de um mapa, as paradas de uma rota ou os quadros de um passageiro
+percorre a tabela inteira.
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDICES = [
+    ("ix_quadros_mapa_transporte_id", "quadros", "mapa_transporte_id"),
+    ("ix_quadros_origem_id", "quadros", "origem_id"),
+    ("ix_quadros_destino_id", "quadros", "destino_id"),
+    ("ix_paradas_rota_id", "paradas", "rota_id"),
+    ("ix_paradas_passageiro_id", "paradas", "passageiro_id"),
+    ("ix_paradas_endereco_id", "paradas", "endereco_id"),
+    ("ix_passageiros_endereco_id", "passageiros", "endereco_id"),
+    ("ix_veiculos_motorista_id", "veiculos", "motorista_id"),
+    ("ix_rotas_veiculo_id", "rotas", "veiculo_id"),
+    # Sentido passageiro -> quadros; o outro já é coberto pela chave primária (quadro_id, passageiro_id)
+    ("ix_quadro_passageiro_association_passageiro_id", "quadro_passageiro_association", "passageiro_id"),
+]
+
+
+def upgrade():
+    for nome, tabela, coluna in INDICES:
+        op.create_index(nome, tabela, [coluna])
+
+
+def downgrade():
+    for nome, tabela, _ in INDICES:
+        op.drop_index(nome, table_name=tabela)
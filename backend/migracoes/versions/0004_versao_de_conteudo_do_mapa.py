@@ -0,0 +1,26 @@
+"""versão de conteúdo dos mapas de transporte
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+Contador que sobe a cada escrita nos quadros, rotas ou passageiros de um mapa; é a chave
+do cache de PDFs (ver cache_pdf.py).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("mapas_transporte") as batch:
+        batch.add_column(sa.Column("versao_conteudo", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade():
+    with op.batch_alter_table("mapas_transporte") as batch:
+        batch.drop_column("versao_conteudo")
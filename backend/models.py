@@ -1,13 +1,15 @@
 from typing import Optional
 from sqlalchemy import (Column, Integer, String, Boolean, Float, DateTime, Table, Time, Enum as SQLAlchemyEnum,
-                        ForeignKey, Text)
+                        ForeignKey, Text, LargeBinary, Index)
 from sqlalchemy.orm import relationship
 from enum import Enum as PyEnum
 from database import Base
 
 quadro_passageiro_association = Table('quadro_passageiro_association', Base.metadata,
     Column('quadro_id', Integer, ForeignKey('quadros.id'), primary_key=True),
-    Column('passageiro_id', Integer, ForeignKey('passageiros.id'), primary_key=True)
+    Column('passageiro_id', Integer, ForeignKey('passageiros.id'), primary_key=True),
+    # A chave primária (quadro_id, passageiro_id) já indexa o sentido quadro -> passageiros
+    Index('ix_quadro_passageiro_association_passageiro_id', 'passageiro_id'),
 )
 
 class Funcao(str, PyEnum):
@@ -55,8 +57,9 @@ class VeiculoDB(Base):
     placa = Column(String, unique=True)
     modelo = Column(String)
     cor = Column(String)
+    capacidade = Column(Integer, nullable=True) # Lugares para passageiros; None usa VEICULO_CAPACIDADE_PADRAO
     
-    motorista_id = Column(Integer, ForeignKey("motoristas.id"))
+    motorista_id = Column(Integer, ForeignKey("motoristas.id"), index=True)
     motorista = relationship("MotoristaDB", back_populates="veiculo")
     quadro = relationship("QuadroDB", back_populates="veiculo", uselist=False)
 
@@ -75,7 +78,7 @@ class PassageiroDB(Base):
     contato = Column(String)
     funcao = Column(SQLAlchemyEnum(Funcao))
     autonomo = Column(Boolean, default=False)
-    endereco_id = Column(Integer, ForeignKey("enderecos.id"))
+    endereco_id = Column(Integer, ForeignKey("enderecos.id"), index=True)
 
     endereco = relationship("EnderecoDB", lazy="joined")
     quadros = relationship(
@@ -92,12 +95,13 @@ class MapaTransporteDB(Base):
     descricao = Column(String, nullable=True)
     data_inicio = Column(DateTime)
     regras = Column(String, nullable=True)
+    configuracao_solver = Column(Text, nullable=True) # JSON com a ConfiguracaoSolver padrão do mapa
+    versao_conteudo = Column(Integer, nullable=False, default=0, server_default="0") # Sobe a cada escrita que muda o PDF do mapa (ver cache_pdf.py)
 
     quadros = relationship(
         "QuadroDB",
         back_populates="mapa_transporte", 
-        cascade="all, delete-orphan",
-        lazy="joined"
+        cascade="all, delete-orphan"
     )
 
 
@@ -108,21 +112,21 @@ class QuadroDB(Base):
     descricao = Column(Text, nullable=True)
     horario_saida = Column(Time, nullable=True)
 
-    origem_id = Column(Integer, ForeignKey("enderecos.id"))
-    destino_id = Column(Integer, ForeignKey("enderecos.id"))
+    origem_id = Column(Integer, ForeignKey("enderecos.id"), index=True)
+    destino_id = Column(Integer, ForeignKey("enderecos.id"), index=True)
     veiculo_id = Column(Integer, ForeignKey("veiculos.id"), nullable=True, unique=True)
-    mapa_transporte_id = Column(Integer, ForeignKey("mapas_transporte.id"))
+    mapa_transporte_id = Column(Integer, ForeignKey("mapas_transporte.id"), index=True)
 
-    veiculo = relationship("VeiculoDB", back_populates="quadro", lazy="joined")
-    origem = relationship("EnderecoDB", foreign_keys=[origem_id], lazy="joined")
-    destino = relationship("EnderecoDB", foreign_keys=[destino_id], lazy="joined")
+    # O carregamento de cada relação é escolhido por consulta (ver os perfis em crud.py)
+    veiculo = relationship("VeiculoDB", back_populates="quadro")
+    origem = relationship("EnderecoDB", foreign_keys=[origem_id])
+    destino = relationship("EnderecoDB", foreign_keys=[destino_id])
     passageiros = relationship(
         "PassageiroDB",
         secondary=quadro_passageiro_association, # Aponta para a mesma tabela
-        back_populates="quadros",
-        lazy="joined" # Mantém o eager loading
+        back_populates="quadros"
     )
-    mapa_transporte = relationship("MapaTransporteDB", back_populates="quadros", lazy="joined")
+    mapa_transporte = relationship("MapaTransporteDB", back_populates="quadros")
     rota = relationship("RotaDB", back_populates="quadro", uselist=False, cascade="all, delete-orphan")
 
 
@@ -134,11 +138,15 @@ class RotaDB(Base):
     distancia_total_estimada_km = Column(Float)
     horario_chegada_estimado = Column(DateTime, nullable=True) 
     google_maps_link = Column(String, nullable=True)
+    configuracao_solver = Column(Text, nullable=True) # JSON com a configuração usada na otimização
+    curva_melhoria = Column(Text, nullable=True) # JSON: [{"t_s", "custo"}] a cada melhoria
+    impressao_digital = Column(String, nullable=True, index=True) # Hash das entradas da geração (ver crud._impressao_digital_quadro)
+    ordem_canonica = Column(Text, nullable=True) # JSON: ordem das paradas em posições canônicas (coordenadas ordenadas)
 
     quadro_id = Column(Integer, ForeignKey("quadros.id"), unique=True)
     quadro = relationship("QuadroDB", back_populates="rota")
     
-    veiculo_id = Column(Integer, ForeignKey("veiculos.id"))
+    veiculo_id = Column(Integer, ForeignKey("veiculos.id"), index=True)
     veiculo = relationship("VeiculoDB")
     paradas = relationship("ParadaDB", back_populates="rota", cascade="all, delete-orphan")
 
@@ -148,10 +156,42 @@ class ParadaDB(Base):
     id = Column(Integer, primary_key=True)
     ordem = Column(Integer)
     horario_saida = Column(Time, nullable=True)
-    rota_id = Column(Integer, ForeignKey("rotas.id"))
-    passageiro_id = Column(Integer, ForeignKey("passageiros.id"))
-    endereco_id = Column(Integer, ForeignKey("enderecos.id"))
+    rota_id = Column(Integer, ForeignKey("rotas.id"), index=True)
+    passageiro_id = Column(Integer, ForeignKey("passageiros.id"), index=True)
+    endereco_id = Column(Integer, ForeignKey("enderecos.id"), index=True)
 
     rota = relationship("RotaDB", back_populates="paradas")
     passageiro = relationship("PassageiroDB")
     endereco = relationship("EnderecoDB", lazy="joined")
+
+
+class TrechoCacheDB(Base):
+    """Custo de viagem já roteado pelo GraphHopper entre duas coordenadas (arredondadas)."""
+    __tablename__ = "trechos_cache"
+    chave = Column(String, primary_key=True)
+    perfil = Column(String)
+    versao_grafo = Column(String)
+    tempo_segundos = Column(Integer)
+    distancia_metros = Column(Integer)
+    atualizado_em = Column(DateTime)
+
+
+class GeocodeCacheDB(Base):
+    """Coordenadas já geocodificadas para um endereço normalizado."""
+    __tablename__ = "geocodes_cache"
+    endereco_normalizado = Column(String, primary_key=True)
+    lat = Column(Float)
+    lon = Column(Float)
+    fonte = Column(String)
+    atualizado_em = Column(DateTime)
+
+
+class MatrizQuadroDB(Base):
+    """Últimas matrizes de tempo e distância construídas para um quadro (int32 empacotado)."""
+    __tablename__ = "matrizes_quadro"
+    quadro_id = Column(Integer, ForeignKey("quadros.id", ondelete="CASCADE"), primary_key=True)
+    nos = Column(Text) # JSON: [[endereco_id, lat, lon], ...] na ordem das linhas/colunas
+    versao_grafo = Column(String)
+    tempos = Column(LargeBinary)
+    distancias = Column(LargeBinary)
+    atualizado_em = Column(DateTime)
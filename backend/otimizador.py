@@ -1,75 +1,9 @@
+import os
+import time
+import numpy as np
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 
-# def otimizar_rota_mapa(matriz_custo, veiculos_info):
-#     """Resolve o Problema de Roteamento de Veículos (VRP) e retorna o plano."""
-#     print("\n--- Iniciando Otimização com Google OR-Tools ---")
-#     # 1. Criar o gerenciador e o modelo de roteamento
-#     num_locais = len(matriz_custo)
-#     num_veiculos = veiculos_info['quantidade']
-    
-#     # CRIA LISTAS PARA OS PONTOS DE INÍCIO E FIM
-#     inicios = [veiculos_info['origem']] * num_veiculos
-#     fins = [veiculos_info['destino']] * num_veiculos
-    
-#     print("Pontos de Início:", inicios)
-#     print("Pontos de Fim:", fins)
-    
-#     manager = pywrapcp.RoutingIndexManager(num_locais, num_veiculos, inicios, fins)
-#     routing = pywrapcp.RoutingModel(manager)
-
-#     # 2. Criar o "callback" de custo (a ponte entre a matriz e o OR-Tools)
-#     def transit_callback(from_index, to_index):
-#         """Retorna o tempo de viagem entre dois pontos."""
-#         from_node = manager.IndexToNode(from_index)
-#         to_node = manager.IndexToNode(to_index)
-#         return matriz_custo[from_node][to_node]
-
-#     transit_callback_index = routing.RegisterTransitCallback(transit_callback)
-#     routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
-
-#     # # 3. Adicionar a restrição de capacidade dos veículos
-#     # def demand_callback(from_index):
-#     #     """Retorna a demanda de cada local (1 pessoa por parada de recolha)."""
-#     #     from_node = manager.IndexToNode(from_index)
-#     #     if from_node == veiculos_info['origem'] or from_node == veiculos_info['destino']:
-#     #         return 0 # Depósito e destino não têm demanda
-#     #     return 1 # Cada parada de recolha tem uma demanda de 1
-
-#     # demand_callback_index = routing.RegisterUnaryTransitCallback(demand_callback)
-#     # routing.AddDimensionWithVehicleCapacity(
-#     #     demand_callback_index,
-#     #     0,  # Slack (folga) nulo
-#     #     veiculos_info['capacidade'],  # Lista com a capacidade de cada veículo
-#     #     True,  # Começar a contagem de carga do zero
-#     #     'Capacity')
-
-#     # 4. Definir parâmetros de busca e resolver
-#     search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-#     search_parameters.first_solution_strategy = (
-#         routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
-
-#     solution = routing.SolveWithParameters(search_parameters)
-
-#     # 5. Extrair e retornar a solução
-#     if solution:
-#         print("--- Otimização Concluída com Sucesso! ---")
-#         rotas = []
-#         for vehicle_id in range(veiculos_info['quantidade']):
-#             index = routing.Start(vehicle_id)
-#             rota_veiculo = []
-#             while not routing.IsEnd(index):
-#                 node_index = manager.IndexToNode(index)
-#                 rota_veiculo.append(node_index)
-#                 index = solution.Value(routing.NextVar(index))
-#             # Adiciona o ponto final à rota
-#             rota_veiculo.append(manager.IndexToNode(index))
-#             rotas.append(rota_veiculo)
-#         return rotas
-#     else:
-#         print("Não foi encontrada uma solução.")
-#         return None
-
 # Backup
 # def otimizador_de_rota_quadro(matriz_tempos, matriz_distancias):
 #     """Resolve o Problema de Roteamento de Veículos (VRP) e retorna o plano."""
@@ -140,10 +74,51 @@ from ortools.constraint_solver import pywrapcp
 #         print("Não foi encontrada uma solução.")
 #         return None, None
 
-def otimizador_de_rota_quadro(matriz_tempo, matriz_distancia):
+CONFIGURACAO_SOLVER_PADRAO = {
+    "estrategia_inicial": "PATH_CHEAPEST_ARC",
+    "metaheuristica": "AUTOMATIC",
+    "limite_tempo_s": None,
+    "limite_solucoes": None,
+}
+# Metaheurísticas que só param por limite; sem um, a busca nunca termina
+METAHEURISTICAS_SEM_FIM = ("GUIDED_LOCAL_SEARCH", "SIMULATED_ANNEALING", "TABU_SEARCH", "GENERIC_TABU_SEARCH")
+
+def resolver_configuracao_solver(configuracao=None):
+    """
+    Completa a configuração com os valores padrão. Metaheurísticas sem critério de parada
+    recebem o limite de tempo OTIMIZADOR_LIMITE_TEMPO_PADRAO_S (5 s) quando nenhum é dado.
+    """
+    configuracao_final = {**CONFIGURACAO_SOLVER_PADRAO, **{k: v for k, v in (configuracao or {}).items() if v is not None}}
+    if (configuracao_final["metaheuristica"] in METAHEURISTICAS_SEM_FIM
+            and not configuracao_final["limite_tempo_s"] and not configuracao_final["limite_solucoes"]):
+        configuracao_final["limite_tempo_s"] = float(os.getenv("OTIMIZADOR_LIMITE_TEMPO_PADRAO_S", "5"))
+    return configuracao_final
+
+def _parametros_de_busca(configuracao):
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = getattr(
+        routing_enums_pb2.FirstSolutionStrategy, configuracao["estrategia_inicial"])
+    search_parameters.local_search_metaheuristic = getattr(
+        routing_enums_pb2.LocalSearchMetaheuristic, configuracao["metaheuristica"])
+    if configuracao["limite_tempo_s"]:
+        search_parameters.time_limit.FromMilliseconds(int(configuracao["limite_tempo_s"] * 1000))
+    if configuracao["limite_solucoes"]:
+        search_parameters.solution_limit = configuracao["limite_solucoes"]
+    return search_parameters
+
+def otimizador_de_rota_quadro(matriz_tempo, matriz_distancia, configuracao=None, ordem_inicial=None):
     """
     Resolve o TSP e retorna a rota, os totais e os detalhes de cada parada.
+
+    `configuracao` (ver CONFIGURACAO_SOLVER_PADRAO) escolhe a estratégia da primeira solução,
+    a metaheurística de busca local e os limites de tempo/soluções. O resultado inclui a
+    configuração efetivamente usada e a curva de melhoria: [{"t_s", "custo"}] a cada nova
+    melhor solução encontrada.
+
+    `ordem_inicial` (índices dos nós, da origem ao destino) é usada como solução de partida
+    no lugar da estratégia inicial; a busca local parte dela.
     """
+    configuracao = resolver_configuracao_solver(configuracao)
     num_locais = len(matriz_tempo)
     num_veiculos = 1
     inicios, fins = [0], [num_locais - 1]
@@ -151,31 +126,39 @@ def otimizador_de_rota_quadro(matriz_tempo, matriz_distancia):
     manager = pywrapcp.RoutingIndexManager(num_locais, num_veiculos, inicios, fins)
     routing = pywrapcp.RoutingModel(manager)
 
-    # --- Dimensão de Tempo (Principal) ---
-    def time_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return matriz_tempo[from_node][to_node]
+    # As matrizes são registradas direto no OR-Tools (RegisterTransitMatrix), em vez de
+    # callbacks Python: assim a busca avalia os arcos em C++ sem voltar ao interpretador.
+    matriz_tempo = [[int(valor) for valor in linha] for linha in matriz_tempo]
+    matriz_distancia = [[int(valor) for valor in linha] for linha in matriz_distancia]
 
-    time_callback_index = routing.RegisterTransitCallback(time_callback)
+    # --- Dimensão de Tempo (Principal) ---
+    time_callback_index = routing.RegisterTransitMatrix(matriz_tempo)
     routing.SetArcCostEvaluatorOfAllVehicles(time_callback_index)
     routing.AddDimension(time_callback_index, 0, 86400, True, 'Time') # Max 24h em segundos
     time_dimension = routing.GetDimensionOrDie('Time')
 
     # --- Dimensão de Distância (Secundária) ---
-    def distance_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return matriz_distancia[from_node][to_node]
-
-    distance_callback_index = routing.RegisterTransitCallback(distance_callback)
+    distance_callback_index = routing.RegisterTransitMatrix(matriz_distancia)
     routing.AddDimension(distance_callback_index, 0, 10000000, True, 'Distance') # Max 10000km em metros
     distance_dimension = routing.GetDimensionOrDie('Distance')
 
     # --- Resolução ---
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
-    solution = routing.SolveWithParameters(search_parameters)
+    search_parameters = _parametros_de_busca(configuracao)
+    curva_melhoria = []
+    inicio = time.perf_counter()
+
+    def registrar_solucao():
+        custo = routing.CostVar().Value()
+        if not curva_melhoria or custo < curva_melhoria[-1]["custo"]:
+            curva_melhoria.append({"t_s": round(time.perf_counter() - inicio, 4), "custo": custo})
+
+    routing.AddAtSolutionCallback(registrar_solucao)
+    if ordem_inicial:
+        routing.CloseModelWithParameters(search_parameters)
+        solucao_inicial = routing.ReadAssignmentFromRoutes([list(ordem_inicial[1:-1])], True)
+        solution = routing.SolveFromAssignmentWithParameters(solucao_inicial, search_parameters)
+    else:
+        solution = routing.SolveWithParameters(search_parameters)
 
     if solution:
         paradas_detalhadas = []
@@ -211,7 +194,245 @@ def otimizador_de_rota_quadro(matriz_tempo, matriz_distancia):
         return {
             "distancia_metros": distancia_total,
             "tempo_segundos": tempo_total,
-            "detalhes_paradas": paradas_detalhadas
+            "detalhes_paradas": paradas_detalhadas,
+            "configuracao": configuracao,
+            "curva_melhoria": curva_melhoria
         }
     else:
-        return None
\ No newline at end of file
+        return None
+
+def otimizar_rota_mapa(matriz_tempo, matriz_distancia, inicios, fins, capacidades, veiculos_permitidos, configuracao=None):
+    """
+    Resolve o VRP capacitado de um mapa inteiro: cada veículo sai do seu nó em `inicios`,
+    termina no seu nó em `fins` e leva no máximo `capacidades[v]` passageiros (cada nó
+    de passageiro ocupa um lugar).
+
+    `veiculos_permitidos` mapeia nó -> lista de veículos que podem atendê-lo (passageiros
+    já associados a um quadro ficam presos ao seu veículo). Nós sem entrada podem ir para
+    qualquer veículo e, se não houver lugar para todos, alguns ficam de fora com uma
+    penalidade alta; eles são devolvidos em "nao_atendidos".
+
+    Retorna {"rotas": [solução por veículo no formato de otimizador_de_rota_quadro],
+    "nao_atendidos", "tempo_segundos", "distancia_metros", "configuracao"} ou None.
+    """
+    configuracao = resolver_configuracao_solver(configuracao)
+    num_locais = len(matriz_tempo)
+    num_veiculos = len(inicios)
+    manager = pywrapcp.RoutingIndexManager(num_locais, num_veiculos, inicios, fins)
+    routing = pywrapcp.RoutingModel(manager)
+
+    matriz_tempo = [[int(valor) for valor in linha] for linha in matriz_tempo]
+    matriz_distancia = [[int(valor) for valor in linha] for linha in matriz_distancia]
+    time_callback_index = routing.RegisterTransitMatrix(matriz_tempo)
+    routing.SetArcCostEvaluatorOfAllVehicles(time_callback_index)
+    routing.AddDimension(time_callback_index, 0, 86400, True, 'Time')
+
+    # --- Capacidade: 1 lugar por passageiro, nada nos pontos de saída/chegada ---
+    depositos = set(inicios) | set(fins)
+    demandas = [0 if node in depositos else 1 for node in range(num_locais)]
+    demand_callback_index = routing.RegisterUnaryTransitVector(demandas)
+    routing.AddDimensionWithVehicleCapacity(demand_callback_index, 0, list(capacidades), True, 'Capacidade')
+
+    # Deixar um passageiro de fora custa mais que qualquer desvio possível
+    penalidade = (max(max(linha) for linha in matriz_tempo) + 1) * num_locais
+    for node in range(num_locais):
+        if node in depositos:
+            continue
+        index = manager.NodeToIndex(node)
+        if node in veiculos_permitidos:
+            routing.VehicleVar(index).SetValues(list(veiculos_permitidos[node]))
+        else:
+            routing.AddDisjunction([index], penalidade)
+
+    solution = routing.SolveWithParameters(_parametros_de_busca(configuracao))
+    if not solution:
+        print("Não foi encontrada uma solução.")
+        return None
+
+    rotas = []
+    for vehicle_id in range(num_veiculos):
+        ordem = []
+        index = routing.Start(vehicle_id)
+        while not routing.IsEnd(index):
+            ordem.append(manager.IndexToNode(index))
+            index = solution.Value(routing.NextVar(index))
+        ordem.append(manager.IndexToNode(index))
+        rotas.append(avaliar_ordem(matriz_tempo, matriz_distancia, ordem))
+
+    atendidos = {parada["indice_parada"] for rota in rotas for parada in rota["detalhes_paradas"]}
+    return {
+        "rotas": rotas,
+        "nao_atendidos": [node for node in range(num_locais) if node not in atendidos],
+        "tempo_segundos": sum(rota["tempo_segundos"] for rota in rotas),
+        "distancia_metros": sum(rota["distancia_metros"] for rota in rotas),
+        "configuracao": configuracao,
+    }
+
+def otimizador_held_karp(matriz_tempo, matriz_distancia):
+    """
+    Resolve o mesmo problema de otimizador_de_rota_quadro (caminho aberto que sai do nó 0,
+    visita todos os intermediários e termina no último nó) por programação dinâmica
+    (Held-Karp), com solução ótima garantida para o tempo total.
+
+    custo[S][j] = menor tempo saindo da origem, visitando o conjunto S e terminando em j.
+    Os subconjuntos são processados por tamanho, vetorizados com NumPy; para até ~12
+    paradas a resposta sai em milissegundos.
+    """
+    inicio = time.perf_counter()
+    num_locais = len(matriz_tempo)
+    tempos = np.asarray(matriz_tempo, dtype=np.int64)
+    destino = num_locais - 1
+    intermediarios = num_locais - 2
+
+    ordem = [0]
+    if intermediarios > 0:
+        # Os intermediários 1..n-2 viram os bits 0..k-1 das máscaras
+        custos_entre = tempos[1:destino, 1:destino]
+        num_mascaras = 1 << intermediarios
+        infinito = np.iinfo(np.int64).max // 4
+        custo = np.full((num_mascaras, intermediarios), infinito, dtype=np.int64)
+        anterior = np.full((num_mascaras, intermediarios), -1, dtype=np.int64)
+        bits = np.arange(intermediarios)
+        unitarias = 1 << bits
+        custo[unitarias, bits] = tempos[0, 1:destino]
+
+        mascaras = np.arange(num_mascaras)
+        tamanhos = np.zeros(num_mascaras, dtype=np.int64)
+        for bit in bits:
+            tamanhos += (mascaras >> bit) & 1
+        for tamanho in range(2, intermediarios + 1):
+            do_tamanho = mascaras[tamanhos == tamanho]
+            for j in bits:
+                com_j = do_tamanho[(do_tamanho >> j) & 1 == 1]
+                sem_j = com_j ^ (1 << j)
+                candidatos = custo[sem_j] + custos_entre[:, j]
+                melhores = np.argmin(candidatos, axis=1)
+                custo[com_j, j] = candidatos[np.arange(len(com_j)), melhores]
+                anterior[com_j, j] = melhores
+
+        completa = num_mascaras - 1
+        custo_final = custo[completa] + tempos[1:destino, destino]
+        atual = int(np.argmin(custo_final))
+        mascara = completa
+        caminho = []
+        while atual != -1:
+            caminho.append(atual + 1)
+            atual, mascara = int(anterior[mascara, atual]), mascara ^ (1 << atual)
+        ordem.extend(reversed(caminho))
+    ordem.append(destino)
+
+    solucao = avaliar_ordem(matriz_tempo, matriz_distancia, ordem)
+    solucao["configuracao"] = {"algoritmo": "HELD_KARP"}
+    solucao["curva_melhoria"] = [{"t_s": round(time.perf_counter() - inicio, 4), "custo": solucao["tempo_segundos"]}]
+    return solucao
+
+def avaliar_ordem(matriz_tempo, matriz_distancia, ordem):
+    """
+    Calcula os acumulados de uma ordem de visita (lista de índices de nós, da origem ao
+    destino) no mesmo formato devolvido pelos otimizadores.
+    """
+    paradas_detalhadas = []
+    tempo_acumulado, distancia_acumulada = 0, 0
+    for posicao, node_index in enumerate(ordem):
+        if posicao > 0:
+            tempo_acumulado += int(matriz_tempo[ordem[posicao - 1]][node_index])
+            distancia_acumulada += int(matriz_distancia[ordem[posicao - 1]][node_index])
+        paradas_detalhadas.append({
+            "indice_parada": node_index,
+            "tempo_acumulado_s": tempo_acumulado,
+            "distancia_acumulada_m": distancia_acumulada
+        })
+    return {
+        "distancia_metros": distancia_acumulada,
+        "tempo_segundos": tempo_acumulado,
+        "detalhes_paradas": paradas_detalhadas
+    }
+
+def _agrupar_paradas_coincidentes(matriz_tempo, matriz_distancia):
+    """
+    Agrupa as paradas intermediárias que são o mesmo ponto para o roteamento: mesmas linhas
+    e colunas nas duas matrizes (o que implica custo 0 entre elas), como as de passageiros
+    do mesmo endereço. Retorna a lista de grupos, na ordem do primeiro nó de cada um.
+    """
+    tempos = np.asarray(matriz_tempo, dtype=np.int64)
+    distancias = np.asarray(matriz_distancia, dtype=np.int64)
+    grupos = {}
+    for no in range(1, len(tempos) - 1):
+        chave = (tempos[no].tobytes(), tempos[:, no].tobytes(), distancias[no].tobytes(), distancias[:, no].tobytes())
+        grupos.setdefault(chave, []).append(no)
+    return list(grupos.values())
+
+def resolver_rota_quadro(matriz_tempo, matriz_distancia, configuracao=None, ordem_inicial=None):
+    """
+    Ponto de entrada do otimizador de um quadro: usa o Held-Karp exato quando há até
+    HELD_KARP_MAX_PARADAS paradas intermediárias (padrão 10) e o OR-Tools acima disso,
+    partindo de `ordem_inicial` quando informada.
+
+    Paradas coincidentes são resolvidas como um único nó e depois expandidas em visitas
+    consecutivas, com o mesmo horário.
+    """
+    num_locais = len(matriz_tempo)
+    grupos = _agrupar_paradas_coincidentes(matriz_tempo, matriz_distancia)
+    if len(grupos) == num_locais - 2:
+        return _resolver_rota_sem_repeticao(matriz_tempo, matriz_distancia, configuracao, ordem_inicial)
+
+    nos = [0] + [grupo[0] for grupo in grupos] + [num_locais - 1]
+    tempos_reduzidos = np.asarray(matriz_tempo, dtype=np.int64)[np.ix_(nos, nos)].tolist()
+    distancias_reduzidas = np.asarray(matriz_distancia, dtype=np.int64)[np.ix_(nos, nos)].tolist()
+    ordem_reduzida = None
+    if ordem_inicial:
+        no_reduzido = {0: 0, num_locais - 1: len(nos) - 1}
+        for posicao, grupo in enumerate(grupos, start=1):
+            no_reduzido.update({no: posicao for no in grupo})
+        ordem_reduzida = list(dict.fromkeys(no_reduzido[no] for no in ordem_inicial))
+
+    solucao = _resolver_rota_sem_repeticao(tempos_reduzidos, distancias_reduzidas, configuracao, ordem_reduzida)
+    if not solucao:
+        return solucao
+    ordem = [0] + [no for parada in solucao["detalhes_paradas"][1:-1] for no in grupos[parada["indice_parada"] - 1]] + [num_locais - 1]
+    solucao_expandida = avaliar_ordem(matriz_tempo, matriz_distancia, ordem)
+    solucao_expandida["configuracao"] = solucao["configuracao"]
+    solucao_expandida["curva_melhoria"] = solucao.get("curva_melhoria")
+    return solucao_expandida
+
+def _resolver_rota_sem_repeticao(matriz_tempo, matriz_distancia, configuracao=None, ordem_inicial=None):
+    max_paradas = int(os.getenv("HELD_KARP_MAX_PARADAS", "10"))
+    if len(matriz_tempo) - 2 <= max_paradas:
+        return otimizador_held_karp(matriz_tempo, matriz_distancia)
+    return otimizador_de_rota_quadro(matriz_tempo, matriz_distancia, configuracao, ordem_inicial=ordem_inicial)
+
+def custo_da_ordem(matriz, ordem):
+    """Soma dos custos dos arcos percorridos pela ordem de visita."""
+    return sum(int(matriz[a][b]) for a, b in zip(ordem, ordem[1:]))
+
+def inserir_no_mais_barato(matriz_tempo, ordem, no):
+    """
+    Inserção mais barata: coloca `no` entre as duas paradas consecutivas de `ordem` onde o
+    acréscimo de tempo é menor. A origem e o destino continuam nas pontas.
+    """
+    melhor_posicao, melhor_acrescimo = 1, None
+    for posicao in range(1, len(ordem)):
+        anterior, seguinte = ordem[posicao - 1], ordem[posicao]
+        acrescimo = matriz_tempo[anterior][no] + matriz_tempo[no][seguinte] - matriz_tempo[anterior][seguinte]
+        if melhor_acrescimo is None or acrescimo < melhor_acrescimo:
+            melhor_posicao, melhor_acrescimo = posicao, acrescimo
+    return ordem[:melhor_posicao] + [no] + ordem[melhor_posicao:]
+
+def melhorar_2opt(matriz_tempo, ordem):
+    """
+    Busca local 2-opt sobre um caminho aberto com as pontas fixas: inverte trechos internos
+    enquanto isso reduzir o tempo total. Como a matriz é assimétrica, o custo de cada
+    candidato é recalculado por inteiro.
+    """
+    ordem = list(ordem)
+    melhor_custo = custo_da_ordem(matriz_tempo, ordem)
+    melhorou = True
+    while melhorou:
+        melhorou = False
+        for i in range(1, len(ordem) - 2):
+            for j in range(i + 1, len(ordem) - 1):
+                candidata = ordem[:i] + ordem[i:j + 1][::-1] + ordem[j + 1:]
+                custo = custo_da_ordem(matriz_tempo, candidata)
+                if custo < melhor_custo:
+                    ordem, melhor_custo, melhorou = candidata, custo, True
+    return ordem
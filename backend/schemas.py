@@ -1,10 +1,15 @@
+import json
 import time
 import unicodedata
 from pydantic import BaseModel
+from pydantic import Field
 from pydantic import model_validator
 from pydantic import field_validator
 from datetime import datetime
+from typing import Any
+from typing import Dict
 from typing import List
+from typing import Literal
 from typing import Optional
 from datetime import time
 from models import Funcao
@@ -56,6 +61,7 @@ class VeiculoBase(BaseModel):
     placa: str
     modelo: str
     cor: str
+    capacidade: Optional[int] = Field(default=None, gt=0)
 
 class VeiculoCreate(VeiculoBase):
     motorista_id: int
@@ -153,6 +159,26 @@ class Passageiro(PassageiroBase):
     class Config:
         from_attributes = True
 
+# --- Schemas para Configuração do Otimizador ---
+
+class ConfiguracaoSolver(BaseModel):
+    """Parâmetros de busca do OR-Tools. Campos omitidos usam o padrão do mapa ou do sistema."""
+    estrategia_inicial: Optional[Literal[
+        "AUTOMATIC", "PATH_CHEAPEST_ARC", "PATH_MOST_CONSTRAINED_ARC", "SAVINGS", "CHRISTOFIDES",
+        "PARALLEL_CHEAPEST_INSERTION", "LOCAL_CHEAPEST_INSERTION", "GLOBAL_CHEAPEST_ARC",
+        "LOCAL_CHEAPEST_ARC", "FIRST_UNBOUND_MIN_VALUE",
+    ]] = None
+    metaheuristica: Optional[Literal[
+        "AUTOMATIC", "GREEDY_DESCENT", "GUIDED_LOCAL_SEARCH", "SIMULATED_ANNEALING",
+        "TABU_SEARCH", "GENERIC_TABU_SEARCH",
+    ]] = None
+    limite_tempo_s: Optional[float] = Field(default=None, gt=0)
+    limite_solucoes: Optional[int] = Field(default=None, gt=0)
+
+def _carregar_json(v):
+    """Colunas JSON são guardadas como texto no banco."""
+    return json.loads(v) if isinstance(v, str) else v
+
 # --- Schemas para Parada ---
 
 class ParadaBase(BaseModel):
@@ -190,6 +216,11 @@ class Rota(RotaBase):
     veiculo: Optional[Veiculo] = None
     paradas: List["Parada"]
     quadro: "Quadro"
+    configuracao_solver: Optional[Dict[str, Any]] = None
+    curva_melhoria: Optional[List[Dict[str, float]]] = None
+
+    _carregar_json = field_validator('configuracao_solver', 'curva_melhoria', mode='before')(_carregar_json)
+
     class Config:
         from_attributes = True
 
@@ -240,17 +271,94 @@ class MapaTransporteBase(BaseModel):
     regras: Optional[str] = None
 
 class MapaTransporteCreate(MapaTransporteBase):
-    pass
+    configuracao_solver: Optional[ConfiguracaoSolver] = None
 
 class MapaTransporte(MapaTransporteBase):
     id: int
     quadros: List['Quadro'] = []
+    configuracao_solver: Optional[ConfiguracaoSolver] = None
+
+    _carregar_json = field_validator('configuracao_solver', mode='before')(_carregar_json)
+
     class Config:
         from_attributes = True
 
+# --- Schemas de resumo (listagens leves, com paginação por cursor) ---
+
+class MapaTransporteResumo(BaseModel):
+    id: int
+    nome: str
+    descricao: Optional[str] = None
+    data_inicio: datetime
+    total_quadros: int
+    total_passageiros: int
+    quadros_com_rota: int
+
+class QuadroResumo(BaseModel):
+    id: int
+    nome: str
+    horario_saida: Optional[time] = None
+    mapa_transporte_id: int
+    placa_veiculo: Optional[str] = None
+    total_passageiros: int
+    tem_rota: bool
+
+class PaginaMapasTransporte(BaseModel):
+    itens: List[MapaTransporteResumo] = []
+    # Id a passar como `cursor` para buscar a página seguinte; None na última página
+    proximo_cursor: Optional[int] = None
+
+class PaginaQuadros(BaseModel):
+    itens: List[QuadroResumo] = []
+    proximo_cursor: Optional[int] = None
+
 class OrdemParadasRequest(BaseModel):
     passageiros_ids: List[int]
 
+class ParadaAvaliada(BaseModel):
+    passageiro_id: int
+    ordem: int
+    horario_saida: Optional[time] = None
+
+class AvaliacaoOrdem(BaseModel):
+    duracao_total_estimada: int
+    distancia_total_estimada_km: float
+    horario_chegada_estimado: Optional[datetime] = None
+    paradas: List[ParadaAvaliada] = []
+
+class DistribuicaoMapaRequest(BaseModel):
+    """Passageiros a distribuir; se omitido, todos os não autônomos ainda fora dos quadros do mapa."""
+    passageiros_ids: Optional[List[int]] = None
+    configuracao_solver: Optional[ConfiguracaoSolver] = None
+    # "vrp": um único VRP; "clusters": agrupa por veículo e resolve cada grupo. Omitido: automático
+    modo: Optional[Literal["vrp", "clusters"]] = None
+
+class DistribuicaoMapa(BaseModel):
+    modo: str
+    rotas_ids: List[int] = []
+    passageiros_nao_alocados: List[int] = []
+    tempo_total_segundos: int
+    distancia_total_km: float
+
+# --- Schemas para Jobs de Geração de Rota ---
+
+class JobQuadro(BaseModel):
+    quadro_id: int
+    etapa: Optional[str] = None
+    rota_id: Optional[int] = None
+
+class Job(BaseModel):
+    id: str
+    mapa_id: int
+    status: str
+    criado_em: datetime
+    iniciado_em: Optional[datetime] = None
+    finalizado_em: Optional[datetime] = None
+    quadros: List[JobQuadro] = []
+    rotas_ids: List[int] = []
+    erro: Optional[str] = None
+    configuracao_solver: Optional[ConfiguracaoSolver] = None
+
 # Resolvendo referências futuras
 MapaTransporte.model_rebuild()
 Quadro.model_rebuild()
@@ -7,9 +7,10 @@ import { Passageiro } from '../types/schemas';
 
 interface SortableItemProps {
   passageiro: Passageiro;
+  horarioSaida?: string | null;
 }
 
-export const SortableItem: React.FC<SortableItemProps> = ({ passageiro }) => {
+export const SortableItem: React.FC<SortableItemProps> = ({ passageiro, horarioSaida }) => {
   const {
     attributes,
     listeners,
@@ -42,7 +43,10 @@ export const SortableItem: React.FC<SortableItemProps> = ({ passageiro }) => {
         </ListItemIcon>
         <ListItemText
           primary={passageiro.nome}
-          secondary={passageiro.endereco?.rua || 'Endereço não definido'}
+          secondary={
+            (passageiro.endereco?.rua || 'Endereço não definido') +
+            (horarioSaida ? ` — saída ${horarioSaida.slice(0, 5)}` : '')
+          }
         />
       </ListItem>
     </Paper>
@@ -18,7 +18,7 @@ import {
 import { Container, Typography, Box, Button, CircularProgress, Alert, IconButton } from '@mui/material';
 import { ArrowBack as ArrowBackIcon, Save as SaveIcon } from '@mui/icons-material';
 
-import { Quadro, Passageiro } from '../types/schemas';
+import { Quadro, Passageiro, AvaliacaoOrdem } from '../types/schemas';
 import { quadroService } from '../services/api';
 import { SortableItem } from '../components/SortableItems';
 
@@ -31,6 +31,7 @@ const OrdenarRotaPage: React.FC = () => {
   const [loading, setLoading] = useState(true);
   const [saving, setSaving] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [avaliacao, setAvaliacao] = useState<AvaliacaoOrdem | null>(null);
 
   // Configura os sensores para o dnd-kit (rato, toque e teclado)
   const sensors = useSensors(
@@ -61,6 +62,19 @@ const OrdenarRotaPage: React.FC = () => {
     carregarDados();
   }, [quadro_id]);
 
+  // Recalcula os horários sempre que a ordem muda (sem gravar)
+  useEffect(() => {
+    if (!passageiros.length) return;
+    let cancelado = false;
+    quadroService.avaliarOrdemParadas(Number(quadro_id), passageiros.map(p => p.id))
+      .then(resultado => { if (!cancelado) setAvaliacao(resultado); })
+      .catch(() => { if (!cancelado) setAvaliacao(null); });
+    return () => { cancelado = true; };
+  }, [passageiros, quadro_id]);
+
+  const horarioDe = (passageiroId: number) =>
+    avaliacao?.paradas.find(parada => parada.passageiro_id === passageiroId)?.horario_saida ?? null;
+
   // Função chamada quando o utilizador termina de arrastar
   const handleDragEnd = (event: DragEndEvent) => {
     const { active, over } = event;
@@ -115,10 +129,18 @@ const OrdenarRotaPage: React.FC = () => {
           items={passageiros.map(p => p.id)} 
           strategy={verticalListSortingStrategy}
         >
-          {passageiros.map(p => <SortableItem key={p.id} passageiro={p} />)}
+          {passageiros.map(p => <SortableItem key={p.id} passageiro={p} horarioSaida={horarioDe(p.id)} />)}
         </SortableContext>
       </DndContext>
 
+      {avaliacao && (
+        <Typography variant="body2" color="text.secondary" sx={{ mt: 2 }}>
+          Duração estimada: {Math.round(avaliacao.duracao_total_estimada / 60)} min
+          {' · '}{avaliacao.distancia_total_estimada_km.toFixed(1)} km
+          {avaliacao.horario_chegada_estimado && ` · chegada às ${avaliacao.horario_chegada_estimado.slice(11, 16)}`}
+        </Typography>
+      )}
+
       <Button 
         variant="contained" 
         size="large" 
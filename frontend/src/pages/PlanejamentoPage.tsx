@@ -1,42 +1,60 @@
 import { useEffect, useState } from 'react';
-import { Container, Typography, List, ListItem, ListItemText, CircularProgress, Alert, Box, IconButton, Snackbar } from '@mui/material';
+import { Container, Typography, List, ListItem, ListItemText, CircularProgress, Alert, Box, IconButton, Snackbar, Chip, Stack, Button } from '@mui/material';
 import { Link } from 'react-router-dom';
 import ArrowForwardIosIcon from '@mui/icons-material/ArrowForwardIos';
 
-import { MapaTransporte } from '../types/schemas';
+import { MapaTransporte, MapaTransporteResumo } from '../types/schemas';
 import { mapaTransporteService } from '../services/api';
 import MapaTransporteForm from '../components/MapaTransporteFormPage';
 import FloatingButtom from '../components/FloatingButtom';
 
 const PlanejamentoPage = () => {
-  const [mapas, setMapas] = useState<MapaTransporte[]>([]);
+  const [mapas, setMapas] = useState<MapaTransporteResumo[]>([]);
+  const [proximoCursor, setProximoCursor] = useState<number | null>(null);
   const [loading, setLoading] = useState(true);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [isFormOpen, setFormOpen] = useState(false);
   const [snackbarMessage, setSnackbarMessage] = useState<string | null>(null);
 
-  const fetchMapas = async () => {
+  // Só o resumo (nomes e contagens), uma página por vez
+  const fetchMapas = async (cursor: number | null = null) => {
     try {
-      const response = await mapaTransporteService.listar();
-      setMapas(response);
+      const pagina = await mapaTransporteService.listarResumo(cursor);
+      setMapas(prev => (cursor === null ? pagina.itens : [...prev, ...pagina.itens]));
+      setProximoCursor(pagina.proximo_cursor);
     } catch (err) {
       setError('Falha ao carregar os Mapas de Transporte.');
     } finally {
       setLoading(false);
+      setCarregandoMais(false);
     }
   };
+
+  const carregarMais = () => {
+    setCarregandoMais(true);
+    fetchMapas(proximoCursor);
+  };
   useEffect(() => {
     fetchMapas();
   }, []);
 
   const handleSuccess = (novoMapa: MapaTransporte) => {
-    setMapas(prev => [novoMapa, ...prev]);
+    const resumo: MapaTransporteResumo = {
+      id: novoMapa.id,
+      nome: novoMapa.nome,
+      descricao: novoMapa.descricao,
+      data_inicio: novoMapa.data_inicio,
+      total_quadros: 0,
+      total_passageiros: 0,
+      quadros_com_rota: 0,
+    };
+    setMapas(prev => [resumo, ...prev]);
     setSnackbarMessage('Mapa de Transporte criado com sucesso!');
   };
 
   if (loading) return <Box display="flex" justifyContent="center" mt={5}><CircularProgress /></Box>;
   if (error) return <Container sx={{ py: 3 }}><Alert severity="error">{error}</Alert></Container>;
-  console.log("Dados de mapas: ", mapas)
   return (
     <Container maxWidth="md" sx={{ py: 3 }}>
       <Box sx={{ mb: 3 }}>
@@ -85,10 +103,26 @@ const PlanejamentoPage = () => {
                   minute: '2-digit'
                 })}`}
               />
+              <Stack direction="row" spacing={1} sx={{ mr: 4 }}>
+                <Chip size="small" label={`${mapa.total_quadros} quadro(s)`} />
+                <Chip size="small" label={`${mapa.total_passageiros} passageiro(s)`} />
+                <Chip
+                  size="small"
+                  color={mapa.total_quadros > 0 && mapa.quadros_com_rota === mapa.total_quadros ? 'success' : 'default'}
+                  label={`${mapa.quadros_com_rota}/${mapa.total_quadros} com rota`}
+                />
+              </Stack>
             </ListItem>
           ))
         }
       </List>
+      {proximoCursor !== null && (
+        <Box display="flex" justifyContent="center" mt={2}>
+          <Button onClick={carregarMais} disabled={carregandoMais}>
+            {carregandoMais ? 'Carregando...' : 'Carregar mais'}
+          </Button>
+        </Box>
+      )}
       <FloatingButtom setOpenForm={setFormOpen} />
 
       <MapaTransporteForm
@@ -14,6 +14,12 @@ import type {
   PassageiroCreate,
   PassageiroUpdate,
   OrdemParadasRequest,
+  AvaliacaoOrdem,
+  RotaJob,
+  DistribuicaoMapa,
+  MapaTransporteResumo,
+  QuadroResumo,
+  Pagina,
 } from '../types/schemas';
 import type {  } from '../types/schemas';
 
@@ -82,6 +88,10 @@ export const quadroService = {
     return response.data;
   },
 
+  // Resumo paginado (mais recentes primeiro), opcionalmente de um só mapa
+  listarResumo: (mapaId?: number, cursor?: number | null) =>
+    api.get<Pagina<QuadroResumo>>('/api/quadros/resumo/', { params: { mapa_id: mapaId, cursor: cursor ?? undefined } }).then(res => res.data),
+
   // Criar novo quadro
   criar: async (quadro: QuadroCreate): Promise<Quadro> => {
     const response = await api.post('/api/quadros/', quadro);
@@ -106,6 +116,19 @@ export const quadroService = {
     return response.data;
   },
 
+  // Encaixa/retira um passageiro na rota atual sem refazer a otimização
+  adicionarPassageiro: (id: number, passageiroId: number, polir = false) =>
+    api.post<Rota>(`/api/quadros/${id}/passageiros/${passageiroId}`, null, { params: { polir } }).then(res => res.data),
+
+  removerPassageiro: (id: number, passageiroId: number, polir = false) =>
+    api.delete<Rota>(`/api/quadros/${id}/passageiros/${passageiroId}`, { params: { polir } }).then(res => res.data),
+
+  // Horários de uma ordem de paradas, calculados sem gravar (matrizes guardadas do quadro)
+  avaliarOrdemParadas: (id: number, idsOrdenados: number[]) => {
+    const payload: OrdemParadasRequest = { passageiros_ids: idsOrdenados };
+    return api.post<AvaliacaoOrdem>(`/api/quadros/${id}/avaliar_ordem_paradas/`, payload).then(res => res.data);
+  },
+
   salvarOrdemParadas: (id: number, idsOrdenados: number[]) => {
     // Monta o payload que o backend espera
     const payload: OrdemParadasRequest = {
@@ -129,6 +152,10 @@ export const mapaTransporteService = {
     return response.data;
   },
 
+  // Resumo paginado (mais recentes primeiro): nomes e contagens, sem os quadros completos
+  listarResumo: (cursor?: number | null) =>
+    api.get<Pagina<MapaTransporteResumo>>('/api/mapas_transporte/resumo/', { params: { cursor: cursor ?? undefined } }).then(res => res.data),
+
   // Criar novo quadro
   criar: async (mapa_transporte: MapaTransporteCreate): Promise<MapaTransporte> => {
     const response = await api.post('/api/mapas_transporte/', mapa_transporte);
@@ -141,10 +168,24 @@ export const mapaTransporteService = {
     return response.data;
   },
 
-  gerarRotas: async (id: number): Promise<Rota[]> => {
-    const response = await api.post(`/api/mapas_transporte/${id}/gerar_rota/`);
-    return response.data;
-  },
+  // Enfileira a geração das rotas e acompanha o job até terminar
+  gerarRotas: async (id: number, intervaloMs = 1000): Promise<RotaJob> => {
+    const response = await api.post<RotaJob>(`/api/mapas_transporte/${id}/gerar_rota/`);
+    let job = response.data;
+    while (job.status === 'pendente' || job.status === 'executando') {
+      await new Promise(resolve => setTimeout(resolve, intervaloMs));
+      job = (await api.get<RotaJob>(`/api/jobs/${job.id}`)).data;
+    }
+    if (job.status === 'falhou') {
+      throw new Error(job.erro ?? 'Falha ao gerar as rotas.');
+    }
+    return job;
+  },
+
+  // Distribui os passageiros sem quadro entre os quadros com veículo e gera as rotas
+  distribuirPassageiros: (id: number, passageirosIds?: number[]) =>
+    api.post<DistribuicaoMapa>(`/api/mapas_transporte/${id}/distribuir_passageiros/`, { passageiros_ids: passageirosIds ?? null })
+      .then(res => res.data),
 
   gerarPdf: (id: number) => {
     return api.get(`/api/mapas_transporte/${id}/pdf`, {
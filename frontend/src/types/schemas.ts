@@ -22,6 +22,32 @@ export interface MapaTransporte extends MapaTransporteCreate {
   quadros: Quadro[];
 }
 
+// Resumos para listagens (paginação por cursor: passe proximo_cursor para a página seguinte)
+export interface MapaTransporteResumo {
+  id: number;
+  nome: string;
+  descricao?: string | null;
+  data_inicio: string;
+  total_quadros: number;
+  total_passageiros: number;
+  quadros_com_rota: number;
+}
+
+export interface QuadroResumo {
+  id: number;
+  nome: string;
+  horario_saida: string | null;
+  mapa_transporte_id: number;
+  placa_veiculo: string | null;
+  total_passageiros: number;
+  tem_rota: boolean;
+}
+
+export interface Pagina<T> {
+  itens: T[];
+  proximo_cursor: number | null;
+}
+
 // Quadro
 export interface QuadroCreate {
   nome: string;
@@ -72,6 +98,7 @@ export interface VeiculoCreate {
   placa: string;
   modelo: string;
   cor: string;
+  capacidade?: number | null; // lugares para passageiros
   motorista_id: number; // ID de um Motorista existente
 }
 
@@ -162,4 +189,41 @@ export interface Quadro extends QuadroCreate {
 
 export interface OrdemParadasRequest {
   passageiros_ids: number[];
-}
\ No newline at end of file
+}
+
+export interface AvaliacaoOrdem {
+  duracao_total_estimada: number; // em segundos
+  distancia_total_estimada_km: number;
+  horario_chegada_estimado: string | null; // ISO datetime string
+  paradas: Array<{
+    passageiro_id: number;
+    ordem: number;
+    horario_saida: string | null;
+  }>;
+}
+
+export interface JobQuadro {
+  quadro_id: number;
+  etapa: 'geocode' | 'matrix' | 'solve' | 'persist' | 'done' | null;
+  rota_id: number | null;
+}
+
+export interface RotaJob {
+  id: string;
+  mapa_id: number;
+  status: 'pendente' | 'executando' | 'concluido' | 'falhou';
+  criado_em: string; // ISO datetime string
+  iniciado_em: string | null;
+  finalizado_em: string | null;
+  quadros: JobQuadro[];
+  rotas_ids: number[];
+  erro: string | null;
+}
+
+export interface DistribuicaoMapa {
+  modo: 'vrp' | 'clusters';
+  rotas_ids: number[];
+  passageiros_nao_alocados: number[];
+  tempo_total_segundos: number;
+  distancia_total_km: number;
+}